@@ -10,7 +10,9 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.2/ref/settings/
 """
 
+import copy
 import os
+import tempfile
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -97,6 +99,25 @@ if os.environ.get("POSTGRES_DB"):
             "PORT": os.environ.get("POSTGRES_PORT", "5432"),
         }
     }
+    # Connection reuse (measure with `manage.py benchmark_db`). By default each
+    # worker process keeps a psycopg connection pool, which also suits ASGI,
+    # where requests run in short-lived threads. Keep workers x max size
+    # below the server's max_connections. POSTGRES_POOL=0 falls back to
+    # persistent per-thread connections with health checks.
+    if os.environ.get("POSTGRES_POOL", "1") == "1":
+        DATABASES["default"]["OPTIONS"] = {
+            "pool": {
+                "min_size": int(os.environ.get("POSTGRES_POOL_MIN_SIZE", "2")),
+                "max_size": int(os.environ.get("POSTGRES_POOL_MAX_SIZE", "10")),
+                # Seconds to wait for a free connection before failing
+                "timeout": float(os.environ.get("POSTGRES_POOL_TIMEOUT", "10")),
+                # Idle connections above min_size are closed after this long
+                "max_idle": float(os.environ.get("POSTGRES_POOL_MAX_IDLE", "300")),
+            },
+        }
+    else:
+        DATABASES["default"]["CONN_MAX_AGE"] = int(os.environ.get("POSTGRES_CONN_MAX_AGE", "60"))
+        DATABASES["default"]["CONN_HEALTH_CHECKS"] = True
 else:
     DATABASES = {
         "default": {
@@ -104,6 +125,51 @@ else:
             "NAME": BASE_DIR / "db.sqlite3",
         }
     }
+    # Pragmas run on every new connection (measure with `manage.py
+    # benchmark_sqlite`). WAL lets reads proceed while a download is logged,
+    # and NORMAL sync is safe with WAL. Write transactions start with BEGIN
+    # IMMEDIATE, so they wait for the lock (busy_timeout, in ms) up front
+    # instead of failing with "database is locked" halfway through.
+    # SQLITE_TUNING=0 keeps SQLite's defaults.
+    if os.environ.get("SQLITE_TUNING", "1") == "1":
+        SQLITE_PRAGMAS = {
+            "journal_mode": os.environ.get("SQLITE_JOURNAL_MODE", "WAL"),
+            "synchronous": os.environ.get("SQLITE_SYNCHRONOUS", "NORMAL"),
+            "mmap_size": int(os.environ.get("SQLITE_MMAP_SIZE", 256 * 1024 * 1024)),
+            # Negative values are in KiB: 64 MB of page cache per connection
+            "cache_size": int(os.environ.get("SQLITE_CACHE_SIZE", -64 * 1024)),
+            "busy_timeout": int(os.environ.get("SQLITE_BUSY_TIMEOUT", "5000")),
+            "temp_store": "MEMORY",
+        }
+        DATABASES["default"]["OPTIONS"] = {
+            "init_command": "; ".join(f"PRAGMA {name}={value}" for name, value in SQLITE_PRAGMAS.items()),
+            "transaction_mode": "IMMEDIATE",
+        }
+
+# Read replicas (music.routers). DATABASE_REPLICAS is a comma-separated list
+# of Postgres hosts ("host" or "host:port"), or of database files with
+# SQLite. Each becomes a "replica_<n>" alias that serves reads of the
+# DATABASE_REPLICA_APPS models during requests; writes, and reads outside
+# requests, go to "default". After a write, the user's reads stay on
+# "default" for DATABASE_REPLICA_PIN_SECONDS so they see their own changes,
+# except after writes to DATABASE_REPLICA_UNPINNED_MODELS (log tables).
+DATABASE_REPLICAS = [value.strip() for value in os.environ.get("DATABASE_REPLICAS", "").split(",") if value.strip()]
+DATABASE_REPLICA_APPS = os.environ.get("DATABASE_REPLICA_APPS", "music").split(",")
+DATABASE_REPLICA_UNPINNED_MODELS = os.environ.get("DATABASE_REPLICA_UNPINNED_MODELS", "music.DownloadLog").split(",")
+DATABASE_REPLICA_PIN_SECONDS = int(os.environ.get("DATABASE_REPLICA_PIN_SECONDS", "10"))
+for index, replica in enumerate(DATABASE_REPLICAS, start=1):
+    DATABASES[f"replica_{index}"] = copy.deepcopy(DATABASES["default"])
+    if DATABASES["default"]["ENGINE"] == "django.db.backends.sqlite3":
+        DATABASES[f"replica_{index}"]["NAME"] = replica
+    else:
+        host, _, port = replica.partition(":")
+        DATABASES[f"replica_{index}"]["HOST"] = host
+        DATABASES[f"replica_{index}"]["PORT"] = port or DATABASES["default"]["PORT"]
+    # Tests run against the primary's test database
+    DATABASES[f"replica_{index}"]["TEST"] = {"MIRROR": "default"}
+if DATABASE_REPLICAS:
+    DATABASE_ROUTERS = ["music.routers.ReplicaRouter"]
+    MIDDLEWARE.append("music.routers.ReplicaStickinessMiddleware")
 
 # Password validation
 AUTH_PASSWORD_VALIDATORS = [
@@ -119,6 +185,10 @@ TIME_ZONE = "UTC"
 USE_I18N = True
 USE_TZ = True
 
+# Media URLs change whenever the file does (music.storage.media_url), so
+# media can be cached for a year and never revalidated
+MEDIA_CACHE_CONTROL = os.environ.get('MEDIA_CACHE_CONTROL', 'public, max-age=31536000, immutable')
+
 # AWS S3 Configuration
 USE_S3 = os.environ.get('USE_S3', 'False') == 'True'
 
@@ -128,11 +198,13 @@ if USE_S3:
     AWS_SECRET_ACCESS_KEY = os.environ.get('AWS_SECRET_ACCESS_KEY')
     AWS_STORAGE_BUCKET_NAME = os.environ.get('AWS_STORAGE_BUCKET_NAME')
     AWS_S3_REGION_NAME = os.environ.get('AWS_S3_REGION_NAME', 'ap-northeast-2')
+    # Optional S3-compatible endpoint (MinIO, LocalStack) instead of AWS
+    AWS_S3_ENDPOINT_URL = os.environ.get('AWS_S3_ENDPOINT_URL') or None
     AWS_S3_CUSTOM_DOMAIN = f'{AWS_STORAGE_BUCKET_NAME}.s3.{AWS_S3_REGION_NAME}.amazonaws.com'
     
     # S3 File Storage Settings
     AWS_S3_OBJECT_PARAMETERS = {
-        'CacheControl': 'max-age=86400',
+        'CacheControl': MEDIA_CACHE_CONTROL,
     }
     AWS_QUERYSTRING_AUTH = False
     AWS_S3_FILE_OVERWRITE = False
@@ -147,6 +219,8 @@ if USE_S3:
     
     # Media files (uploaded content)
     MEDIA_URL = f'https://{AWS_S3_CUSTOM_DOMAIN}/media/'
+    if AWS_S3_ENDPOINT_URL:
+        MEDIA_URL = f'{AWS_S3_ENDPOINT_URL.rstrip("/")}/{AWS_STORAGE_BUCKET_NAME}/media/'
 
     # Django 5.0+ Storage Configuration
     STORAGES = {
@@ -157,12 +231,13 @@ if USE_S3:
                 "secret_key": AWS_SECRET_ACCESS_KEY,
                 "bucket_name": AWS_STORAGE_BUCKET_NAME,
                 "region_name": AWS_S3_REGION_NAME,
+                "endpoint_url": AWS_S3_ENDPOINT_URL,
                 "default_acl": None,
                 "querystring_auth": False,
                 "file_overwrite": False,
                 "location": "media",
                 "object_parameters": {
-                    'CacheControl': 'max-age=86400',
+                    'CacheControl': MEDIA_CACHE_CONTROL,
                 },
             },
         },
@@ -173,6 +248,7 @@ if USE_S3:
                 "secret_key": AWS_SECRET_ACCESS_KEY,
                 "bucket_name": AWS_STORAGE_BUCKET_NAME,
                 "region_name": AWS_S3_REGION_NAME,
+                "endpoint_url": AWS_S3_ENDPOINT_URL,
                 "default_acl": None,
                 "querystring_auth": False,
                 "location": "static",
@@ -208,7 +284,7 @@ if not DEBUG:
 # Django REST Framework
 REST_FRAMEWORK = {
     "DEFAULT_AUTHENTICATION_CLASSES": [
-        "rest_framework.authentication.TokenAuthentication",
+        "users.authentication.CachedTokenAuthentication",
         "rest_framework.authentication.SessionAuthentication",
     ],
     "DEFAULT_PERMISSION_CLASSES": ["rest_framework.permissions.AllowAny"],
@@ -216,5 +292,92 @@ REST_FRAMEWORK = {
 
 # File Upload Settings (100MB)
 DATA_UPLOAD_MAX_MEMORY_SIZE = 104857600
-FILE_UPLOAD_MAX_MEMORY_SIZE = 104857600
+# Uploaded files larger than this are spooled to disk; the handler hashes and
+# probes files while receiving them (see music.uploadhandlers)
+FILE_UPLOAD_MAX_MEMORY_SIZE = int(os.environ.get('FILE_UPLOAD_MAX_MEMORY_SIZE', 2621440))
+FILE_UPLOAD_HANDLERS = [
+    "music.uploadhandlers.HashingUploadHandler",
+]
+
+
+# Music processing
+# Length of generated preview clips, and the transcoder used for non-WAV files
+MUSIC_PREVIEW_SECONDS = int(os.environ.get('MUSIC_PREVIEW_SECONDS', '30'))
+MUSIC_PREVIEW_TRANSCODER = os.environ.get(
+    'MUSIC_PREVIEW_TRANSCODER', 'music.previews.FFmpegTranscoder'
+)
+FFMPEG_BINARY = os.environ.get('FFMPEG_BINARY', 'ffmpeg')
+
+# Chunked uploads (music.uploads): chunk size (S3 needs >= 5 MB for all but
+# the last part), size limit, session lifetime and local temp directory
+MUSIC_UPLOAD_CHUNK_SIZE = int(os.environ.get('MUSIC_UPLOAD_CHUNK_SIZE', 8 * 1024 * 1024))
+MUSIC_UPLOAD_MAX_SIZE = int(os.environ.get('MUSIC_UPLOAD_MAX_SIZE', 2 * 1024 * 1024 * 1024))
+MUSIC_UPLOAD_SESSION_TTL = int(os.environ.get('MUSIC_UPLOAD_SESSION_TTL', 24 * 60 * 60))
+MUSIC_UPLOAD_TEMP_DIR = os.environ.get(
+    'MUSIC_UPLOAD_TEMP_DIR', os.path.join(tempfile.gettempdir(), 'bootcampmusic-uploads')
+)
+# Concurrent file writes per bulk album upload
+MUSIC_BULK_UPLOAD_WORKERS = int(os.environ.get('MUSIC_BULK_UPLOAD_WORKERS', '8'))
+# Lifetime of presigned part URLs for direct-to-S3 uploads. The bucket's CORS
+# rules must allow PUT from the frontend origin and expose the ETag header.
+MUSIC_DIRECT_UPLOAD_URL_EXPIRY = int(os.environ.get('MUSIC_DIRECT_UPLOAD_URL_EXPIRY', 60 * 60))
+
+# Image variants (music.images): widths in pixels and formats, preferred first
+MUSIC_IMAGE_VARIANT_WIDTHS = [
+    int(w) for w in os.environ.get('MUSIC_IMAGE_VARIANT_WIDTHS', '200,400,800').split(',')
+]
+MUSIC_IMAGE_VARIANT_FORMATS = os.environ.get('MUSIC_IMAGE_VARIANT_FORMATS', 'webp,jpeg').split(',')
+
+# Local disk cache for media read from S3 (music.mediacache); disabled when
+# no directory is set
+MUSIC_MEDIA_CACHE_DIR = os.environ.get('MUSIC_MEDIA_CACHE_DIR', '')
+MUSIC_MEDIA_CACHE_MAX_BYTES = int(os.environ.get('MUSIC_MEDIA_CACHE_MAX_BYTES', 10 * 1024 * 1024 * 1024))
+
+# Most tracks /api/music/tracks/batch/ returns per request
+MUSIC_TRACK_BATCH_MAX_IDS = int(os.environ.get('MUSIC_TRACK_BATCH_MAX_IDS', '100'))
+
+# Co-download neighbours stored per track (music.similarity)
+MUSIC_SIMILAR_TRACKS = int(os.environ.get('MUSIC_SIMILAR_TRACKS', '20'))
+
+# Acoustic fingerprints (music.fingerprints): seconds analysed from the start
+# of each track, and the decoder used for non-WAV files
+MUSIC_FINGERPRINT_SECONDS = int(os.environ.get('MUSIC_FINGERPRINT_SECONDS', '120'))
+MUSIC_FINGERPRINT_DECODER = os.environ.get(
+    'MUSIC_FINGERPRINT_DECODER', 'music.fingerprints.FFmpegDecoder'
+)
+
+# Most tracks a playlist can hold
+MUSIC_PLAYLIST_MAX_ITEMS = int(os.environ.get('MUSIC_PLAYLIST_MAX_ITEMS', '10000'))
 
+# How long facet counts on the track list (music.facets) are cached, in seconds
+MUSIC_FACET_CACHE_SECONDS = int(os.environ.get('MUSIC_FACET_CACHE_SECONDS', '60'))
+
+# API tokens (users.authentication): lifetime in seconds (0 = never expire),
+# and the size and entry lifetime of each process's token lookup cache
+AUTH_TOKEN_TTL = int(os.environ.get('AUTH_TOKEN_TTL', 14 * 24 * 60 * 60))
+AUTH_TOKEN_CACHE_SIZE = int(os.environ.get('AUTH_TOKEN_CACHE_SIZE', '10000'))
+AUTH_TOKEN_CACHE_SECONDS = int(os.environ.get('AUTH_TOKEN_CACHE_SECONDS', '60'))
+
+# Caches. Set CACHE_REDIS_URL (needs the redis package) to share throttling
+# state, facet counts and media cache counters between worker processes.
+if os.environ.get('CACHE_REDIS_URL'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.environ['CACHE_REDIS_URL'],
+        }
+    }
+
+# Rate limits (music.throttling): token buckets of "<requests>/<period>",
+# e.g. "20/10s" allows bursts of 20 refilled over 10 seconds; per user, or
+# per IP for anonymous clients
+MUSIC_THROTTLE_CACHE = os.environ.get('MUSIC_THROTTLE_CACHE', 'default')
+MUSIC_THROTTLE_RATES = {
+    'search': os.environ.get('MUSIC_THROTTLE_SEARCH_RATE', '20/10s'),
+    'list': os.environ.get('MUSIC_THROTTLE_LIST_RATE', '60/m'),
+}
+# Concurrent downloads per user and in total (0 = unlimited), and the
+# bandwidth ceiling per download in bytes/second (0 = none)
+MUSIC_MAX_STREAMS_PER_USER = int(os.environ.get('MUSIC_MAX_STREAMS_PER_USER', '3'))
+MUSIC_MAX_STREAMS = int(os.environ.get('MUSIC_MAX_STREAMS', '100'))
+MUSIC_STREAM_BYTES_PER_SECOND = int(os.environ.get('MUSIC_STREAM_BYTES_PER_SECOND', '0'))
@@ -2,23 +2,30 @@ from django.contrib import admin
 from django.urls import path, include
 from django.conf import settings
 from django.conf.urls.static import static
-from users.views import RegisterView, MeView
+from users.views import RegisterView, MeView, LoginView, TokenRefreshView, LogoutView
 from music.views import (
-    TrackListView, TrackDetailView, DownloadTrackView, 
+    TrackListView, TrackDetailView, TrackBatchView, SimilarTrackListView, DownloadTrackView, 
     ArtistListView, ArtistDetailView,
     AlbumListView, AlbumDetailView,
     UserDownloadListView, search_all, log_download,
     TrackUploadView, ArtistCreateView, AlbumCreateView,
-    TrackUpdateView, TrackDeleteView
+    TrackUpdateView, TrackDeleteView,
+    JobListView, JobDetailView,
+    ChunkedUploadCreateView, ChunkedUploadView, ChunkedUploadFinalizeView,
+    DirectUploadCreateView, DirectUploadView, DirectUploadCompleteView,
+    MediaCacheStatsView, AlbumDownloadView, AlbumUploadView,
+    GenreListView,
+    PlaylistListCreateView, PlaylistDetailView, PlaylistItemListView, PlaylistItemDetailView,
 )
-from rest_framework.authtoken.views import obtain_auth_token
 
 urlpatterns = [
     path('admin/', admin.site.urls),
     
     # Auth
     path('api/auth/register/', RegisterView.as_view(), name='register'),
-    path('api/auth/login/', obtain_auth_token, name='login'),
+    path('api/auth/login/', LoginView.as_view(), name='login'),
+    path('api/auth/logout/', LogoutView.as_view(), name='logout'),
+    path('api/auth/token/refresh/', TokenRefreshView.as_view(), name='token-refresh'),
     path('api/auth/me/', MeView.as_view(), name='me'),
 
     # Search
@@ -26,10 +33,15 @@ urlpatterns = [
 
     # Music - Tracks
     path('api/music/tracks/', TrackListView.as_view(), name='track-list'),
+    path('api/music/tracks/batch/', TrackBatchView.as_view(), name='track-batch'),
     path('api/music/tracks/<int:pk>/', TrackDetailView.as_view(), name='track-detail'),
+    path('api/music/tracks/<int:pk>/similar/', SimilarTrackListView.as_view(), name='track-similar'),
     path('api/music/tracks/<int:pk>/download/', DownloadTrackView.as_view(), name='track-download'),
     path('api/music/tracks/<int:pk>/log-download/', log_download, name='log-download'),
     
+    # Music - Genres
+    path('api/music/genres/', GenreListView.as_view(), name='genre-list'),
+
     # Music - Artists
     path('api/music/artists/', ArtistListView.as_view(), name='artist-list'),
     path('api/music/artists/<int:pk>/', ArtistDetailView.as_view(), name='artist-detail'),
@@ -37,15 +49,35 @@ urlpatterns = [
     # Music - Albums
     path('api/music/albums/', AlbumListView.as_view(), name='album-list'),
     path('api/music/albums/<int:pk>/', AlbumDetailView.as_view(), name='album-detail'),
+    path('api/music/albums/<int:pk>/download/', AlbumDownloadView.as_view(), name='album-download'),
     
     # User Downloads
     path('api/music/downloads/', UserDownloadListView.as_view(), name='user-downloads'),
+
+    # Music - Playlists
+    path('api/music/playlists/', PlaylistListCreateView.as_view(), name='playlist-list'),
+    path('api/music/playlists/<int:pk>/', PlaylistDetailView.as_view(), name='playlist-detail'),
+    path('api/music/playlists/<int:pk>/items/', PlaylistItemListView.as_view(), name='playlist-items'),
+    path('api/music/playlists/<int:pk>/items/<int:item_pk>/', PlaylistItemDetailView.as_view(),
+         name='playlist-item-detail'),
     
     # Admin - Upload
     path('api/admin/upload-track/', TrackUploadView.as_view(), name='admin-upload-track'),
+    path('api/admin/upload-album/', AlbumUploadView.as_view(), name='admin-upload-album'),
+    path('api/admin/uploads/', ChunkedUploadCreateView.as_view(), name='admin-upload-create'),
+    path('api/admin/uploads/<uuid:pk>/', ChunkedUploadView.as_view(), name='admin-upload-detail'),
+    path('api/admin/uploads/<uuid:pk>/finalize/', ChunkedUploadFinalizeView.as_view(), name='admin-upload-finalize'),
+    path('api/admin/direct-uploads/', DirectUploadCreateView.as_view(), name='admin-direct-upload-create'),
+    path('api/admin/direct-uploads/<uuid:pk>/', DirectUploadView.as_view(), name='admin-direct-upload-detail'),
+    path('api/admin/direct-uploads/<uuid:pk>/complete/', DirectUploadCompleteView.as_view(), name='admin-direct-upload-complete'),
     path('api/admin/create-artist/', ArtistCreateView.as_view(), name='admin-create-artist'),
     path('api/admin/create-album/', AlbumCreateView.as_view(), name='admin-create-album'),
     path('api/admin/update-track/<int:pk>/', TrackUpdateView.as_view(), name='admin-update-track'),
     path('api/admin/delete-track/<int:pk>/', TrackDeleteView.as_view(), name='admin-delete-track'),
 
+    # Admin - Background jobs
+    path('api/admin/jobs/', JobListView.as_view(), name='admin-job-list'),
+    path('api/admin/jobs/<int:pk>/', JobDetailView.as_view(), name='admin-job-detail'),
+    path('api/admin/media-cache/', MediaCacheStatsView.as_view(), name='admin-media-cache'),
+
 ] + static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
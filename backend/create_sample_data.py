@@ -10,6 +10,7 @@ os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'config.settings')
 django.setup()
 
 from music.models import Artist, Album, Track
+from music.normalize import name_key
 from django.contrib.auth import get_user_model
 
 User = get_user_model()
@@ -54,7 +55,9 @@ def create_sample_data():
     
     artists = []
     for data in artists_data:
-        artist, _ = Artist.objects.get_or_create(name=data['name'], defaults={'bio': data['bio']})
+        artist, _ = Artist.objects.get_or_create(
+            name_key=name_key(data['name']), defaults={'name': data['name'], 'bio': data['bio']}
+        )
         artists.append(artist)
 
     # 4. Create Albums
@@ -75,9 +78,10 @@ def create_sample_data():
             cover_image = f"albums/{img_name}"
             
         album, _ = Album.objects.get_or_create(
-            title=data['title'],
+            title_key=name_key(data['title']),
             artist=random.choice(artists),
             defaults={
+                'title': data['title'],
                 'release_date': data['release_date'],
                 'cover_image': cover_image
             }
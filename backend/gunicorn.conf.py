@@ -0,0 +1,27 @@
+"""Gunicorn settings for production: ASGI (uvicorn) workers.
+
+Run with ``gunicorn -c gunicorn.conf.py config.asgi:application``. Every
+setting can be overridden through the environment.
+"""
+import multiprocessing
+import os
+
+bind = os.environ.get('GUNICORN_BIND', '0.0.0.0:8000')
+
+# Event-loop workers: one per core is enough for I/O, plus one so a worker
+# busy with a slow request (uploads, image work) doesn't stall a core
+workers = int(os.environ.get('GUNICORN_WORKERS', multiprocessing.cpu_count() + 1))
+worker_class = os.environ.get('GUNICORN_WORKER_CLASS', 'uvicorn_worker.UvicornWorker')
+
+# Sync views run in each worker's thread pool; downloads stream on the event
+# loop, so these limits are about request handling, not transfer time
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', '120'))
+graceful_timeout = int(os.environ.get('GUNICORN_GRACEFUL_TIMEOUT', '30'))
+keepalive = int(os.environ.get('GUNICORN_KEEPALIVE', '5'))
+
+# Recycle workers now and then to cap slow memory growth
+max_requests = int(os.environ.get('GUNICORN_MAX_REQUESTS', '2000'))
+max_requests_jitter = int(os.environ.get('GUNICORN_MAX_REQUESTS_JITTER', '200'))
+
+accesslog = os.environ.get('GUNICORN_ACCESS_LOG', '-')
+errorlog = '-'
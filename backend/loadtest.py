@@ -0,0 +1,162 @@
+"""Load test for the API server: request rates and latency under slow downloads.
+
+Runs N clients hitting the track list and search endpoints while M "slow"
+clients download a track at a trickle, and reports throughput and latency
+percentiles. Run it against each server setup and compare, e.g.:
+
+    export MUSIC_THROTTLE_SEARCH_RATE= MUSIC_THROTTLE_LIST_RATE= MUSIC_MAX_STREAMS_PER_USER=0
+    python manage.py runserver 0.0.0.0:8000
+    gunicorn -c gunicorn.conf.py config.asgi:application
+
+    python loadtest.py --url http://localhost:8000 --token <token> --track 1 \\
+        --clients 20 --slow-clients 20 --duration 30
+
+All requests come from one address and the downloads from one user, so the
+server's rate limits and stream caps (music.throttling) must be switched off
+as above; otherwise most responses are 429s and the latencies measure the
+throttle, not the endpoints. Latencies only count 2xx responses, and the run
+exits with status 1 if any request was throttled or none succeeded.
+
+Only the standard library is used, so it can run from any machine.
+"""
+from collections import Counter
+import argparse
+import http.client
+import statistics
+import sys
+import threading
+import time
+from urllib.parse import urlsplit
+
+
+def _connect(url):
+    parts = urlsplit(url)
+    connection_class = http.client.HTTPSConnection if parts.scheme == 'https' else http.client.HTTPConnection
+    return connection_class(parts.hostname, parts.port, timeout=60)
+
+
+def _api_client(url, paths, deadline, results, lock):
+    connection = _connect(url)
+    latencies, statuses, errors, index = [], Counter(), 0, 0
+    while time.monotonic() < deadline:
+        path = paths[index % len(paths)]
+        index += 1
+        started = time.monotonic()
+        try:
+            connection.request('GET', path)
+            response = connection.getresponse()
+            response.read()
+            statuses[response.status] += 1
+            if 200 <= response.status < 300:
+                latencies.append(time.monotonic() - started)
+        except (OSError, http.client.HTTPException):
+            errors += 1
+            connection.close()
+            connection = _connect(url)
+    connection.close()
+    with lock:
+        results['latencies'].extend(latencies)
+        results['statuses'].update(statuses)
+        results['errors'] += errors
+
+
+def _slow_client(url, path, token, bytes_per_second, deadline, results, lock):
+    """Downloads a file slowly, holding its connection open the whole time"""
+    while time.monotonic() < deadline:
+        connection = _connect(url)
+        try:
+            connection.request('GET', path, headers={'Authorization': f'Token {token}'})
+            response = connection.getresponse()
+            chunk_size = max(1, bytes_per_second // 10)
+            received = 0
+            while time.monotonic() < deadline:
+                chunk = response.read(chunk_size)
+                if not chunk:
+                    break
+                received += len(chunk)
+                time.sleep(0.1)
+            with lock:
+                results['slow_bytes'] += received
+                results['slow_statuses'][response.status] += 1
+        except (OSError, http.client.HTTPException):
+            with lock:
+                results['slow_errors'] += 1
+        finally:
+            connection.close()
+
+
+def _percentile(values, fraction):
+    if not values:
+        return float('nan')
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--url', default='http://localhost:8000')
+    parser.add_argument('--clients', type=int, default=20, help='Clients requesting list/search endpoints')
+    parser.add_argument('--slow-clients', type=int, default=0, help='Clients downloading at a trickle')
+    parser.add_argument('--slow-rate', type=int, default=16 * 1024, help='Bytes/second per slow client')
+    parser.add_argument('--track', type=int, help='Track id for slow downloads')
+    parser.add_argument('--token', help='API token for slow downloads')
+    parser.add_argument('--duration', type=float, default=30, help='Seconds to run')
+    parser.add_argument('--paths', nargs='+', default=['/api/music/tracks/', '/api/search/?q=a'])
+    args = parser.parse_args()
+    if args.slow_clients and not (args.track and args.token):
+        parser.error('--slow-clients needs --track and --token')
+
+    results = {
+        'latencies': [], 'statuses': Counter(), 'errors': 0,
+        'slow_bytes': 0, 'slow_errors': 0, 'slow_statuses': Counter(),
+    }
+    lock = threading.Lock()
+    deadline = time.monotonic() + args.duration
+    threads = [
+        threading.Thread(target=_slow_client, args=(
+            args.url, f'/api/music/tracks/{args.track}/download/', args.token,
+            args.slow_rate, deadline, results, lock,
+        ))
+        for _ in range(args.slow_clients)
+    ]
+    # Let the downloads occupy the server before measuring
+    for thread in threads:
+        thread.start()
+    time.sleep(min(1, args.duration / 10))
+    started = time.monotonic()
+    api_threads = [
+        threading.Thread(target=_api_client, args=(args.url, args.paths, deadline, results, lock))
+        for _ in range(args.clients)
+    ]
+    for thread in api_threads:
+        thread.start()
+    for thread in api_threads + threads:
+        thread.join()
+    elapsed = time.monotonic() - started
+
+    latencies = results['latencies']
+    statuses = results['statuses']
+    other = sum(count for status, count in statuses.items() if not 200 <= status < 300 and status != 429)
+    print(f"API requests: {len(latencies)} ok, {statuses[429]} throttled, {other} other statuses, "
+          f"{results['errors']} failed in {elapsed:.1f}s ({len(latencies) / elapsed:.1f} ok req/s)")
+    if latencies:
+        print(f"Latency: mean {statistics.mean(latencies) * 1000:.0f} ms, "
+              f"p50 {_percentile(latencies, 0.5) * 1000:.0f} ms, "
+              f"p95 {_percentile(latencies, 0.95) * 1000:.0f} ms, "
+              f"p99 {_percentile(latencies, 0.99) * 1000:.0f} ms")
+    if args.slow_clients:
+        print(f"Slow downloads: {results['slow_bytes'] / 1024:.0f} KB received, "
+              f"statuses {dict(results['slow_statuses'])}, {results['slow_errors']} failed")
+
+    throttled = statuses[429] + results['slow_statuses'][429]
+    if throttled:
+        print(f"{throttled} requests were throttled (429); disable the server's rate limits "
+              f"and stream caps for load tests (see the top of this file)", file=sys.stderr)
+        sys.exit(1)
+    if not latencies:
+        print("No API request succeeded", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import Artist, Album, Track, DownloadLog
+from .models import Artist, Album, Track, DownloadLog, Job, Playlist
 
 @admin.register(Artist)
 class ArtistAdmin(admin.ModelAdmin):
@@ -22,3 +22,13 @@ class TrackAdmin(admin.ModelAdmin):
 class DownloadLogAdmin(admin.ModelAdmin):
     list_display = ['user', 'track', 'downloaded_at']
     list_filter = ['downloaded_at']
+
+@admin.register(Job)
+class JobAdmin(admin.ModelAdmin):
+    list_display = ['kind', 'status', 'attempts', 'run_after', 'created_at']
+    list_filter = ['status', 'kind']
+
+@admin.register(Playlist)
+class PlaylistAdmin(admin.ModelAdmin):
+    list_display = ['name', 'user', 'updated_at']
+    search_fields = ['name', 'user__username']
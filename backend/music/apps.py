@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class MusicConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'music'
+
+    def ready(self):
+        # Register background job handlers, media reference counting and genre counters
+        from . import blobs, genres, tasks  # noqa: F401
@@ -0,0 +1,89 @@
+"""Helpers for management commands that process many files in worker processes.
+
+A command maps a module-level function (which must not touch the database)
+over its items with ``worker_map``, collects the results into a ``Batch`` that
+writes them every few hundred rows, and reports its rate with ``Progress``::
+
+    with worker_map(_probe_one, items, workers, chunksize=8) as results, \\
+            Batch(self._flush, options['batch_size']) as pending:
+        for pk, info, error in results:
+            pending.add(...)
+
+Leaving the block early (an error or Ctrl-C) still writes the rows collected
+so far, then stops the pool without starting the items still queued.
+"""
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+import time
+
+import django
+from django.db import connections
+
+
+def _init_worker():
+    # Needed for the "spawn" start method; a no-op once apps are loaded
+    django.setup()
+
+
+@contextmanager
+def worker_map(func, items, workers, chunksize=1):
+    """Yield an iterator of ``func(item)`` for every item, in order; runs inline with one worker"""
+    if workers <= 1:
+        yield map(func, items)
+        return
+    # Forked workers must not share the parent's database connections
+    connections.close_all()
+    pool = ProcessPoolExecutor(max_workers=workers, initializer=_init_worker)
+    try:
+        yield pool.map(func, items, chunksize=chunksize)
+    finally:
+        pool.shutdown(cancel_futures=True)
+
+
+class Batch:
+    """Collects objects and passes them to ``flush`` ``size`` at a time, and once more on exit"""
+
+    def __init__(self, flush, size):
+        self._flush = flush
+        self.size = size
+        self.items = []
+
+    def add(self, obj):
+        self.items.append(obj)
+        if len(self.items) >= self.size:
+            self.flush()
+
+    def flush(self):
+        if self.items:
+            self._flush(self.items)
+            self.items = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        # Keep the results so far even if the run is cut short
+        self.flush()
+        return False
+
+
+class Progress:
+    """Counts processed items; ``step()`` is true when a progress line is due"""
+
+    def __init__(self, total, every):
+        self.total = total
+        self.every = every
+        self.done = 0
+        self.started = time.monotonic()
+
+    def step(self):
+        self.done += 1
+        return self.done % self.every == 0 or self.done == self.total
+
+    @property
+    def elapsed(self):
+        return max(time.monotonic() - self.started, 1e-6)
+
+    @property
+    def rate(self):
+        return self.done / self.elapsed
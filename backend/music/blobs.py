@@ -0,0 +1,106 @@
+"""Reference counting for stored media files.
+
+With content-addressed storage (music.storage.media_storage) several rows can
+point at the same file, so a file may only be deleted once nothing refers to
+it. Saving or deleting a Track or Album adjusts the ``MediaBlob`` counts via
+the signal handlers below; the file is removed from storage when its count
+drops to zero.
+
+``QuerySet.update()``, ``bulk_create()`` and ``bulk_update()`` don't send
+signals, so code writing file fields that way must call ``acquire`` (and
+``release`` for replaced names) itself. Files without a ``MediaBlob`` row
+(stored before reference counting existed) are never deleted automatically;
+``manage.py dedupe_media`` creates their rows.
+"""
+import logging
+import os
+
+from django.db import transaction
+from django.db.models import F
+from django.db.models.signals import post_delete, post_init, post_save
+from django.dispatch import receiver
+
+from .models import Album, MediaBlob, Track
+from .storage import is_content_name
+
+logger = logging.getLogger(__name__)
+
+# File fields whose stored files are reference counted
+TRACKED_FIELDS = {
+    Track: ['file', 'preview_file'],
+    Album: ['cover_image'],
+}
+
+
+def _file_name(value):
+    if not value:
+        return ''
+    if isinstance(value, str):
+        return value
+    return value.name or ''
+
+
+def acquire(name, sha256='', size=None, count=1):
+    """Add references to a stored file"""
+    if not name:
+        return
+    if not sha256 and is_content_name(name):
+        sha256 = os.path.splitext(os.path.basename(name))[0]
+    blob, _ = MediaBlob.objects.get_or_create(name=name, defaults={'sha256': sha256, 'size': size})
+    MediaBlob.objects.filter(pk=blob.pk).update(ref_count=F('ref_count') + count)
+
+
+def release(name, storage):
+    """Drop a reference to a stored file, deleting it when none are left"""
+    if not name:
+        return
+    with transaction.atomic():
+        blob = MediaBlob.objects.select_for_update().filter(name=name).first()
+        if blob is None:
+            return
+        if blob.ref_count > 1:
+            MediaBlob.objects.filter(pk=blob.pk).update(ref_count=F('ref_count') - 1)
+            return
+        blob.delete()
+
+    def delete_file():
+        # Skip if the same bytes were stored again in the meantime
+        if not MediaBlob.objects.filter(name=name).exists():
+            storage.delete(name)
+            logger.info(f"Deleted unreferenced media file {name}")
+
+    transaction.on_commit(delete_file)
+
+
+def _stash_names(sender, instance, **kwargs):
+    # Deferred fields aren't in __dict__; they are left out and not tracked
+    instance._media_names = {
+        field: _file_name(instance.__dict__[field])
+        for field in TRACKED_FIELDS[sender] if field in instance.__dict__
+    }
+
+
+def _update_references(sender, instance, created, update_fields=None, **kwargs):
+    old_names = {} if created else instance._media_names
+    for field in TRACKED_FIELDS[sender]:
+        if update_fields is not None and field not in update_fields:
+            continue
+        if not created and field not in old_names:
+            continue
+        old = old_names.get(field, '')
+        new = _file_name(getattr(instance, field))
+        if new != old:
+            acquire(new)
+            release(old, instance._meta.get_field(field).storage)
+        instance._media_names[field] = new
+
+
+def _release_references(sender, instance, **kwargs):
+    for field in TRACKED_FIELDS[sender]:
+        release(_file_name(getattr(instance, field)), instance._meta.get_field(field).storage)
+
+
+for model in TRACKED_FIELDS:
+    receiver(post_init, sender=model)(_stash_names)
+    receiver(post_save, sender=model)(_update_references)
+    receiver(post_delete, sender=model)(_release_references)
@@ -0,0 +1,223 @@
+"""Shared write paths for adding tracks to the catalog"""
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+import logging
+import os
+
+from django.conf import settings
+from django.db import transaction
+
+from .blobs import acquire
+from .genres import adjust_counts
+from .images import queue_image_variants
+from .jobs import enqueue, enqueue_many
+from .models import Artist, Album, Genre, MediaBlob, SimilarTrack, Track
+from .normalize import genre_key, name_key
+
+logger = logging.getLogger(__name__)
+
+
+class CatalogResolver:
+    """Finds or creates artists, albums and genres by their normalized names.
+
+    Missing rows are inserted with ``INSERT ... ON CONFLICT DO UPDATE`` on
+    the unique keys, so concurrent uploads of the same artist or album end up
+    sharing one row instead of creating duplicates or failing. Resolved rows
+    are remembered, so a batch only looks each name up once.
+    """
+
+    def __init__(self):
+        self._artists = {}
+        self._albums = {}
+        self._genres = {}
+
+    def artist(self, name, bio=''):
+        key = name_key(name)
+        if key not in self._artists:
+            self._artists[key] = _get_or_upsert(
+                Artist(name=name, name_key=key, bio=bio or ''), ['name_key'], name_key=key,
+            )
+        return self._artists[key]
+
+    def album(self, artist, title, release_date='2024-01-01'):
+        key = (artist.pk, name_key(title))
+        if key not in self._albums:
+            self._albums[key] = _get_or_upsert(
+                Album(title=title, title_key=key[1], artist=artist, release_date=release_date),
+                ['artist', 'title_key'], artist=artist, title_key=key[1],
+            )
+            self._albums[key].artist = artist
+        return self._albums[key]
+
+    def genre(self, name):
+        """The Genre for a free-text genre, or None if it's empty or a placeholder"""
+        key = genre_key(name)
+        if not key:
+            return None
+        if key not in self._genres:
+            self._genres[key] = _get_or_upsert(Genre(name=' '.join(name.split()), key=key), ['key'], key=key)
+        return self._genres[key]
+
+
+def _get_or_upsert(obj, unique_fields, **lookup):
+    model = type(obj)
+    try:
+        return model.objects.get(**lookup)
+    except model.DoesNotExist:
+        pass
+    # A no-op update on conflict, so a row inserted concurrently is kept as is
+    model.objects.bulk_create(
+        [obj], update_conflicts=True, unique_fields=unique_fields, update_fields=[unique_fields[-1]],
+    )
+    return model.objects.get(**lookup)
+
+
+def resolve_artist_album(data, resolver=None):
+    """Get or create the artist and album named in upload metadata"""
+    resolver = resolver or CatalogResolver()
+    artist_name = data.get('artist_name')
+    logger.info(f"Creating/getting artist: {artist_name}")
+    artist = resolver.artist(artist_name, data.get('artist_bio', ''))
+
+    album_title = data.get('album_title')
+    logger.info(f"Creating/getting album: {album_title}")
+    album = resolver.album(artist, album_title, data.get('release_date', '2024-01-01'))
+    return artist, album
+
+
+def queue_track_processing(track, cover_url=None):
+    """Queue the background work for a newly stored track; returns the jobs"""
+    jobs = []
+    if not track.probed_at:
+        jobs.append(enqueue('probe_track', {'track_id': track.pk}))
+    if not track.preview_file:
+        jobs.append(enqueue('generate_preview', {'track_id': track.pk}))
+    if cover_url:
+        logger.info(f"Queueing album cover download from URL: {cover_url}")
+        jobs.append(enqueue('fetch_album_cover', {
+            'album_id': track.album_id,
+            'url': cover_url,
+        }))
+    return jobs
+
+
+@dataclass
+class BulkUploadResult:
+    """Outcome of one file in a bulk album upload"""
+    index: int
+    filename: str
+    track: Track = None
+    error: str = ''
+    name: str = ''
+    jobs: list = field(default_factory=list)
+
+
+def _store_file(storage, uploaded):
+    name = Track._meta.get_field('file').generate_filename(None, uploaded.name)
+    return storage.save(name, uploaded)
+
+
+def create_album_tracks(data, files, titles=None, cover=None):
+    """Add many tracks to one album in a single request.
+
+    The artist and album are resolved once, the files are stored
+    concurrently, and the tracks that stored successfully are inserted with
+    one ``bulk_create``. Returns ``(album, results, album_jobs)`` with one
+    ``BulkUploadResult`` per file, in order, so failed files can be retried.
+    """
+    resolver = CatalogResolver()
+    artist, album = resolve_artist_album(data, resolver)
+    if cover is not None:
+        album.cover_image = cover
+        album.save()
+    album_jobs = [job for job in [queue_image_variants(album)] if job]
+    cover_url = data.get('album_cover_url')
+    if cover is None and cover_url:
+        album_jobs.append(enqueue('fetch_album_cover', {'album_id': album.pk, 'url': cover_url}))
+
+    results = [BulkUploadResult(index, uploaded.name) for index, uploaded in enumerate(files)]
+    storage = Track._meta.get_field('file').storage
+    workers = max(1, min(settings.MUSIC_BULK_UPLOAD_WORKERS, len(files)))
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(_store_file, storage, uploaded) for uploaded in files]
+        for result, future in zip(results, futures):
+            try:
+                result.name = future.result()
+            except Exception as e:
+                logger.error(f"Failed to store {result.filename}: {str(e)}", exc_info=True)
+                result.error = f"Failed to store file: {str(e)}"
+
+    titles = titles or []
+    stored = [result for result in results if result.name]
+    tracks = []
+    for result in stored:
+        uploaded = files[result.index]
+        audio_info = getattr(uploaded, 'audio_info', None)
+        title = titles[result.index] if result.index < len(titles) else ''
+        if not title and audio_info:
+            title = audio_info.tags.get('title', '')
+        track = Track(
+            title=title or os.path.splitext(result.filename)[0],
+            artist=artist,
+            album=album,
+            duration=0,
+            genre=resolver.genre(data.get('genre', '') or (audio_info.tags.get('genre', '') if audio_info else '')),
+        )
+        track.file.name = result.name
+        if audio_info:
+            track.apply_audio_info(audio_info)
+        tracks.append(track)
+        result.track = track
+
+    try:
+        with transaction.atomic():
+            Track.objects.bulk_create(tracks)
+            # bulk_create skips the signals that count file references and genres
+            adjust_counts(Counter(track.genre_id for track in tracks))
+            for result in stored:
+                uploaded = files[result.index]
+                acquire(result.name, getattr(uploaded, 'sha256', ''), uploaded.size)
+            _queue_bulk_processing(stored)
+    except Exception:
+        # Nothing references the newly stored files; don't leave them behind
+        for result in stored:
+            if not MediaBlob.objects.filter(name=result.name).exists():
+                storage.delete(result.name)
+        raise
+
+    logger.info(f"Bulk upload to album {album.pk}: {len(stored)} of {len(files)} files stored")
+    return album, results, album_jobs
+
+
+def _queue_bulk_processing(results):
+    """queue_track_processing for many new tracks, with one insert per job kind"""
+    probe = [r for r in results if not r.track.probed_at]
+    probe_jobs = enqueue_many('probe_track', [{'track_id': r.track.pk} for r in probe])
+    preview_jobs = enqueue_many('generate_preview', [{'track_id': r.track.pk} for r in results])
+    for result, job in zip(probe, probe_jobs):
+        result.jobs.append(job)
+    for result, job in zip(results, preview_jobs):
+        result.jobs.append(job)
+
+
+def merge_tracks(keeper, duplicates):
+    """Fold ``duplicates`` into ``keeper`` and delete them.
+
+    Rows referencing a duplicate (downloads, playlist items, upload
+    sessions) are pointed at the keeper. Deleting the duplicates releases
+    their files and genre counts through the usual signals. Their
+    similar-track rows are dropped rather than moved; run
+    ``build_similar_tracks --full`` afterwards to rescore the keeper.
+    """
+    duplicate_ids = [track.pk for track in duplicates if track.pk != keeper.pk]
+    with transaction.atomic():
+        for relation in Track._meta.get_fields(include_hidden=True):
+            if not relation.one_to_many or relation.related_model is SimilarTrack:
+                continue
+            name = relation.field.name
+            relation.related_model.objects.filter(**{f'{name}__in': duplicate_ids}).update(**{name: keeper})
+        for track in Track.objects.filter(pk__in=duplicate_ids):
+            track.delete()
+    logger.info(f"Merged tracks {duplicate_ids} into track {keeper.pk}")
+    return len(duplicate_ids)
@@ -0,0 +1,283 @@
+"""Acoustic fingerprints for finding the same recording stored twice.
+
+Fingerprints follow Haitsma & Kalker's "highly robust audio fingerprinting".
+Audio is resampled to mono at ``SAMPLE_RATE`` and cut into overlapping
+frames. The energy of each frame is measured in 33 logarithmic bands between
+300 and 2000 Hz. Each frame then gets a 32-bit sub-fingerprint, one bit per
+band pair: whether the energy difference between neighbouring bands grew or
+shrank since the previous frame. These bits survive re-encoding, resampling
+and volume changes, so copies of a recording in other formats or under
+other names end up with nearly the same sub-fingerprints.
+
+WAV files are decoded here straight from their PCM frames. Other formats go
+through the decoder configured in ``settings.MUSIC_FINGERPRINT_DECODER``.
+
+``duplicate_clusters`` indexes the sub-fingerprints of every track by value.
+Tracks that share values at a consistent time offset become candidates. A
+candidate pair is a duplicate when its fingerprints differ in at most
+``max_bit_error`` of their bits over the overlap.
+"""
+from math import gcd
+import struct
+import subprocess
+
+import numpy as np
+from django.conf import settings
+from django.utils.module_loading import import_string
+from scipy.signal import resample_poly
+
+from .probe import open_reader, probe
+from .storage import is_s3_storage, local_path, presigned_url
+
+SAMPLE_RATE = 5512
+FRAME_SIZE = 2048  # 0.37s
+HOP_SIZE = 256  # 1/8 of a frame, so sub-fingerprints barely change between neighbours
+BAND_EDGES = np.geomspace(300, 2000, 34)
+# WAV PCM frames are read in chunks of this size
+READ_CHUNK_SIZE = 1024 * 1024
+
+# Sub-fingerprint values found in more tracks than this (silence, steady
+# tones) say nothing about which tracks match and are left out of the index
+MAX_TRACKS_PER_VALUE = 50
+# Shared values at the same offset needed before a pair is compared in full
+MIN_VOTES = 2
+# Matches must overlap on at least this share of the shorter fingerprint
+MIN_OVERLAP = 0.5
+DEFAULT_MAX_BIT_ERROR = 0.35
+
+WAVE_FORMAT_PCM = 1
+WAVE_FORMAT_IEEE_FLOAT = 3
+WAVE_FORMAT_EXTENSIBLE = 0xFFFE
+
+
+class FingerprintError(Exception):
+    """Raised when a file can't be decoded into a fingerprint"""
+
+
+# ---------------------------------------------------------------------------
+# Decoding
+# ---------------------------------------------------------------------------
+
+def _wav_samples(reader, info, seconds):
+    """Mono float samples of the first ``seconds`` of a WAV file"""
+    format_tag, = struct.unpack_from('<H', info.wav_fmt)
+    if format_tag == WAVE_FORMAT_EXTENSIBLE and len(info.wav_fmt) >= 26:
+        # The real format is the first two bytes of the sub-format GUID
+        format_tag, = struct.unpack_from('<H', info.wav_fmt, 24)
+    width = info.block_align // info.channels
+    if format_tag not in (WAVE_FORMAT_PCM, WAVE_FORMAT_IEEE_FLOAT) or width not in (1, 2, 3, 4):
+        raise FingerprintError(f"Unsupported WAV encoding (format {format_tag}, {width * 8} bits)")
+
+    size = min(info.data_size, int(seconds * info.sample_rate) * info.block_align)
+    chunks = []
+    for offset in range(0, size, READ_CHUNK_SIZE):
+        chunk = reader.read(info.data_offset + offset, min(READ_CHUNK_SIZE, size - offset))
+        if not chunk:
+            break
+        chunks.append(chunk)
+    data = b''.join(chunks)
+    data = data[:len(data) - len(data) % info.block_align]
+
+    if format_tag == WAVE_FORMAT_IEEE_FLOAT:
+        if width != 4:
+            raise FingerprintError("Only 32-bit float WAV is supported")
+        samples = np.frombuffer(data, dtype='<f4')
+    elif width == 1:
+        samples = np.frombuffer(data, dtype=np.uint8).astype(np.float32) - 128
+    elif width == 3:
+        # Sign-extend 24-bit samples by placing them in the top bytes of int32
+        raw = np.frombuffer(data, dtype=np.uint8).reshape(-1, 3)
+        padded = np.zeros((len(raw), 4), dtype=np.uint8)
+        padded[:, 1:] = raw
+        samples = padded.view('<i4').ravel().astype(np.float32)
+    else:
+        samples = np.frombuffer(data, dtype=f'<i{width}').astype(np.float32)
+    # Fingerprints only compare energies, so the scale doesn't matter
+    return samples.reshape(-1, info.channels).mean(axis=1)
+
+
+class BaseDecoder:
+    """Interface for decoding any audio file for fingerprinting"""
+
+    def decode(self, source, sample_rate, seconds):
+        """Return the first ``seconds`` of ``source`` (a local path or a URL)
+        as mono float32 samples at ``sample_rate``"""
+        raise NotImplementedError
+
+
+class FFmpegDecoder(BaseDecoder):
+    """Decode with the ffmpeg binary (reads over HTTP for S3 sources)"""
+
+    def decode(self, source, sample_rate, seconds):
+        command = [
+            settings.FFMPEG_BINARY, '-v', 'error', '-t', f'{seconds:.3f}', '-i', source,
+            '-vn', '-ac', '1', '-ar', str(sample_rate), '-f', 'f32le', 'pipe:1',
+        ]
+        try:
+            result = subprocess.run(command, capture_output=True, check=True, timeout=300)
+        except FileNotFoundError:
+            raise FingerprintError("ffmpeg is not installed")
+        except subprocess.CalledProcessError as e:
+            raise FingerprintError(f"ffmpeg failed: {e.stderr.decode(errors='replace').strip()}")
+        except subprocess.TimeoutExpired:
+            raise FingerprintError("ffmpeg timed out")
+        return np.frombuffer(result.stdout, dtype='<f4')
+
+
+def get_decoder():
+    return import_string(settings.MUSIC_FINGERPRINT_DECODER)()
+
+
+def resample(samples, rate, target=SAMPLE_RATE):
+    if rate == target:
+        return samples
+    divisor = gcd(rate, target)
+    return resample_poly(samples, target // divisor, rate // divisor).astype(np.float32)
+
+
+# ---------------------------------------------------------------------------
+# Fingerprints
+# ---------------------------------------------------------------------------
+
+def _band_matrix():
+    """(FFT bins x bands) 0/1 matrix summing each band's bins"""
+    frequencies = np.fft.rfftfreq(FRAME_SIZE, 1 / SAMPLE_RATE)
+    bands = np.digitize(frequencies, BAND_EDGES) - 1
+    matrix = np.zeros((len(frequencies), len(BAND_EDGES) - 1), dtype=np.float32)
+    inside = (bands >= 0) & (bands < len(BAND_EDGES) - 1)
+    matrix[np.flatnonzero(inside), bands[inside]] = 1
+    return matrix
+
+
+BAND_MATRIX = _band_matrix()
+WINDOW = np.hanning(FRAME_SIZE).astype(np.float32)
+BIT_VALUES = (1 << np.arange(32, dtype=np.uint64)).astype(np.uint32)
+
+
+def fingerprint(samples):
+    """uint32 sub-fingerprints of mono ``samples`` at SAMPLE_RATE"""
+    samples = np.asarray(samples, dtype=np.float32)
+    if len(samples) < FRAME_SIZE + HOP_SIZE:
+        return np.zeros(0, dtype=np.uint32)
+    frames = np.lib.stride_tricks.sliding_window_view(samples, FRAME_SIZE)[::HOP_SIZE]
+    energies = (np.abs(np.fft.rfft(frames * WINDOW, axis=1)) ** 2) @ BAND_MATRIX
+    differences = energies[:, :-1] - energies[:, 1:]
+    bits = (differences[1:] - differences[:-1]) > 0
+    return (bits * BIT_VALUES).sum(axis=1, dtype=np.uint32)
+
+
+def fingerprint_file(name, storage, seconds=None):
+    """Fingerprint the start of a stored track file.
+
+    Touches storage only (no database), so it is safe to call from worker
+    processes. Returns the sub-fingerprints as bytes.
+    """
+    seconds = seconds or settings.MUSIC_FINGERPRINT_SECONDS
+    reader = open_reader(name, storage)
+    try:
+        info = probe(reader)
+        if info.format == 'wav':
+            samples = resample(_wav_samples(reader, info, seconds), info.sample_rate)
+        else:
+            if is_s3_storage(storage):
+                source = presigned_url(storage, name)
+            else:
+                source = local_path(storage, name)
+            if source is None:
+                raise FingerprintError("Storage can't provide a path or URL to decode from")
+            samples = get_decoder().decode(source, SAMPLE_RATE, seconds)
+    finally:
+        reader.close()
+    prints = fingerprint(samples)
+    if not len(prints):
+        raise FingerprintError("Audio is too short to fingerprint")
+    return prints.astype('<u4').tobytes()
+
+
+def from_bytes(data):
+    return np.frombuffer(data, dtype='<u4')
+
+
+# ---------------------------------------------------------------------------
+# Matching
+# ---------------------------------------------------------------------------
+
+def bit_error_rate(a, b, delta):
+    """Share of differing bits between ``a`` and ``b`` with frame i of ``a``
+    aligned to frame i - delta of ``b``, and the overlap in frames"""
+    start = max(0, delta)
+    end = min(len(a), len(b) + delta)
+    if end <= start:
+        return 1.0, 0
+    differing = np.unpackbits((a[start:end] ^ b[start - delta:end - delta]).view(np.uint8))
+    return differing.mean(), end - start
+
+
+def candidate_pairs(prints, max_tracks_per_value=MAX_TRACKS_PER_VALUE, min_votes=MIN_VOTES):
+    """Pairs of indexes into ``prints`` sharing sub-fingerprint values at a
+    consistent offset, as (i, j, delta) arrays with i < j"""
+    lengths = np.array([len(p) for p in prints], dtype=np.int64)
+    if not len(prints):
+        empty = np.zeros(0, dtype=np.int64)
+        return empty, empty, empty
+    values = np.concatenate(prints)
+    tracks = np.repeat(np.arange(len(prints)), lengths)
+    offsets = np.arange(len(values)) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+
+    # Index by value, one entry (the first offset) per track and value
+    order = np.lexsort((offsets, tracks, values))
+    values, tracks, offsets = values[order], tracks[order], offsets[order]
+    first = np.ones(len(values), dtype=bool)
+    first[1:] = (values[1:] != values[:-1]) | (tracks[1:] != tracks[:-1])
+    values, tracks, offsets = values[first], tracks[first], offsets[first]
+
+    starts = np.flatnonzero(np.r_[True, values[1:] != values[:-1]])
+    sizes = np.diff(np.r_[starts, len(values)])
+    left, right, deltas = [], [], []
+    # Every pair within each value's group, for all groups of one size at once
+    for size in range(2, max_tracks_per_value + 1):
+        groups = starts[sizes == size]
+        if not len(groups):
+            continue
+        i, j = np.triu_indices(size, k=1)
+        members = groups[:, None] + np.arange(size)
+        left.append(tracks[members[:, i]].ravel())
+        right.append(tracks[members[:, j]].ravel())
+        deltas.append((offsets[members[:, i]] - offsets[members[:, j]]).ravel())
+    if not left:
+        empty = np.zeros(0, dtype=np.int64)
+        return empty, empty, empty
+    left, right, deltas = np.concatenate(left), np.concatenate(right), np.concatenate(deltas)
+
+    # Votes per (pair, offset), counted on one int64 key; keep each pair's best offset
+    span = 2 * int(lengths.max()) + 1
+    keys, votes = np.unique((left * len(prints) + right) * span + deltas + lengths.max(), return_counts=True)
+    keys, votes = keys[votes >= min_votes], votes[votes >= min_votes]
+    pairs, deltas = keys // span, keys % span - lengths.max()
+    best = np.lexsort((-votes, pairs))
+    pairs, deltas = pairs[best], deltas[best]
+    first = np.ones(len(pairs), dtype=bool)
+    first[1:] = pairs[1:] != pairs[:-1]
+    return pairs[first] // len(prints), pairs[first] % len(prints), deltas[first]
+
+
+def _find(parents, item):
+    while parents[item] != item:
+        parents[item] = parents[parents[item]]
+        item = parents[item]
+    return item
+
+
+def duplicate_clusters(prints, max_bit_error=DEFAULT_MAX_BIT_ERROR):
+    """Groups of indexes into ``prints`` that hold the same recording, each
+    sorted, largest groups first"""
+    parents = list(range(len(prints)))
+    for i, j, delta in zip(*candidate_pairs(prints)):
+        error, overlap = bit_error_rate(prints[i], prints[j], delta)
+        if error <= max_bit_error and overlap >= MIN_OVERLAP * min(len(prints[i]), len(prints[j])):
+            parents[_find(parents, i)] = _find(parents, j)
+
+    clusters = {}
+    for item in range(len(prints)):
+        clusters.setdefault(_find(parents, item), []).append(item)
+    return sorted((c for c in clusters.values() if len(c) > 1), key=lambda c: (-len(c), c[0]))
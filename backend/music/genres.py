@@ -0,0 +1,54 @@
+"""Per-genre track counters.
+
+``Genre.track_count`` is kept up to date by the signal handlers below, so
+listing genres with their counts doesn't need a ``GROUP BY`` over all
+tracks. ``QuerySet.update()``, ``bulk_create()`` and ``bulk_update()`` don't
+send signals, so code changing track genres that way must call
+``adjust_counts`` itself. ``manage.py recount_genres`` rebuilds the counters
+from scratch.
+"""
+from collections import Counter
+
+from django.db.models import Count, F, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+from django.db.models.signals import post_delete, post_init, post_save
+from django.dispatch import receiver
+
+from .models import Genre, Track
+
+
+def adjust_counts(deltas):
+    """Apply a {genre_id: change} mapping to the counters"""
+    for genre_id, delta in deltas.items():
+        if genre_id is not None and delta:
+            Genre.objects.filter(pk=genre_id).update(track_count=F('track_count') + delta)
+
+
+def recount():
+    """Recompute every counter from the tracks table"""
+    counts = Track.objects.filter(genre=OuterRef('pk')).order_by().values('genre').annotate(n=Count('pk')).values('n')
+    return Genre.objects.update(track_count=Coalesce(Subquery(counts), 0))
+
+
+# Stands in for the genre of instances loaded with the field deferred
+_UNTRACKED = object()
+
+
+@receiver(post_init, sender=Track)
+def _stash_genre(sender, instance, **kwargs):
+    instance._counted_genre_id = instance.__dict__.get('genre_id', _UNTRACKED)
+
+
+@receiver(post_save, sender=Track)
+def _update_counts(sender, instance, created, update_fields=None, **kwargs):
+    if update_fields is not None and 'genre' not in update_fields:
+        return
+    old = None if created else instance._counted_genre_id
+    if old is not _UNTRACKED and instance.genre_id != old:
+        adjust_counts(Counter({instance.genre_id: 1, old: -1}))
+    instance._counted_genre_id = instance.genre_id
+
+
+@receiver(post_delete, sender=Track)
+def _release_count(sender, instance, **kwargs):
+    adjust_counts({instance.genre_id: -1})
@@ -0,0 +1,146 @@
+"""Resized variants of album covers and artist images.
+
+Each variant is stored next to the original (``albums/ab/ab12...ef.jpg`` ->
+``albums/ab/ab12...ef_400.webp``) and recorded on the model as
+
+    {"source": "albums/cover.jpg", "sizes": {"200": {"webp": name, "jpeg": name}, ...}}
+
+``source`` is the image the variants were built from, so a replaced image is
+recognised as stale and the serializers fall back to the original until the
+worker has caught up.
+
+Variants are written through the plain default storage even when the original
+lives in the content-addressed ``media_storage`` (album covers), which would
+otherwise ignore the name and file them under their own hash. Covers are
+already named after their content, so identical covers share one set of
+variants and rebuilding them overwrites the same files.
+"""
+from io import BytesIO
+import logging
+import os
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from PIL import Image, ImageOps, UnidentifiedImageError
+
+from .jobs import enqueue
+from .storage import file_version, versioned_url
+
+logger = logging.getLogger(__name__)
+
+# Pillow format names and options for each variant format
+FORMATS = {
+    'webp': ('WEBP', {'quality': 80, 'method': 4}),
+    'jpeg': ('JPEG', {'quality': 82, 'optimize': True, 'progressive': True}),
+}
+
+# Model -> (image field, variants field)
+IMAGE_FIELDS = {
+    'album': ('cover_image', 'cover_variants'),
+    'artist': ('image', 'image_variants'),
+}
+
+
+class ImageVariantError(Exception):
+    """Raised when an image can't be decoded"""
+
+
+def variant_name(source_name, width, fmt):
+    stem = os.path.splitext(source_name)[0]
+    return f'{stem}_{width}.{"jpg" if fmt == "jpeg" else fmt}'
+
+
+def variant_widths(original_width):
+    """Configured widths that don't upscale; small images get one variant at their own width"""
+    widths = [w for w in settings.MUSIC_IMAGE_VARIANT_WIDTHS if w <= original_width]
+    return widths or [original_width]
+
+
+def build_variants(name, storage):
+    """Render every variant of the image ``name`` in ``storage`` and store them; returns the ``sizes`` map"""
+    try:
+        with storage.open(name, 'rb') as fh:
+            image = Image.open(fh)
+            image = ImageOps.exif_transpose(image)
+            image = image.convert('RGB')
+    except (UnidentifiedImageError, OSError) as e:
+        raise ImageVariantError(f"Could not read image {name}: {str(e)}")
+
+    sizes = {}
+    for width in variant_widths(image.width):
+        height = max(1, round(image.height * width / image.width))
+        resized = image if width == image.width else image.resize((width, height), Image.LANCZOS)
+        sizes[str(width)] = {}
+        for fmt in settings.MUSIC_IMAGE_VARIANT_FORMATS:
+            pil_format, options = FORMATS[fmt]
+            buffer = BytesIO()
+            resized.save(buffer, pil_format, **options)
+            target = variant_name(name, width, fmt)
+            if default_storage.exists(target):
+                default_storage.delete(target)
+            sizes[str(width)][fmt] = default_storage.save(target, ContentFile(buffer.getvalue()))
+    return sizes
+
+
+def delete_variants(variants):
+    for formats in variants.get('sizes', {}).values():
+        for name in formats.values():
+            default_storage.delete(name)
+
+
+def variants_are_current(field_file, variants):
+    if not field_file:
+        return not variants
+    return variants.get('source') == field_file.name
+
+
+def generate_variants(obj):
+    """Build variants for an Album or Artist image and save them on the object"""
+    image_field, variants_field = IMAGE_FIELDS[obj._meta.model_name]
+    field_file = getattr(obj, image_field)
+    old = getattr(obj, variants_field) or {}
+    if variants_are_current(field_file, old):
+        return old
+
+    # Identical images share one stored file (and so the same variants)
+    shared = type(obj).objects.filter(**{image_field: old.get('source')}).exclude(pk=obj.pk).exists()
+    if old.get('sizes') and not shared:
+        delete_variants(old)
+    variants = {}
+    if field_file:
+        variants = {'source': field_file.name, 'sizes': {}}
+        try:
+            variants['sizes'] = build_variants(field_file.name, field_file.storage)
+        except ImageVariantError:
+            # Record the source anyway so a broken image isn't retried forever
+            setattr(obj, variants_field, variants)
+            obj.save(update_fields=[variants_field])
+            raise
+    setattr(obj, variants_field, variants)
+    obj.save(update_fields=[variants_field])
+    logger.info(f"Generated {len(variants.get('sizes', {}))} image variants for {obj._meta.model_name} {obj.pk}")
+    return variants
+
+
+def variant_urls(field_file, variants, fmt=None):
+    """``{width: url}`` for the preferred format, or {} if the variants are stale"""
+    if not field_file or not variants_are_current(field_file, variants or {}):
+        return {}
+    fmt = fmt or settings.MUSIC_IMAGE_VARIANT_FORMATS[0]
+    version = file_version(field_file)
+    return {
+        width: versioned_url(default_storage.url(formats[fmt]), formats[fmt], version)
+        for width, formats in variants['sizes'].items()
+        if fmt in formats
+    }
+
+
+def queue_image_variants(obj):
+    """Queue variant generation when an object's image has changed"""
+    image_field, variants_field = IMAGE_FIELDS[obj._meta.model_name]
+    field_file = getattr(obj, image_field)
+    variants = getattr(obj, variants_field) or {}
+    if variants_are_current(field_file, variants):
+        return None
+    return enqueue('generate_image_variants', {'model': obj._meta.model_name, 'id': obj.pk})
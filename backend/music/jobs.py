@@ -0,0 +1,143 @@
+"""Database-backed job queue for post-upload processing.
+
+Jobs are rows in ``music.Job``. Workers (``manage.py run_jobs``) claim a job
+with a compare-and-set UPDATE, which works the same on SQLite and Postgres,
+and hold it for a visibility timeout. Failed jobs are retried with
+exponential backoff until ``max_attempts`` is reached.
+
+Handlers are registered with ``@job_handler('kind')`` (see music.tasks) and
+are called with the job payload as keyword arguments.
+"""
+from datetime import timedelta
+import logging
+import os
+import socket
+import uuid
+
+from django.db.models import F, Q
+from django.utils import timezone
+
+from .models import Job
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_VISIBILITY_TIMEOUT = 300
+RETRY_BASE_DELAY = 10
+RETRY_MAX_DELAY = 3600
+
+_handlers = {}
+
+
+class PermanentJobError(Exception):
+    """Raised by a handler when retrying the job can't help"""
+
+
+def job_handler(kind):
+    """Register a function as the handler for jobs of the given kind"""
+    def decorator(func):
+        _handlers[kind] = func
+        return func
+    return decorator
+
+
+def enqueue(kind, payload=None, delay=0, max_attempts=5):
+    """Queue a job; it becomes visible to workers once the transaction commits"""
+    if kind not in _handlers:
+        raise ValueError(f"Unknown job kind: {kind}")
+    return Job.objects.create(
+        kind=kind,
+        payload=payload or {},
+        max_attempts=max_attempts,
+        run_after=timezone.now() + timedelta(seconds=delay),
+    )
+
+
+def enqueue_many(kind, payloads, delay=0, max_attempts=5):
+    """Queue one job per payload in a single insert"""
+    if kind not in _handlers:
+        raise ValueError(f"Unknown job kind: {kind}")
+    run_after = timezone.now() + timedelta(seconds=delay)
+    return Job.objects.bulk_create([
+        Job(kind=kind, payload=payload, max_attempts=max_attempts, run_after=run_after)
+        for payload in payloads
+    ])
+
+
+def worker_name():
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+def claim_next(worker=None, visibility_timeout=DEFAULT_VISIBILITY_TIMEOUT, kinds=None):
+    """Claim the next runnable job, or return None if there is nothing to do"""
+    now = timezone.now()
+    candidates = Job.objects.filter(
+        Q(status=Job.STATUS_QUEUED, run_after__lte=now) |
+        Q(status=Job.STATUS_RUNNING, locked_until__lt=now)
+    )
+    if kinds:
+        candidates = candidates.filter(kind__in=kinds)
+
+    for pk, job_status, locked_until in candidates.order_by('run_after', 'pk').values_list(
+        'pk', 'status', 'locked_until'
+    )[:20]:
+        # Each claim gets a unique token so a worker whose lock expired can't
+        # later overwrite the outcome recorded by the worker that took over.
+        token = f"{worker or worker_name()}:{uuid.uuid4().hex[:8]}"
+        claimed = Job.objects.filter(
+            pk=pk, status=job_status, locked_until=locked_until
+        ).update(
+            status=Job.STATUS_RUNNING,
+            locked_by=token,
+            locked_until=now + timedelta(seconds=visibility_timeout),
+            attempts=F('attempts') + 1,
+            updated_at=now,
+        )
+        if claimed:
+            return Job.objects.get(pk=pk)
+    return None
+
+
+def retry_delay(attempts):
+    return min(RETRY_BASE_DELAY * 2 ** (attempts - 1), RETRY_MAX_DELAY)
+
+
+def _finish(job, **fields):
+    fields['updated_at'] = timezone.now()
+    updated = Job.objects.filter(
+        pk=job.pk, status=Job.STATUS_RUNNING, locked_by=job.locked_by
+    ).update(**fields)
+    if not updated:
+        logger.warning(f"Lost the lock on job {job.pk} before it finished")
+
+
+def run_job(job):
+    """Execute a claimed job and record its outcome. Returns the final status."""
+    handler = _handlers.get(job.kind)
+    if job.attempts > job.max_attempts:
+        error = "Exceeded max attempts (worker timed out or crashed)"
+    elif handler is None:
+        error = f"No handler registered for job kind '{job.kind}'"
+    else:
+        try:
+            result = handler(**job.payload)
+        except PermanentJobError as e:
+            error = str(e)
+        except Exception as e:
+            logger.error(f"Job {job.pk} ({job.kind}) failed: {str(e)}", exc_info=True)
+            if job.attempts < job.max_attempts:
+                _finish(
+                    job,
+                    status=Job.STATUS_QUEUED,
+                    locked_until=None,
+                    last_error=str(e),
+                    run_after=timezone.now() + timedelta(seconds=retry_delay(job.attempts)),
+                )
+                return Job.STATUS_QUEUED
+            error = str(e)
+        else:
+            _finish(job, status=Job.STATUS_DONE, locked_until=None, result=result, last_error='')
+            return Job.STATUS_DONE
+
+    logger.error(f"Job {job.pk} ({job.kind}) failed permanently: {error}")
+    _finish(job, status=Job.STATUS_FAILED, locked_until=None, last_error=error)
+    return Job.STATUS_FAILED
@@ -0,0 +1,87 @@
+import copy
+import statistics
+import time
+
+from django.core.management.base import BaseCommand
+from django.core.signals import request_finished, request_started
+from django.db import connections
+from django.db.backends.signals import connection_created
+from music.models import Track
+
+
+def _percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+class Command(BaseCommand):
+    help = 'Measures per-request database latency with and without connection reuse'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=500,
+                            help='Simulated requests per mode')
+        parser.add_argument('--modes', nargs='+', choices=['new', 'persistent', 'pool'],
+                            help='Connection modes to compare (default: all the backend supports)')
+
+    def handle(self, *args, **options):
+        base = copy.deepcopy(connections['default'].settings_dict)
+        base['OPTIONS'] = {key: value for key, value in base['OPTIONS'].items() if key != 'pool'}
+        pool = connections['default'].settings_dict['OPTIONS'].get('pool') or {'min_size': 1, 'max_size': 4}
+        modes = {
+            # What every request paid before: connect, query, disconnect
+            'new': {'CONN_MAX_AGE': 0, 'CONN_HEALTH_CHECKS': False},
+            'persistent': {'CONN_MAX_AGE': 600, 'CONN_HEALTH_CHECKS': True},
+        }
+        if connections['default'].vendor == 'postgresql':
+            modes['pool'] = {'CONN_MAX_AGE': 0, 'OPTIONS': {**base['OPTIONS'], 'pool': pool}}
+        selected = options['modes'] or list(modes)
+        unsupported = [mode for mode in selected if mode not in modes]
+        if unsupported:
+            self.stdout.write(self.style.WARNING(
+                f"Skipping {', '.join(unsupported)}: needs PostgreSQL with psycopg 3"
+            ))
+
+        self.stdout.write(f"{connections['default'].vendor}, {options['requests']} requests per mode")
+        for mode in selected:
+            if mode in modes:
+                self._run(mode, {**base, **modes[mode]}, options['requests'])
+
+    def _run(self, mode, settings_dict, requests):
+        alias = f'benchmark_{mode}'
+        connections.settings[alias] = settings_dict
+        connection = connections[alias]
+        opened = []
+
+        def count_connection(sender, connection, **kwargs):
+            if connection.alias == alias:
+                opened.append(1)
+
+        connection_created.connect(count_connection)
+        connect_times, totals = [], []
+        try:
+            for _ in range(requests):
+                # The request signals close or recycle connections like a real request
+                started = time.perf_counter()
+                request_started.send(sender=self.__class__)
+                connection.ensure_connection()
+                connected = time.perf_counter()
+                list(Track.objects.using(alias).select_related('artist', 'album', 'genre').order_by('-created_at')[:20])
+                request_finished.send(sender=self.__class__)
+                finished = time.perf_counter()
+                connect_times.append(connected - started)
+                totals.append(finished - started)
+        finally:
+            connection_created.disconnect(count_connection)
+            connection.close()
+            if hasattr(connection, 'close_pool'):
+                connection.close_pool()
+            del connections[alias]
+            del connections.settings[alias]
+
+        ms = 1000
+        self.stdout.write(self.style.SUCCESS(
+            f"{mode:>10}: {len(opened)} connections opened | "
+            f"connect p50 {_percentile(connect_times, 0.5) * ms:.2f} ms, p99 {_percentile(connect_times, 0.99) * ms:.2f} ms | "
+            f"request p50 {_percentile(totals, 0.5) * ms:.2f} ms, p99 {_percentile(totals, 0.99) * ms:.2f} ms, "
+            f"mean {statistics.mean(totals) * ms:.2f} ms"
+        ))
@@ -0,0 +1,107 @@
+from datetime import timedelta
+import random
+import statistics
+import time
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.db.models import F
+from django.test.utils import CaptureQueriesContext, override_settings
+from music import playlists
+from music.models import Playlist, PlaylistItem, Track
+
+
+def _percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+class Command(BaseCommand):
+    help = 'Measures playlist edits and item listing on a large playlist'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--items', type=int, default=10000, help='Playlist size')
+        parser.add_argument('--repeat', type=int, default=200, help='Runs of each single-item operation')
+        parser.add_argument('--page-size', type=int, default=100)
+
+    def handle(self, *args, **options):
+        tracks = list(Track.objects.order_by('pk')[:1000])
+        if not tracks:
+            raise CommandError('Needs at least one track to fill the playlist with')
+        # Each edit commits, as it would in a request; the benchmark user and
+        # its playlist are deleted at the end
+        user = get_user_model().objects.create_user(f'benchmark-{time.time_ns()}', password=None)
+        try:
+            with override_settings(MUSIC_PLAYLIST_MAX_ITEMS=options['items'] + 10 * options['repeat']):
+                self._run(user, tracks, options)
+        finally:
+            user.delete()
+
+    def _time(self, label, operation, repeat, prepare=tuple):
+        """Run ``operation(*prepare())`` ``repeat`` times; report the latency and
+        queries of the operation alone"""
+        timings, statements = [], []
+        for _ in range(repeat):
+            args = prepare()
+            with CaptureQueriesContext(connection) as queries:
+                started = time.perf_counter()
+                operation(*args)
+                timings.append(time.perf_counter() - started)
+            statements.append(len(queries.captured_queries))
+        ms = 1000
+        self.stdout.write(
+            f"  {label:<44} p50 {_percentile(timings, 0.5) * ms:7.2f} ms  p99 {_percentile(timings, 0.99) * ms:7.2f} ms"
+            f"  {statistics.mean(statements):.0f} queries"
+        )
+
+    def _run(self, user, tracks, options):
+        size, repeat, page_size = options['items'], options['repeat'], options['page_size']
+        playlist = Playlist.objects.create(user=user, name='Benchmark')
+        pick = lambda count: [tracks[i % len(tracks)] for i in range(count)]
+
+        self.stdout.write(f"{connection.vendor}, {size} items")
+        started = time.perf_counter()
+        playlists.add_tracks(playlist, pick(size))
+        self.stdout.write(self.style.SUCCESS(
+            f"  bulk add of {size} tracks: {(time.perf_counter() - started) * 1000:.0f} ms"
+        ))
+
+        items = lambda: PlaylistItem.objects.filter(playlist=playlist)
+        middle = lambda: (items().select_related('playlist').order_by('rank')[items().count() // 2],)
+        random_pair = lambda: tuple(
+            items().select_related('playlist').order_by('rank')[random.randrange(items().count())]
+            for _ in range(2)
+        )
+
+        self._time('append one track', lambda: playlists.add_tracks(playlist, pick(1)), repeat)
+        self._time('insert one track at the start', lambda: playlists.add_tracks(playlist, pick(1), after=None),
+                   repeat)
+        self._time('insert one track in the middle',
+                   lambda after: playlists.add_tracks(playlist, pick(1), after=after), repeat, middle)
+        self._time('insert 10 tracks in the middle',
+                   lambda after: playlists.add_tracks(playlist, pick(10), after=after), max(1, repeat // 10), middle)
+        self._time('move a random item after another', playlists.move_item, repeat, random_pair)
+
+        # What a position column would cost: renumbering every item after the
+        # insertion point, here half the playlist. The value has to change,
+        # or SQLite skips writing the rows.
+        self._time(f'baseline: renumber {size // 2} items',
+                   lambda after: items().filter(rank__gt=after.rank).update(
+                       added_at=F('added_at') + timedelta(microseconds=1)
+                   ),
+                   max(1, repeat // 10), middle)
+
+        ranks = list(items().values_list('rank', flat=True))
+        self.stdout.write(
+            f"  rank length after the edits: mean {statistics.mean(map(len, ranks)):.1f}, max {max(map(len, ranks))}"
+        )
+
+        listing = items().select_related('track__artist', 'track__album', 'track__genre').order_by('rank')
+        ordered = list(items().order_by('rank').values_list('rank', flat=True))
+        for depth in [0, len(ordered) // 2, len(ordered) - page_size]:
+            cursor = ordered[depth - 1] if depth else ''
+            self._time(f'keyset page at item {depth}',
+                       lambda: list(listing.filter(rank__gt=cursor)[:page_size]), repeat // 4 or 1)
+            self._time(f'offset page at item {depth}',
+                       lambda: list(listing[depth:depth + page_size]), repeat // 4 or 1)
@@ -0,0 +1,75 @@
+import time
+
+import numpy as np
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from music.similarity import DEFAULT_MIN_SHARED, download_matrix, neighbours, stale_columns
+
+
+class Command(BaseCommand):
+    help = 'Times the similar-tracks computation on synthetic download events (no database access)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--events', type=int, default=1_000_000, help='Download events')
+        parser.add_argument('--users', type=int, default=50_000)
+        parser.add_argument('--tracks', type=int, default=20_000)
+        parser.add_argument('--new-events', type=int, default=10_000,
+                            help='Events added before the incremental run')
+        parser.add_argument('--top-k', type=int, default=settings.MUSIC_SIMILAR_TRACKS)
+        parser.add_argument('--min-shared', type=int, default=DEFAULT_MIN_SHARED)
+        parser.add_argument('--seed', type=int, default=0)
+
+    def _events(self, rng, count, options):
+        # Track popularity and user activity are both long-tailed
+        track_weights = 1 / np.arange(1, options['tracks'] + 1) ** 0.9
+        user_weights = 1 / np.arange(1, options['users'] + 1) ** 0.7
+        users = rng.choice(options['users'], size=count, p=user_weights / user_weights.sum())
+        tracks = rng.choice(options['tracks'], size=count, p=track_weights / track_weights.sum())
+        return users, tracks
+
+    def _compute(self, matrix, track_ids, columns, options):
+        """Neighbour count and k-th best score (0 below k) per computed track id"""
+        counts, thresholds = {}, {}
+        for column, others, scores in neighbours(matrix, columns, options['top_k'], options['min_shared']):
+            counts[track_ids[column]] = len(others)
+            thresholds[track_ids[column]] = scores[-1] if len(scores) == options['top_k'] else 0
+        return counts, thresholds
+
+    def handle(self, *args, **options):
+        rng = np.random.default_rng(options['seed'])
+        users, tracks = self._events(rng, options['events'], options)
+
+        started = time.perf_counter()
+        matrix, _, track_ids = download_matrix(users, tracks)
+        built = time.perf_counter()
+        counts, stored_thresholds = self._compute(matrix, track_ids, np.arange(matrix.shape[1]), options)
+        finished = time.perf_counter()
+        self.stdout.write(
+            f"{options['events']} events -> {matrix.nnz} user/track pairs, "
+            f"{matrix.shape[0]} users x {matrix.shape[1]} tracks"
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f"  full build: matrix {built - started:.2f}s + neighbours {finished - built:.2f}s "
+            f"= {finished - started:.2f}s, {sum(counts.values())} neighbour rows"
+        ))
+
+        new_users, new_tracks = self._events(rng, options['new_events'], options)
+        started = time.perf_counter()
+        matrix, user_ids, track_ids = download_matrix(
+            np.concatenate([users, new_users]), np.concatenate([tracks, new_tracks]),
+        )
+        # What the stored table would give for each track
+        thresholds = np.array([stored_thresholds.get(track_id, 0) for track_id in track_ids])
+        # Only pairs that didn't exist before change any counts
+        seen = set(zip(users.tolist(), tracks.tolist()))
+        new_pairs = np.array([pair for pair in set(zip(new_users.tolist(), new_tracks.tolist())) if pair not in seen])
+        columns = stale_columns(
+            matrix, np.searchsorted(user_ids, new_pairs[:, 0]), np.searchsorted(track_ids, new_pairs[:, 1]),
+            thresholds, options['min_shared'],
+        )
+        self._compute(matrix, track_ids, columns, options)
+        finished = time.perf_counter()
+        self.stdout.write(self.style.SUCCESS(
+            f"  incremental after {options['new_events']} new events ({len(new_pairs)} new user/track pairs): "
+            f"{len(columns)} recomputed in {finished - started:.2f}s"
+        ))
@@ -0,0 +1,127 @@
+import copy
+import os
+import shutil
+import sqlite3
+import statistics
+import tempfile
+import threading
+import time
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import OperationalError, connections, transaction
+from music.models import Album, Artist, DownloadLog, Track
+
+
+def _percentile(values, fraction):
+    if not values:
+        return float('nan')
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+class Command(BaseCommand):
+    help = 'Benchmarks concurrent track reads against download-log writes on SQLite'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--readers', type=int, default=4, help='Threads reading the track list')
+        parser.add_argument('--writers', type=int, default=2, help='Threads logging downloads')
+        parser.add_argument('--duration', type=float, default=10, help='Seconds per mode')
+
+    def handle(self, *args, **options):
+        base = copy.deepcopy(connections['default'].settings_dict)
+        if connections['default'].vendor != 'sqlite':
+            raise CommandError('The default database is not SQLite')
+
+        # Runs on a copy, so the benchmark's writes never touch real data
+        workdir = tempfile.mkdtemp(prefix='benchmark-sqlite-')
+        try:
+            modes = {
+                'defaults': {},
+                'configured': base['OPTIONS'],
+            }
+            for mode, db_options in modes.items():
+                path = os.path.join(workdir, f'{mode}.sqlite3')
+                self._copy_database(base['NAME'], path)
+                self._run(mode, {**base, 'NAME': path, 'OPTIONS': db_options}, options)
+        finally:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    def _copy_database(self, source, target):
+        with sqlite3.connect(source) as src, sqlite3.connect(target) as dst:
+            src.backup(dst)
+            # A copy made from a WAL database stays in WAL mode; start from the default
+            dst.execute('PRAGMA journal_mode=DELETE')
+
+    def _fixtures(self, alias):
+        """A user and track for the download-log rows, created in the copy if needed"""
+        user = get_user_model().objects.using(alias).order_by('pk').first()
+        if user is None:
+            user = get_user_model().objects.db_manager(alias).create_user('benchmark', password=None)
+        track = Track.objects.using(alias).order_by('pk').first()
+        if track is None:
+            artist = Artist(name='Benchmark')
+            artist.save(using=alias)
+            album = Album(title='Benchmark', artist=artist, release_date='2024-01-01')
+            album.save(using=alias)
+            track = Track(title='Benchmark', artist=artist, album=album, duration=1, file='tracks/benchmark.mp3')
+            track.save(using=alias)
+        return user.pk, track.pk
+
+    def _run(self, mode, settings_dict, options):
+        alias = f'benchmark_{mode}'
+        connections.settings[alias] = settings_dict
+        try:
+            user_id, track_id = self._fixtures(alias)
+            connections[alias].close()
+            results = {'read': [], 'write': [], 'read_errors': 0, 'write_errors': 0}
+            lock = threading.Lock()
+            deadline = time.monotonic() + options['duration']
+
+            def read():
+                list(Track.objects.using(alias).select_related('artist', 'album', 'genre').order_by('-created_at')[:20])
+
+            def write():
+                with transaction.atomic(using=alias):
+                    DownloadLog.objects.using(alias).create(user_id=user_id, track_id=track_id)
+
+            def worker(kind, operation):
+                latencies, errors = [], 0
+                try:
+                    while time.monotonic() < deadline:
+                        started = time.perf_counter()
+                        try:
+                            operation()
+                            latencies.append(time.perf_counter() - started)
+                        except OperationalError:
+                            errors += 1  # "database is locked"
+                finally:
+                    connections[alias].close()
+                with lock:
+                    results[kind].extend(latencies)
+                    results[f'{kind}_errors'] += errors
+
+            threads = (
+                [threading.Thread(target=worker, args=('read', read)) for _ in range(options['readers'])]
+                + [threading.Thread(target=worker, args=('write', write)) for _ in range(options['writers'])]
+            )
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        finally:
+            connections[alias].close()
+            del connections[alias]
+            del connections.settings[alias]
+
+        ms = 1000
+        duration = options['duration']
+        self.stdout.write(self.style.SUCCESS(f'{mode}:'))
+        for kind in ['read', 'write']:
+            latencies = results[kind]
+            mean = statistics.mean(latencies) * ms if latencies else float('nan')
+            self.stdout.write(
+                f'  {kind}s: {len(latencies) / duration:.0f}/s, {results[f"{kind}_errors"]} locked errors | '
+                f'p50 {_percentile(latencies, 0.5) * ms:.2f} ms, p99 {_percentile(latencies, 0.99) * ms:.2f} ms, '
+                f'mean {mean:.2f} ms'
+            )
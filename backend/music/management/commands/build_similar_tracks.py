@@ -0,0 +1,26 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from music.similarity import DEFAULT_MIN_SHARED, build
+
+
+class Command(BaseCommand):
+    help = 'Recomputes co-download "similar tracks" for tracks with new downloads'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--full', action='store_true',
+                            help='Recompute every track instead of only those affected by new downloads')
+        parser.add_argument('--top-k', type=int, default=settings.MUSIC_SIMILAR_TRACKS,
+                            help='Neighbours stored per track')
+        parser.add_argument('--min-shared', type=int, default=DEFAULT_MIN_SHARED,
+                            help='Users two tracks must share to count as similar')
+
+    def handle(self, *args, **options):
+        run = build(full=options['full'], k=options['top_k'], min_shared=options['min_shared'],
+                    log=self.stdout.write)
+        if run is None:
+            self.stdout.write(self.style.SUCCESS('No new downloads since the last run.'))
+            return
+        self.stdout.write(self.style.SUCCESS(
+            f'Updated similar tracks for {run.tracks_updated} tracks in {run.seconds:.1f}s '
+            f'(downloads up to #{run.last_download_id}).'
+        ))
@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from music.models import UploadSession
+from music.uploads import abort
+
+
+class Command(BaseCommand):
+    help = 'Aborts expired chunked upload sessions and deletes their partial data'
+
+    def handle(self, *args, **options):
+        expired = UploadSession.objects.filter(
+            status=UploadSession.STATUS_ACTIVE,
+            expires_at__lt=timezone.now()
+        )
+
+        count = 0
+        for session in expired:
+            try:
+                abort(session)
+                count += 1
+            except Exception as e:
+                self.stdout.write(self.style.WARNING(f'Failed to abort {session.pk}: {e}'))
+
+        self.stdout.write(self.style.SUCCESS(f'Aborted {count} expired upload session(s).'))
@@ -0,0 +1,144 @@
+from collections import Counter, defaultdict
+import hashlib
+import os
+import time
+
+from django.core.files import File
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from music.batch import worker_map
+from music.blobs import TRACKED_FIELDS
+from music.models import Album, MediaBlob, Track
+from music.storage import content_name, is_content_name, is_s3_storage, s3_key
+
+# Read size when hashing stored files
+HASH_CHUNK_SIZE = 1024 * 1024
+
+
+def _storage():
+    # Every tracked field uses the same content-addressed media storage
+    return Track._meta.get_field('file').storage
+
+
+def _hash_one(name):
+    """Hash a stored file and make sure its content-addressed copy exists (no database access)"""
+    storage = _storage()
+    try:
+        if is_content_name(name):
+            return name, name, os.path.splitext(os.path.basename(name))[0], storage.size(name), None
+        digest = hashlib.sha256()
+        size = 0
+        with storage.open(name, 'rb') as fh:
+            for chunk in iter(lambda: fh.read(HASH_CHUNK_SIZE), b''):
+                digest.update(chunk)
+                size += len(chunk)
+        sha256 = digest.hexdigest()
+        canonical = content_name(name, sha256)
+        if not storage.exists(canonical):
+            if is_s3_storage(storage):
+                # Server-side copy; the bytes don't pass through this machine
+                storage.bucket.meta.client.copy(
+                    {'Bucket': storage.bucket_name, 'Key': s3_key(storage, name)},
+                    storage.bucket_name, s3_key(storage, canonical),
+                )
+            else:
+                with storage.open(name, 'rb') as fh:
+                    content = File(fh, name)
+                    content.sha256 = sha256
+                    storage.save(name, content)
+        return name, canonical, sha256, size, None
+    except OSError as e:
+        return name, None, None, 0, str(e)
+
+
+class Command(BaseCommand):
+    help = 'Moves stored media to content-addressed names, merging identical files'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=os.cpu_count() or 1,
+                            help='Number of worker processes (1 = run inline)')
+        parser.add_argument('--batch-size', type=int, default=500,
+                            help='Number of rows written per bulk update')
+        parser.add_argument('--keep-originals', action='store_true',
+                            help='Leave the old files in storage after repointing the rows')
+
+    def handle(self, *args, **options):
+        references = []
+        for model, fields in TRACKED_FIELDS.items():
+            for field in fields:
+                rows = model.objects.exclude(**{f'{field}__isnull': True}).exclude(**{field: ''})
+                references.extend((model, field, pk, name) for pk, name in rows.values_list('pk', field))
+
+        names = sorted({name for _, _, _, name in references})
+        if not names:
+            self.stdout.write(self.style.SUCCESS('No stored media to dedupe.'))
+            return
+
+        workers = max(1, options['workers'])
+        self.stdout.write(f'Hashing {len(names)} files with {workers} worker(s)...')
+        started = time.monotonic()
+        with worker_map(_hash_one, names, workers, chunksize=8) as results:
+            results = list(results)
+
+        canonical = {}
+        blobs = {}
+        hashed_bytes = 0
+        for name, target, sha256, size, error in results:
+            if error:
+                self.stdout.write(self.style.WARNING(f'Skipped {name}: {error}'))
+                continue
+            canonical[name] = target
+            blobs[target] = (sha256, size)
+            hashed_bytes += size
+        elapsed = max(time.monotonic() - started, 1e-6)
+        self.stdout.write(
+            f'Hashed {len(canonical)} files in {elapsed:.1f}s '
+            f'({hashed_bytes / elapsed / 1024 / 1024:.2f} MB/s)'
+        )
+
+        # Repoint every row at the content-addressed name and rebuild the counts
+        counts = Counter()
+        changed = defaultdict(list)
+        for model, field, pk, name in references:
+            if name not in canonical:
+                continue
+            counts[canonical[name]] += 1
+            if canonical[name] != name:
+                obj = model(pk=pk)
+                setattr(obj, field, canonical[name])
+                changed[(model, field)].append(obj)
+
+        with transaction.atomic():
+            for (model, field), objs in changed.items():
+                model.objects.bulk_update(objs, [field], batch_size=options['batch_size'])
+            self._repoint_cover_variants(canonical)
+            MediaBlob.objects.filter(name__in=canonical.keys() - counts.keys()).delete()
+            for name, count in counts.items():
+                sha256, size = blobs[name]
+                MediaBlob.objects.update_or_create(
+                    name=name, defaults={'sha256': sha256, 'size': size, 'ref_count': count}
+                )
+
+        stale = sorted(name for name, target in canonical.items() if target != name)
+        reclaimed = sum(blobs[canonical[name]][1] for name in stale)
+        duplicates = len(canonical) - len(counts)
+        if not options['keep_originals']:
+            storage = _storage()
+            for name in stale:
+                storage.delete(name)
+
+        self.stdout.write(self.style.SUCCESS(
+            f'{len(counts)} unique files, {duplicates} duplicates merged, '
+            f'{len(stale)} files renamed ({reclaimed / 1024 / 1024:.1f} MB of old copies '
+            f'{"kept" if options["keep_originals"] else "removed"})'
+        ))
+
+    def _repoint_cover_variants(self, canonical):
+        # Variants are built from the image bytes, so they stay valid under the new name
+        albums = []
+        for album in Album.objects.exclude(cover_variants={}).only('pk', 'cover_variants'):
+            source = album.cover_variants.get('source')
+            if source in canonical and canonical[source] != source:
+                album.cover_variants['source'] = canonical[source]
+                albums.append(album)
+        Album.objects.bulk_update(albums, ['cover_variants'])
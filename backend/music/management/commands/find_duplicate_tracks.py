@@ -0,0 +1,107 @@
+import os
+import struct
+import time
+
+from botocore.exceptions import ClientError
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import F, Q
+from music.batch import Batch, Progress, worker_map
+from music.catalog import merge_tracks
+from music.fingerprints import DEFAULT_MAX_BIT_ERROR, FingerprintError, duplicate_clusters, fingerprint_file, from_bytes
+from music.models import Track, TrackFingerprint
+from music.probe import ProbeError
+
+
+def _fingerprint_one(item):
+    """Fingerprint one track file in a worker process (no database access)"""
+    pk, name = item
+    try:
+        return pk, name, fingerprint_file(name, Track._meta.get_field('file').storage), None
+    except (FingerprintError, ProbeError, struct.error, OSError, ValueError, ClientError) as e:
+        return pk, name, None, str(e)
+
+
+def _keeper(tracks):
+    """The copy to keep: highest bitrate (lossless first), then the oldest"""
+    return min(tracks, key=lambda track: (-(track.bitrate or 0), track.pk))
+
+
+class Command(BaseCommand):
+    help = 'Fingerprints track audio and reports (or merges) tracks holding the same recording'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=os.cpu_count() or 1,
+                            help='Number of worker processes (1 = run inline)')
+        parser.add_argument('--batch-size', type=int, default=100,
+                            help='Number of fingerprints written per transaction')
+        parser.add_argument('--progress-every', type=int, default=100,
+                            help='Print progress after this many tracks')
+        parser.add_argument('--refresh', action='store_true',
+                            help='Fingerprint every track again, not only new or changed files')
+        parser.add_argument('--max-bit-error', type=float, default=DEFAULT_MAX_BIT_ERROR,
+                            help='Largest share of differing fingerprint bits between duplicates')
+        parser.add_argument('--merge', action='store_true',
+                            help='Merge each group of duplicates into its best copy')
+
+    def handle(self, *args, **options):
+        queryset = Track.objects.exclude(file='')
+        if not options['refresh']:
+            queryset = queryset.filter(Q(fingerprint__isnull=True) | ~Q(fingerprint__source=F('file')))
+        items = list(queryset.order_by('pk').values_list('pk', 'file'))
+        if items:
+            self._fingerprint(items, options)
+
+        started = time.monotonic()
+        rows = list(TrackFingerprint.objects.order_by('track_id').values_list('track_id', 'data'))
+        track_ids = [pk for pk, _ in rows]
+        clusters = duplicate_clusters([from_bytes(data) for _, data in rows], options['max_bit_error'])
+        self.stdout.write(
+            f'Compared {len(rows)} fingerprints in {time.monotonic() - started:.1f}s: '
+            f'{len(clusters)} groups of duplicates'
+        )
+
+        merged = 0
+        for cluster in clusters:
+            tracks = Track.objects.in_bulk([track_ids[i] for i in cluster])
+            keeper = _keeper(tracks.values())
+            self.stdout.write(f'  {keeper.pk} "{keeper.title}" ({keeper.file.name}, {keeper.bitrate or "?"} bps)')
+            for track in sorted(tracks.values(), key=lambda track: track.pk):
+                if track.pk != keeper.pk:
+                    self.stdout.write(f'    = {track.pk} "{track.title}" ({track.file.name}, {track.bitrate or "?"} bps)')
+            if options['merge']:
+                merged += merge_tracks(keeper, tracks.values())
+
+        if options['merge']:
+            self.stdout.write(self.style.SUCCESS(
+                f'Merged {merged} duplicate tracks; run build_similar_tracks --full to rescore the kept copies'
+            ))
+        elif clusters:
+            duplicates = sum(len(cluster) - 1 for cluster in clusters)
+            self.stdout.write(self.style.SUCCESS(f'{duplicates} duplicate tracks; rerun with --merge to merge them'))
+        else:
+            self.stdout.write(self.style.SUCCESS('No duplicate tracks found.'))
+
+    def _fingerprint(self, items, options):
+        workers = max(1, options['workers'])
+        total = len(items)
+        self.stdout.write(f'Fingerprinting {total} tracks with {workers} worker(s)...')
+        progress = Progress(total, options['progress_every'])
+
+        failed = 0
+        with worker_map(_fingerprint_one, items, workers, chunksize=4) as results, \
+                Batch(self._flush, options['batch_size']) as pending:
+            for pk, name, data, error in results:
+                if data is None:
+                    failed += 1
+                    self.stdout.write(self.style.WARNING(f'Failed: {name} ({error})'))
+                else:
+                    pending.add(TrackFingerprint(track_id=pk, source=name, data=data))
+                if progress.step():
+                    self.stdout.write(f'[{progress.done}/{total}] {progress.rate:.1f} tracks/s')
+        self.stdout.write(f'Fingerprinted {progress.done - failed} tracks ({failed} failed)')
+
+    def _flush(self, fingerprints):
+        with transaction.atomic():
+            TrackFingerprint.objects.filter(track_id__in=[fp.track_id for fp in fingerprints]).delete()
+            TrackFingerprint.objects.bulk_create(fingerprints)
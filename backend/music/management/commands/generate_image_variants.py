@@ -0,0 +1,86 @@
+from collections import Counter
+import os
+import time
+
+from django.core.management.base import BaseCommand
+from music.batch import Batch, worker_map
+from music.images import IMAGE_FIELDS, ImageVariantError, build_variants, delete_variants, variants_are_current
+from music.models import Album, Artist
+
+MODELS = {'album': Album, 'artist': Artist}
+
+
+def _variants_one(item):
+    """Render one image's variants in a worker process (no database access)"""
+    model, pk, name, old = item
+    image_field, _ = IMAGE_FIELDS[model]
+    storage = MODELS[model]._meta.get_field(image_field).storage
+    try:
+        if old.get('sizes'):
+            delete_variants(old)
+        return model, pk, {'source': name, 'sizes': build_variants(name, storage)}, None
+    except ImageVariantError as e:
+        # Recorded, so a broken image isn't picked up again
+        return model, pk, {'source': name, 'sizes': {}}, str(e)
+    except OSError as e:
+        return model, pk, None, str(e)
+
+
+class Command(BaseCommand):
+    help = 'Generates resized variants for album covers and artist images'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--all', action='store_true',
+                            help='Regenerate variants that are already up to date')
+        parser.add_argument('--workers', type=int, default=os.cpu_count() or 1,
+                            help='Number of worker processes (1 = run inline)')
+        parser.add_argument('--batch-size', type=int, default=100,
+                            help='Number of rows written per bulk update')
+
+    def handle(self, *args, **options):
+        items = []
+        for model, (image_field, variants_field) in IMAGE_FIELDS.items():
+            queryset = MODELS[model].objects.exclude(**{f'{image_field}__isnull': True}).exclude(**{image_field: ''})
+            objs = list(queryset.order_by('pk').only('pk', image_field, variants_field))
+            # Identical images share one stored file, so their old variants must be kept
+            sources = Counter((getattr(obj, variants_field) or {}).get('source') for obj in objs)
+            for obj in objs:
+                variants = getattr(obj, variants_field) or {}
+                if options['all'] or not variants_are_current(getattr(obj, image_field), variants):
+                    old = variants if sources[variants.get('source')] == 1 else {}
+                    items.append((model, obj.pk, getattr(obj, image_field).name, old))
+
+        if not items:
+            self.stdout.write(self.style.SUCCESS('All images already have up to date variants.'))
+            return
+
+        workers = max(1, options['workers'])
+        total = len(items)
+        self.stdout.write(f'Generating variants for {total} images with {workers} worker(s)...')
+        started = time.monotonic()
+
+        done = failed = 0
+        with worker_map(_variants_one, items, workers, chunksize=4) as results, \
+                Batch(self._flush, options['batch_size']) as pending:
+            for model, pk, variants, error in results:
+                done += 1
+                if error:
+                    failed += 1
+                    self.stdout.write(self.style.WARNING(f'Failed: {model} {pk} ({error})'))
+                if variants is None:
+                    continue
+                obj = MODELS[model](pk=pk)
+                setattr(obj, IMAGE_FIELDS[model][1], variants)
+                pending.add(obj)
+
+        elapsed = time.monotonic() - started
+        self.stdout.write(self.style.SUCCESS(
+            f'Generated variants for {done - failed} images ({failed} failed) in {elapsed:.1f}s '
+            f'({done / max(elapsed, 1e-6):.1f} images/s)'
+        ))
+
+    def _flush(self, objs):
+        for name, model in MODELS.items():
+            rows = [obj for obj in objs if isinstance(obj, model)]
+            if rows:
+                model.objects.bulk_update(rows, [IMAGE_FIELDS[name][1]])
@@ -0,0 +1,84 @@
+import os
+import struct
+
+from botocore.exceptions import ClientError
+from django.core.management.base import BaseCommand
+from django.db.models import Q
+from music.batch import Batch, Progress, worker_map
+from music.blobs import acquire
+from music.models import Track
+from music.previews import PreviewError, build_preview
+from music.probe import ProbeError
+
+
+def _preview_one(item):
+    """Build and store one preview clip in a worker process (no database access)"""
+    pk, name = item
+    source_storage = Track._meta.get_field('file').storage
+    target_storage = Track._meta.get_field('preview_file').storage
+    try:
+        preview_name, size = build_preview(name, source_storage, target_storage)
+        return pk, preview_name, size, None
+    except (PreviewError, ProbeError, struct.error, OSError, ClientError) as e:
+        return pk, None, 0, str(e)
+
+
+class Command(BaseCommand):
+    help = 'Generates preview clips for tracks that do not have one'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=os.cpu_count() or 1,
+                            help='Number of worker processes (1 = run inline)')
+        parser.add_argument('--limit', type=int, default=None,
+                            help='Only process this many tracks')
+        parser.add_argument('--batch-size', type=int, default=100,
+                            help='Number of tracks written per bulk update')
+        parser.add_argument('--progress-every', type=int, default=25,
+                            help='Print progress after this many tracks')
+
+    def handle(self, *args, **options):
+        queryset = Track.objects.exclude(file='').filter(
+            Q(preview_file__isnull=True) | Q(preview_file='')
+        )
+        items = list(queryset.order_by('pk').values_list('pk', 'file'))
+        if options['limit']:
+            items = items[:options['limit']]
+
+        if not items:
+            self.stdout.write(self.style.SUCCESS('All tracks already have previews.'))
+            return
+
+        workers = max(1, options['workers'])
+        total = len(items)
+        self.stdout.write(f'Generating {total} previews with {workers} worker(s)...')
+        progress = Progress(total, options['progress_every'])
+
+        tracks = Track.objects.in_bulk([pk for pk, _ in items])
+        failed = total_bytes = 0
+        with worker_map(_preview_one, items, workers, chunksize=4) as results, \
+                Batch(self._flush, options['batch_size']) as pending:
+            for pk, preview_name, size, error in results:
+                track = tracks[pk]
+                if preview_name is None:
+                    failed += 1
+                    self.stdout.write(self.style.WARNING(f'Failed: {track.file.name} ({error})'))
+                else:
+                    track.preview_file.name = preview_name
+                    pending.add(track)
+                    total_bytes += size
+
+                if progress.step():
+                    self.stdout.write(
+                        f'[{progress.done}/{total}] {progress.rate:.1f} tracks/s, '
+                        f'{total_bytes / progress.elapsed / 1024 / 1024:.2f} MB/s written'
+                    )
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Generated {progress.done - failed} previews ({failed} failed) in {progress.elapsed:.1f}s'
+        ))
+
+    def _flush(self, tracks):
+        Track.objects.bulk_update(tracks, ['preview_file'])
+        # bulk_update skips the signals that count file references
+        for track in tracks:
+            acquire(track.preview_file.name)
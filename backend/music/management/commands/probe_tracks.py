@@ -0,0 +1,67 @@
+import os
+import struct
+import time
+
+from botocore.exceptions import ClientError
+from django.core.management.base import BaseCommand
+from music.batch import Batch, worker_map
+from music.models import Track
+from music.probe import ProbeError, probe_storage_file
+
+
+def _probe_one(item):
+    """Probe a single track file in a worker process (no database access)"""
+    pk, name = item
+    storage = Track._meta.get_field('file').storage
+    try:
+        return pk, probe_storage_file(name, storage), None
+    except (ProbeError, struct.error, OSError, ClientError) as e:
+        return pk, None, str(e)
+
+
+class Command(BaseCommand):
+    help = 'Reads duration, sample rate and bitrate from track file headers'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--all', action='store_true',
+                            help='Re-probe tracks that were already probed')
+        parser.add_argument('--workers', type=int, default=os.cpu_count() or 1,
+                            help='Number of worker processes (1 = run inline)')
+        parser.add_argument('--batch-size', type=int, default=200,
+                            help='Number of tracks written per bulk update')
+
+    def handle(self, *args, **options):
+        queryset = Track.objects.exclude(file='')
+        if not options['all']:
+            queryset = queryset.filter(probed_at__isnull=True)
+        items = list(queryset.order_by('pk').values_list('pk', 'file'))
+
+        if not items:
+            self.stdout.write(self.style.SUCCESS('No tracks to probe.'))
+            return
+
+        workers = max(1, options['workers'])
+        self.stdout.write(f'Probing {len(items)} tracks with {workers} worker(s)...')
+        started = time.monotonic()
+
+        tracks = Track.objects.in_bulk([pk for pk, _ in items])
+        probed = failed = 0
+        with worker_map(_probe_one, items, workers, chunksize=8) as results, \
+                Batch(self._flush, options['batch_size']) as pending:
+            for pk, info, error in results:
+                track = tracks[pk]
+                if info is None:
+                    failed += 1
+                    self.stdout.write(self.style.WARNING(f'Failed: {track.file.name} ({error})'))
+                    continue
+
+                track.apply_audio_info(info)
+                pending.add(track)
+                probed += 1
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Probed {probed} tracks ({failed} failed) in {time.monotonic() - started:.1f}s'
+        ))
+
+    def _flush(self, tracks):
+        Track.objects.bulk_update(tracks, ['duration', 'sample_rate', 'bitrate', 'probed_at'])
@@ -0,0 +1,10 @@
+from django.core.management.base import BaseCommand
+from music.genres import recount
+
+
+class Command(BaseCommand):
+    help = 'Recomputes the per-genre track counters from the tracks table'
+
+    def handle(self, *args, **options):
+        updated = recount()
+        self.stdout.write(self.style.SUCCESS(f'Recounted tracks for {updated} genres.'))
@@ -0,0 +1,54 @@
+import signal
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+from music.models import Job
+from music.jobs import DEFAULT_VISIBILITY_TIMEOUT, claim_next, run_job, worker_name
+
+
+class Command(BaseCommand):
+    help = 'Runs queued background jobs (cover downloads, probing, previews)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true',
+                            help='Exit when the queue is empty instead of polling')
+        parser.add_argument('--poll-interval', type=float, default=2.0,
+                            help='Seconds to wait between polls when the queue is empty')
+        parser.add_argument('--visibility-timeout', type=int, default=DEFAULT_VISIBILITY_TIMEOUT,
+                            help='Seconds a claimed job stays hidden from other workers')
+        parser.add_argument('--kind', action='append', dest='kinds',
+                            help='Only run jobs of this kind (repeatable)')
+
+    def handle(self, *args, **options):
+        self.stopping = False
+        signal.signal(signal.SIGTERM, self._stop)
+        signal.signal(signal.SIGINT, self._stop)
+
+        worker = worker_name()
+        self.stdout.write(f'Job worker {worker} started')
+        processed = 0
+
+        while not self.stopping:
+            close_old_connections()
+            job = claim_next(worker, options['visibility_timeout'], options['kinds'])
+            if job is None:
+                if options['once']:
+                    break
+                time.sleep(options['poll_interval'])
+                continue
+
+            started = time.monotonic()
+            status = run_job(job)
+            processed += 1
+            elapsed = time.monotonic() - started
+            style = self.style.SUCCESS if status == Job.STATUS_DONE else self.style.WARNING
+            self.stdout.write(style(
+                f'{job.kind} #{job.pk}: {status} (attempt {job.attempts}, {elapsed:.2f}s)'
+            ))
+
+        self.stdout.write(f'Job worker {worker} stopped after {processed} job(s)')
+
+    def _stop(self, signum, frame):
+        # Finish the current job, then exit
+        self.stopping = True
@@ -1,9 +1,12 @@
 from django.core.management.base import BaseCommand
 from django.conf import settings
-from music.models import Track, Artist, Album
+from music.catalog import CatalogResolver
+from music.models import Track
+from music.probe import ProbeError, probe_storage_file
 import boto3
 from botocore.config import Config
 import os
+import struct
 from urllib.parse import unquote
 
 class Command(BaseCommand):
@@ -33,12 +36,10 @@ class Command(BaseCommand):
         restored = 0
 
         # Create a default artist/album for recovered tracks if needed
-        unknown_artist, _ = Artist.objects.get_or_create(name="Unknown Artist")
-        unknown_album, _ = Album.objects.get_or_create(
-            title="Recovered Album", 
-            artist=unknown_artist,
-            defaults={'release_date': '2025-01-01'}
-        )
+        # Remembers artists already resolved, as many files share one
+        resolver = CatalogResolver()
+        unknown_artist = resolver.artist("Unknown Artist")
+        unknown_album = resolver.album(unknown_artist, "Recovered Album", '2025-01-01')
 
         for page in pages:
             if 'Contents' not in page:
@@ -75,7 +76,7 @@ class Command(BaseCommand):
                     parts = name_without_ext.split(' - ', 1)
                     artist_name = parts[0].strip()
                     title = parts[1].strip()
-                    artist, _ = Artist.objects.get_or_create(name=artist_name)
+                    artist = resolver.artist(artist_name)
                 
                 # Create Track
                 # Note: We need to set the file path relative to the media root (bucket root)
@@ -86,13 +87,19 @@ class Command(BaseCommand):
                 if key.startswith('media/'):
                     relative_path = key[6:] # remove 'media/'
                 
-                Track.objects.create(
+                track = Track(
                     title=title,
                     artist=artist,
                     album=unknown_album,
                     file=relative_path,
-                    duration=180 # Default duration
+                    duration=0
                 )
+                # Read the real duration from the object headers (ranged GETs)
+                try:
+                    track.apply_audio_info(probe_storage_file(relative_path, track.file.storage))
+                except (ProbeError, struct.error, OSError) as e:
+                    self.stdout.write(self.style.WARNING(f'Could not probe {filename}: {e}'))
+                track.save()
                 
                 self.stdout.write(self.style.SUCCESS(f'Restored: {title}'))
                 restored += 1
@@ -0,0 +1,225 @@
+"""Read-through disk cache for media stored on S3.
+
+Enabled by setting ``MUSIC_MEDIA_CACHE_DIR``. The S3 media storage
+(music.storage.ContentAddressedS3Storage) then opens files from the cache,
+downloading them on a miss, so popular tracks are fetched from S3 once per
+server instead of on every download. Local file handles also let
+``FileResponse`` hand the bytes to the web server with ``sendfile``.
+
+- Fills are atomic: objects are downloaded to a temp file in the cache
+  directory and renamed into place, so readers never see partial files.
+- Concurrent misses for the same file are collapsed into one download, by a
+  lock per file within a process and a striped ``flock`` across processes.
+- The cache is capped at ``MUSIC_MEDIA_CACHE_MAX_BYTES``. Hits refresh a
+  file's mtime, and eviction removes the least recently used files.
+
+Hit/miss counters are kept in Django's cache, so they cover all worker
+processes when a shared cache backend is configured.
+"""
+from contextlib import contextmanager
+import hashlib
+import logging
+import os
+import tempfile
+import threading
+import time
+import weakref
+
+from django.conf import settings
+from django.core.cache import cache
+
+try:
+    import fcntl
+except ImportError:  # Windows: only in-process deduplication
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+# Eviction trims the cache to this fraction of the cap, so it runs in batches
+LOW_WATERMARK = 0.9
+# Leftover partial downloads older than this are removed during eviction
+STALE_FILL_SECONDS = 60 * 60
+STATS = ['hits', 'misses', 'bytes_served', 'bytes_fetched', 'evictions']
+
+
+class _KeyLock:
+    def __init__(self):
+        self.lock = threading.Lock()
+
+
+class MediaCache:
+    def __init__(self, directory, max_bytes):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._key_locks = weakref.WeakValueDictionary()
+        self._key_locks_guard = threading.Lock()
+        # This process's estimate of the cache size; None until the first scan
+        self._approx_bytes = None
+        os.makedirs(os.path.join(directory, 'locks'), exist_ok=True)
+
+    def path_for(self, name):
+        key = hashlib.sha256(name.encode()).hexdigest()
+        return os.path.join(self.directory, key[:2], key + os.path.splitext(name)[1])
+
+    def open(self, name, fill):
+        """Open the cached copy of ``name``, calling ``fill(fileobj)`` to download it on a miss"""
+        path = self.path_for(name)
+        handle = self._open_hit(path)
+        if handle is None:
+            with self._single_flight(path):
+                # Another thread or process may have filled it while we waited
+                handle = self._open_hit(path)
+                if handle is None:
+                    self._fill(path, fill)
+                    handle = open(path, 'rb')
+                    _count('misses')
+                    _count('bytes_fetched', os.fstat(handle.fileno()).st_size)
+                    return handle
+        _count('hits')
+        _count('bytes_served', os.fstat(handle.fileno()).st_size)
+        return handle
+
+    def _open_hit(self, path):
+        try:
+            handle = open(path, 'rb')
+        except FileNotFoundError:
+            return None
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            pass  # evicted just now; the open handle still reads fine
+        return handle
+
+    @contextmanager
+    def _single_flight(self, path):
+        with self._key_locks_guard:
+            key_lock = self._key_locks.get(path)
+            if key_lock is None:
+                key_lock = self._key_locks[path] = _KeyLock()
+        with key_lock.lock:
+            if fcntl is None:
+                yield
+                return
+            # Striped by file name so the number of lock files stays bounded
+            stripe = os.path.basename(path)[:3]
+            with open(os.path.join(self.directory, 'locks', f'{stripe}.lock'), 'a') as lock_file:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+                try:
+                    yield
+                finally:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _fill(self, path, fill):
+        directory = os.path.dirname(path)
+        os.makedirs(directory, exist_ok=True)
+        started = time.monotonic()
+        fd, temp_path = tempfile.mkstemp(dir=directory, prefix='.fill-')
+        try:
+            with os.fdopen(fd, 'wb') as out:
+                fill(out)
+            os.replace(temp_path, path)
+        except BaseException:
+            os.remove(temp_path)
+            raise
+        size = os.path.getsize(path)
+        logger.info(f"Cached {path} ({size} bytes in {time.monotonic() - started:.2f}s)")
+
+        if self._approx_bytes is not None:
+            self._approx_bytes += size
+        if self._approx_bytes is None or self._approx_bytes > self.max_bytes:
+            self.evict()
+
+    def _entries(self):
+        for sub in os.scandir(self.directory):
+            if not sub.is_dir() or sub.name == 'locks':
+                continue
+            for entry in os.scandir(sub.path):
+                try:
+                    yield entry, entry.stat()
+                except FileNotFoundError:
+                    continue
+
+    def evict(self):
+        """Remove least recently used files until the cache is under its low watermark"""
+        now = time.time()
+        entries = []
+        total = 0
+        for entry, stat in self._entries():
+            if entry.name.startswith('.fill-'):
+                if now - stat.st_mtime > STALE_FILL_SECONDS:
+                    _remove(entry.path)
+                continue
+            entries.append((stat.st_mtime, stat.st_size, entry.path))
+            total += stat.st_size
+
+        evicted = 0
+        if total > self.max_bytes:
+            target = self.max_bytes * LOW_WATERMARK
+            for _mtime, size, path in sorted(entries):
+                if total <= target:
+                    break
+                if _remove(path):
+                    total -= size
+                    evicted += 1
+            _count('evictions', evicted)
+            logger.info(f"Evicted {evicted} files from the media cache ({total} bytes left)")
+        self._approx_bytes = total
+        return evicted
+
+    def usage(self):
+        files = size = 0
+        for entry, stat in self._entries():
+            if not entry.name.startswith('.fill-'):
+                files += 1
+                size += stat.st_size
+        return files, size
+
+
+def _remove(path):
+    try:
+        os.remove(path)
+        return True
+    except FileNotFoundError:
+        return False
+
+
+def _count(stat, amount=1):
+    key = f'mediacache:{stat}'
+    try:
+        cache.incr(key, amount)
+    except ValueError:
+        if not cache.add(key, amount, timeout=None):
+            cache.incr(key, amount)
+
+
+_media_cache = None
+_media_cache_guard = threading.Lock()
+
+
+def get_media_cache():
+    """The configured MediaCache, or None if caching is disabled"""
+    global _media_cache
+    if not settings.MUSIC_MEDIA_CACHE_DIR:
+        return None
+    with _media_cache_guard:
+        if _media_cache is None:
+            _media_cache = MediaCache(settings.MUSIC_MEDIA_CACHE_DIR, settings.MUSIC_MEDIA_CACHE_MAX_BYTES)
+        return _media_cache
+
+
+def cache_stats():
+    """Counters and disk usage for monitoring"""
+    media_cache = get_media_cache()
+    if media_cache is None:
+        return {'enabled': False}
+    stats = {stat: cache.get(f'mediacache:{stat}', 0) for stat in STATS}
+    lookups = stats['hits'] + stats['misses']
+    files, size = media_cache.usage()
+    return {
+        'enabled': True,
+        **stats,
+        'hit_ratio': round(stats['hits'] / lookups, 4) if lookups else None,
+        'files': files,
+        'disk_bytes': size,
+        'max_bytes': media_cache.max_bytes,
+    }
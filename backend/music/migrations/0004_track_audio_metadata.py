@@ -0,0 +1,28 @@
+# Generated by Django 5.2.18 on 2026-10-19 17:03
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('music', '0003_track_genre'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='track',
+            name='bitrate',
+            field=models.PositiveIntegerField(blank=True, help_text='Average bitrate in bits per second', null=True),
+        ),
+        migrations.AddField(
+            model_name='track',
+            name='probed_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='track',
+            name='sample_rate',
+            field=models.PositiveIntegerField(blank=True, help_text='Sample rate in Hz', null=True),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-19 17:13
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('music', '0006_uploadsession'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='uploadsession',
+            name='part_checksums',
+            field=models.JSONField(blank=True, default=list),
+        ),
+        migrations.AlterField(
+            model_name='uploadsession',
+            name='backend',
+            field=models.CharField(choices=[('local', 'Local temp file'), ('s3', 'S3 multipart upload'), ('s3_direct', 'S3 direct (presigned) multipart upload')], max_length=20),
+        ),
+    ]
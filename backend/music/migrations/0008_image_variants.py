@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-19 17:16
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('music', '0007_uploadsession_direct'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='album',
+            name='cover_variants',
+            field=models.JSONField(blank=True, default=dict),
+        ),
+        migrations.AddField(
+            model_name='artist',
+            name='image_variants',
+            field=models.JSONField(blank=True, default=dict),
+        ),
+    ]
@@ -0,0 +1,40 @@
+# Generated by Django 5.2.18 on 2026-10-19 17:19
+
+import music.storage
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('music', '0008_image_variants'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MediaBlob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=500, unique=True)),
+                ('sha256', models.CharField(blank=True, db_index=True, max_length=64)),
+                ('size', models.BigIntegerField(blank=True, null=True)),
+                ('ref_count', models.PositiveIntegerField(default=0)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.AlterField(
+            model_name='album',
+            name='cover_image',
+            field=models.ImageField(blank=True, null=True, storage=music.storage.media_storage, upload_to='albums/'),
+        ),
+        migrations.AlterField(
+            model_name='track',
+            name='file',
+            field=models.FileField(storage=music.storage.media_storage, upload_to='tracks/'),
+        ),
+        migrations.AlterField(
+            model_name='track',
+            name='preview_file',
+            field=models.FileField(blank=True, null=True, storage=music.storage.media_storage, upload_to='previews/'),
+        ),
+    ]
@@ -0,0 +1,93 @@
+"""Fill the name keys and merge artists and albums that share one.
+
+Rows differing only in case, width or spacing were created as separate
+artists/albums by the old get_or_create lookups. The oldest row of each group
+is kept; albums and tracks are moved onto it, and it takes over a bio, image
+or cover it lacks from the rows being removed. Media reference counts aren't
+touched here; run ``manage.py dedupe_media`` afterwards to rebuild them.
+"""
+from django.db import migrations
+from django.db.models import Case, Count, Min, Value, When
+
+from music.normalize import name_key
+
+BATCH_SIZE = 1000
+
+
+def _fill_keys(db, model, source, key):
+    batch = []
+    for obj in model.objects.using(db).only('pk', source).iterator(chunk_size=BATCH_SIZE):
+        setattr(obj, key, name_key(getattr(obj, source)))
+        batch.append(obj)
+        if len(batch) >= BATCH_SIZE:
+            model.objects.using(db).bulk_update(batch, [key])
+            batch = []
+    model.objects.using(db).bulk_update(batch, [key])
+
+
+def _repoint(db, model, field, survivors):
+    """Point ``field`` of every row referencing a duplicate at its survivor"""
+    if survivors:
+        model.objects.using(db).filter(**{f'{field}__in': list(survivors)}).update(**{field: Case(
+            *[When(**{field: duplicate}, then=Value(survivor)) for duplicate, survivor in survivors.items()]
+        )})
+
+
+def _merge(db, model, group_fields, copy_fields, references):
+    groups = (
+        model.objects.using(db).values(*group_fields)
+        .annotate(rows=Count('pk'), survivor=Min('pk'))
+        .filter(rows__gt=1)
+        .order_by()
+    )
+    pending = []
+    for group in groups.iterator():
+        pending.append(group)
+        if len(pending) >= BATCH_SIZE:
+            _merge_groups(db, model, group_fields, copy_fields, references, pending)
+            pending = []
+    _merge_groups(db, model, group_fields, copy_fields, references, pending)
+
+
+def _merge_groups(db, model, group_fields, copy_fields, references, groups):
+    survivors = {}
+    for group in groups:
+        rows = list(model.objects.using(db).filter(**{field: group[field] for field in group_fields}).order_by('pk'))
+        keeper, duplicates = rows[0], rows[1:]
+        changed = []
+        for field in copy_fields:
+            if not getattr(keeper, field):
+                value = next((getattr(dup, field) for dup in duplicates if getattr(dup, field)), None)
+                if value:
+                    setattr(keeper, field, value)
+                    changed.append(field)
+        if changed:
+            keeper.save(update_fields=changed)
+        survivors.update((dup.pk, keeper.pk) for dup in duplicates)
+    for ref_model, field in references:
+        _repoint(db, ref_model, field, survivors)
+    model.objects.using(db).filter(pk__in=list(survivors)).delete()
+
+
+def merge_duplicates(apps, schema_editor):
+    Artist = apps.get_model('music', 'Artist')
+    Album = apps.get_model('music', 'Album')
+    Track = apps.get_model('music', 'Track')
+    db = schema_editor.connection.alias
+
+    _fill_keys(db, Artist, 'name', 'name_key')
+    _merge(db, Artist, ['name_key'], ['bio', 'image'], [(Album, 'artist'), (Track, 'artist')])
+    # Albums of merged artists may now collide too, so this runs second
+    _fill_keys(db, Album, 'title', 'title_key')
+    _merge(db, Album, ['artist', 'title_key'], ['cover_image'], [(Track, 'album')])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('music', '0011_name_keys'),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_duplicates, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,22 @@
+# Generated by Django 5.2.18 on 2026-10-19 18:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('music', '0012_merge_duplicate_names'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='artist',
+            name='name_key',
+            field=models.CharField(editable=False, max_length=255, unique=True),
+        ),
+        migrations.AddConstraint(
+            model_name='album',
+            constraint=models.UniqueConstraint(fields=('artist', 'title_key'), name='unique_album_title_per_artist'),
+        ),
+    ]
@@ -0,0 +1,48 @@
+"""Create a Genre for each distinct track genre and point the tracks at it.
+
+Spellings with the same genre_key share one Genre, named after the most
+common spelling (preferring Title Case). Empty and placeholder genres ('Unknown') become NULL.
+"""
+from collections import Counter, defaultdict
+
+from django.db import migrations
+from django.db.models import Count
+
+from music.normalize import genre_key
+
+
+def link_genres(apps, schema_editor):
+    Genre = apps.get_model('music', 'Genre')
+    Track = apps.get_model('music', 'Track')
+    db = schema_editor.connection.alias
+
+    spellings = defaultdict(Counter)
+    for value, tracks in Track.objects.using(db).values_list('genre').annotate(tracks=Count('pk')).order_by():
+        key = genre_key(value)
+        if key:
+            spellings[key][value] += tracks
+
+    for key, counts in spellings.items():
+        # Ties go to a Title Case spelling
+        name = max(counts, key=lambda value: (counts[value], value.strip().istitle()))
+        genre = Genre.objects.using(db).create(name=' '.join(name.split()), key=key, track_count=sum(counts.values()))
+        Track.objects.using(db).filter(genre__in=list(counts)).update(genre_ref=genre)
+
+
+def unlink_genres(apps, schema_editor):
+    Genre = apps.get_model('music', 'Genre')
+    Track = apps.get_model('music', 'Track')
+    db = schema_editor.connection.alias
+    for genre in Genre.objects.using(db):
+        Track.objects.using(db).filter(genre_ref=genre).update(genre=genre.name)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('music', '0014_genre'),
+    ]
+
+    operations = [
+        migrations.RunPython(link_genres, unlink_genres),
+    ]
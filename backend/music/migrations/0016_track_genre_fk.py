@@ -0,0 +1,28 @@
+# Generated by Django 5.2.18 on 2026-10-19 19:05
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('music', '0015_track_genres'),
+    ]
+
+    operations = [
+        migrations.RemoveField(
+            model_name='track',
+            name='genre',
+        ),
+        migrations.RenameField(
+            model_name='track',
+            old_name='genre_ref',
+            new_name='genre',
+        ),
+        migrations.AlterField(
+            model_name='track',
+            name='genre',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='tracks', to='music.genre'),
+        ),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 5.2.18 on 2026-10-19 17:51
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('music', '0017_playlists'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SimilarTracksRun',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('last_download_id', models.BigIntegerField()),
+                ('full', models.BooleanField(default=False)),
+                ('tracks_updated', models.PositiveIntegerField(default=0)),
+                ('seconds', models.FloatField()),
+                ('finished_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='SimilarTrack',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('score', models.FloatField()),
+                ('similar', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='music.track')),
+                ('track', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='music.track')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('track', 'similar'), name='unique_similar_track')],
+            },
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-19 17:58
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('music', '0018_similar_tracks'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TrackFingerprint',
+            fields=[
+                ('track', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='fingerprint', serialize=False, to='music.track')),
+                ('source', models.CharField(max_length=255)),
+                ('data', models.BinaryField()),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+    ]
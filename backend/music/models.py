@@ -1,36 +1,92 @@
+import uuid
+
 from django.db import models
 from django.conf import settings
+from django.utils import timezone
+
+from .normalize import genre_key, name_key
+from .storage import media_storage
 
 class Artist(models.Model):
     name = models.CharField(max_length=255)
+    # name_key(name); unique so concurrent uploads can't create duplicates
+    name_key = models.CharField(max_length=255, unique=True, editable=False)
     bio = models.TextField(blank=True)
     image = models.ImageField(upload_to='artists/', blank=True, null=True)
+    # Resized copies of the image (see music.images)
+    image_variants = models.JSONField(default=dict, blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
 
     def __str__(self):
         return self.name
 
+    def save(self, *args, **kwargs):
+        self.name_key = name_key(self.name)
+        super().save(*args, **kwargs)
+
 class Album(models.Model):
     title = models.CharField(max_length=255)
+    title_key = models.CharField(max_length=255, editable=False)
     artist = models.ForeignKey(Artist, on_delete=models.CASCADE, related_name='albums')
     release_date = models.DateField()
-    cover_image = models.ImageField(upload_to='albums/', blank=True, null=True)
+    cover_image = models.ImageField(upload_to='albums/', storage=media_storage, blank=True, null=True)
+    # Resized copies of the cover (see music.images)
+    cover_variants = models.JSONField(default=dict, blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['artist', 'title_key'], name='unique_album_title_per_artist'),
+        ]
 
     def __str__(self):
         return self.title
 
+    def save(self, *args, **kwargs):
+        self.title_key = name_key(self.title)
+        super().save(*args, **kwargs)
+
+class Genre(models.Model):
+    name = models.CharField(max_length=100)
+    # genre_key(name); tracks are filtered on this
+    key = models.CharField(max_length=100, unique=True, editable=False)
+    # Maintained by music.genres as tracks are saved and deleted
+    track_count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        ordering = ['name']
+
+    def __str__(self):
+        return self.name
+
+    def save(self, *args, **kwargs):
+        self.key = genre_key(self.name)
+        super().save(*args, **kwargs)
+
 class Track(models.Model):
     title = models.CharField(max_length=255)
     album = models.ForeignKey(Album, on_delete=models.CASCADE, related_name='tracks')
     artist = models.ForeignKey(Artist, on_delete=models.CASCADE, related_name='tracks')
-    file = models.FileField(upload_to='tracks/')
-    preview_file = models.FileField(upload_to='previews/', blank=True, null=True)
+    file = models.FileField(upload_to='tracks/', storage=media_storage)
+    preview_file = models.FileField(upload_to='previews/', storage=media_storage, blank=True, null=True)
     duration = models.PositiveIntegerField(help_text="Duration in seconds")
-    genre = models.CharField(max_length=100, blank=True, default='')
+    sample_rate = models.PositiveIntegerField(null=True, blank=True, help_text="Sample rate in Hz")
+    bitrate = models.PositiveIntegerField(null=True, blank=True, help_text="Average bitrate in bits per second")
+    probed_at = models.DateTimeField(null=True, blank=True)
+    genre = models.ForeignKey(Genre, on_delete=models.SET_NULL, null=True, blank=True, related_name='tracks')
     created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
 
     def __str__(self):
         return self.title
 
+    def apply_audio_info(self, info):
+        """Copy probed stream properties (see music.probe) onto the track"""
+        self.duration = info.duration_seconds
+        self.sample_rate = info.sample_rate
+        self.bitrate = info.bitrate
+        self.probed_at = timezone.now()
+
 class DownloadLog(models.Model):
     user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='downloads')
     track = models.ForeignKey(Track, on_delete=models.CASCADE, related_name='downloads')
@@ -38,3 +94,179 @@ class DownloadLog(models.Model):
 
     def __str__(self):
         return f"{self.user.username} downloaded {self.track.title}"
+
+class Job(models.Model):
+    """A unit of background work, executed by `manage.py run_jobs` (see music.jobs)"""
+    STATUS_QUEUED = 'queued'
+    STATUS_RUNNING = 'running'
+    STATUS_DONE = 'done'
+    STATUS_FAILED = 'failed'
+    STATUS_CHOICES = [
+        (STATUS_QUEUED, 'Queued'),
+        (STATUS_RUNNING, 'Running'),
+        (STATUS_DONE, 'Done'),
+        (STATUS_FAILED, 'Failed'),
+    ]
+
+    kind = models.CharField(max_length=100)
+    payload = models.JSONField(default=dict, blank=True)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default=STATUS_QUEUED)
+    attempts = models.PositiveIntegerField(default=0)
+    max_attempts = models.PositiveIntegerField(default=5)
+    run_after = models.DateTimeField(default=timezone.now)
+    # While running, the job is invisible to other workers until locked_until;
+    # a worker that dies mid-job lets it become claimable again.
+    locked_until = models.DateTimeField(null=True, blank=True)
+    locked_by = models.CharField(max_length=100, blank=True)
+    last_error = models.TextField(blank=True)
+    result = models.JSONField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'run_after']),
+        ]
+
+    def __str__(self):
+        return f"{self.kind} #{self.pk} ({self.status})"
+
+class UploadSession(models.Model):
+    """A resumable chunked upload of a track file (see music.uploads)"""
+    BACKEND_LOCAL = 'local'
+    BACKEND_S3 = 's3'
+    BACKEND_S3_DIRECT = 's3_direct'
+    BACKEND_CHOICES = [
+        (BACKEND_LOCAL, 'Local temp file'),
+        (BACKEND_S3, 'S3 multipart upload'),
+        (BACKEND_S3_DIRECT, 'S3 direct (presigned) multipart upload'),
+    ]
+    STATUS_ACTIVE = 'active'
+    STATUS_COMPLETE = 'complete'
+    STATUS_ABORTED = 'aborted'
+    STATUS_CHOICES = [
+        (STATUS_ACTIVE, 'Active'),
+        (STATUS_COMPLETE, 'Complete'),
+        (STATUS_ABORTED, 'Aborted'),
+    ]
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='upload_sessions')
+    filename = models.CharField(max_length=255)
+    total_size = models.BigIntegerField()
+    chunk_size = models.PositiveIntegerField()
+    backend = models.CharField(max_length=20, choices=BACKEND_CHOICES)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default=STATUS_ACTIVE)
+    # Local backend: path of the temp file the chunks are written into
+    temp_path = models.CharField(max_length=500, blank=True)
+    # S3 backend: storage name of the target object and the multipart upload id
+    storage_name = models.CharField(max_length=500, blank=True)
+    s3_upload_id = models.CharField(max_length=255, blank=True)
+    # Received parts keyed by part number: {"1": {"size": ..., "sha256": ..., "etag": ...}}
+    parts = models.JSONField(default=dict, blank=True)
+    # Direct uploads: hex SHA-256 of every part, declared by the client up front
+    part_checksums = models.JSONField(default=list, blank=True)
+    # Track metadata (title, artist_name, album_title, ...) used on finalize
+    metadata = models.JSONField(default=dict, blank=True)
+    track = models.ForeignKey(Track, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    created_at = models.DateTimeField(auto_now_add=True)
+    expires_at = models.DateTimeField()
+
+    def __str__(self):
+        return f"{self.filename} ({self.status})"
+
+    @property
+    def part_count(self):
+        return max(1, -(-self.total_size // self.chunk_size))
+
+    def part_size(self, part_number):
+        """Expected byte length of a part (only the last one may be short)"""
+        if part_number < self.part_count:
+            return self.chunk_size
+        return self.total_size - self.chunk_size * (self.part_count - 1)
+
+    @property
+    def received_bytes(self):
+        return sum(part['size'] for part in self.parts.values())
+
+    @property
+    def missing_parts(self):
+        return [n for n in range(1, self.part_count + 1) if str(n) not in self.parts]
+
+class MediaBlob(models.Model):
+    """A stored media file and the number of rows referencing it (see music.blobs)"""
+    name = models.CharField(max_length=500, unique=True)
+    sha256 = models.CharField(max_length=64, blank=True, db_index=True)
+    size = models.BigIntegerField(null=True, blank=True)
+    ref_count = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.name} ({self.ref_count} refs)"
+
+class Playlist(models.Model):
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='playlists')
+    name = models.CharField(max_length=255)
+    description = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ['-updated_at']
+
+    def __str__(self):
+        return self.name
+
+class PlaylistItem(models.Model):
+    """A track in a playlist, ordered by ``rank`` (see music.ranks and music.playlists)"""
+    playlist = models.ForeignKey(Playlist, on_delete=models.CASCADE, related_name='items')
+    track = models.ForeignKey(Track, on_delete=models.CASCADE, related_name='playlist_items')
+    rank = models.CharField(max_length=255)
+    added_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['playlist', 'rank']
+        constraints = [
+            # Also the index that item listing and neighbour lookups use
+            models.UniqueConstraint(fields=['playlist', 'rank'], name='unique_playlist_item_rank'),
+        ]
+
+    def __str__(self):
+        return f"{self.playlist_id}:{self.rank} {self.track_id}"
+
+class SimilarTrack(models.Model):
+    """A track's precomputed co-download neighbour (see music.similarity)"""
+    track = models.ForeignKey(Track, on_delete=models.CASCADE, related_name='+')
+    similar = models.ForeignKey(Track, on_delete=models.CASCADE, related_name='+')
+    score = models.FloatField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['track', 'similar'], name='unique_similar_track'),
+        ]
+
+    def __str__(self):
+        return f"{self.track_id} ~ {self.similar_id} ({self.score:.3f})"
+
+class SimilarTracksRun(models.Model):
+    """A run of the similar-tracks build; the latest one is the incremental watermark"""
+    last_download_id = models.BigIntegerField()
+    full = models.BooleanField(default=False)
+    tracks_updated = models.PositiveIntegerField(default=0)
+    seconds = models.FloatField()
+    finished_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"Run #{self.pk} up to download {self.last_download_id}"
+
+class TrackFingerprint(models.Model):
+    """Acoustic fingerprint of a track's file (see music.fingerprints)"""
+    track = models.OneToOneField(Track, on_delete=models.CASCADE, primary_key=True, related_name='fingerprint')
+    # File the fingerprint was computed from; a new file needs a new fingerprint
+    source = models.CharField(max_length=255)
+    # Little-endian uint32 sub-fingerprints
+    data = models.BinaryField()
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"Fingerprint of track {self.track_id} ({len(self.data) // 4} frames)"
@@ -0,0 +1,18 @@
+"""Normalized lookup keys for artist names and album titles"""
+import unicodedata
+
+
+def name_key(value):
+    """Key under which names that differ only in case, width or spacing collide"""
+    value = unicodedata.normalize('NFKC', value or '').casefold()
+    return ' '.join(value.split())[:255]
+
+
+# Placeholder genres that mean the genre isn't known
+UNKNOWN_GENRES = {'', 'unknown'}
+
+
+def genre_key(value):
+    """name_key for genres; empty for placeholders, which get no Genre row"""
+    key = name_key(value)[:100]
+    return '' if key in UNKNOWN_GENRES else key
@@ -0,0 +1,110 @@
+"""Playlist editing with fractional ranks.
+
+Items are ordered by ``PlaylistItem.rank`` (see music.ranks), so adding a
+track or moving an item writes only that item's row, and adding several
+tracks is a single bulk insert. Every change first updates the playlist's
+``updated_at``, which locks the playlist row until the transaction ends, so
+concurrent edits of one playlist can't pick the same rank.
+
+Inserting again and again at the same spot makes ranks longer. Once a new
+rank would be longer than ``MAX_RANK_LENGTH``, ``rebalance`` rewrites the
+playlist's ranks evenly spaced; that is the only operation touching every
+item, and it only rewrites their ranks.
+"""
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from .models import Playlist, PlaylistItem
+from .ranks import ranks_between
+
+MAX_RANK_LENGTH = 128
+# Marks ranks mid-rebalance; sorts after every base-36 digit
+TEMPORARY_PREFIX = '~'
+# Default position for add_tracks: after the last item
+END = object()
+
+
+class PlaylistError(Exception):
+    pass
+
+
+def _touch(playlist):
+    playlist.updated_at = timezone.now()
+    Playlist.objects.filter(pk=playlist.pk).update(updated_at=playlist.updated_at)
+
+
+def _ranks(playlist):
+    return PlaylistItem.objects.filter(playlist=playlist).values_list('rank', flat=True)
+
+
+def _bounds(playlist, after, exclude=None):
+    """Ranks of the items an insert after item ``after`` goes between
+    (``after`` None: the start, END: the end)"""
+    ranks = _ranks(playlist)
+    if exclude is not None:
+        ranks = ranks.exclude(pk=exclude.pk)
+    if after is END:
+        return ranks.order_by('-rank').first(), None
+    if after is None:
+        return None, ranks.order_by('rank').first()
+    return after.rank, ranks.filter(rank__gt=after.rank).order_by('rank').first()
+
+
+def _new_ranks(playlist, after, count, exclude=None):
+    ranks = ranks_between(*_bounds(playlist, after, exclude), count)
+    if ranks and max(len(rank) for rank in ranks) > MAX_RANK_LENGTH:
+        rebalance(playlist)
+        if after is not None and after is not END:
+            after.refresh_from_db(fields=['rank'])
+        ranks = ranks_between(*_bounds(playlist, after, exclude), count)
+    return ranks
+
+
+def add_tracks(playlist, tracks, after=END):
+    """Insert ``tracks`` in the given order after item ``after``.
+
+    ``after`` is an item of the playlist, None for the start or END (the
+    default) to append. Returns the new items.
+    """
+    with transaction.atomic():
+        _touch(playlist)
+        count = PlaylistItem.objects.filter(playlist=playlist).count()
+        if count + len(tracks) > settings.MUSIC_PLAYLIST_MAX_ITEMS:
+            raise PlaylistError(f'Playlists hold at most {settings.MUSIC_PLAYLIST_MAX_ITEMS} tracks')
+        ranks = _new_ranks(playlist, after, len(tracks))
+        items = [PlaylistItem(playlist=playlist, track=track, rank=rank) for track, rank in zip(tracks, ranks)]
+        return PlaylistItem.objects.bulk_create(items, batch_size=1000)
+
+
+def move_item(item, after):
+    """Move ``item`` to just after item ``after`` (None: to the start)"""
+    with transaction.atomic():
+        _touch(item.playlist)
+        if after is not None and after.pk == item.pk:
+            return item
+        item.rank = _new_ranks(item.playlist, after, 1, exclude=item)[0]
+        PlaylistItem.objects.filter(pk=item.pk).update(rank=item.rank)
+        return item
+
+
+def remove_item(item):
+    with transaction.atomic():
+        _touch(item.playlist)
+        item.delete()
+
+
+def rebalance(playlist):
+    """Rewrite the playlist's ranks as short, evenly spaced keys"""
+    with transaction.atomic():
+        items = list(PlaylistItem.objects.filter(playlist=playlist).only('pk', 'rank').order_by('rank'))
+        ranks = ranks_between(None, None, len(items))
+        # Written twice so the unique (playlist, rank) constraint doesn't
+        # trip over ranks swapping between rows: first with a prefix that no
+        # real rank has, then as is
+        for item, rank in zip(items, ranks):
+            item.rank = TEMPORARY_PREFIX + rank
+        PlaylistItem.objects.bulk_update(items, ['rank'], batch_size=1000)
+        for item, rank in zip(items, ranks):
+            item.rank = rank
+        PlaylistItem.objects.bulk_update(items, ['rank'], batch_size=1000)
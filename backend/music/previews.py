@@ -0,0 +1,144 @@
+"""Preview clip generation.
+
+WAV previews are cut straight out of the PCM frames with ranged reads, so a
+30 second clip costs a 30 second read. Other formats are handed to the
+transcoder configured in ``settings.MUSIC_PREVIEW_TRANSCODER``.
+"""
+import logging
+import os
+import struct
+import subprocess
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.utils.module_loading import import_string
+
+from .probe import open_reader, probe
+from .storage import is_s3_storage, local_path, presigned_url
+
+logger = logging.getLogger(__name__)
+
+# PCM frames are copied in reads of this size
+COPY_CHUNK_SIZE = 1024 * 1024
+
+
+class PreviewError(Exception):
+    """Raised when a preview clip can't be produced for a file"""
+
+
+def preview_window(duration, length):
+    """Pick the clip start: ~30% into the track, clamped so the clip fits"""
+    length = min(length, duration)
+    start = min(duration * 0.3, duration - length)
+    return max(0.0, start), length
+
+
+def preview_name(source_name, extension):
+    stem = os.path.splitext(os.path.basename(source_name))[0]
+    return f'previews/{stem}_preview.{extension}'
+
+
+def cut_wav(reader, info, start, length):
+    """Build a WAV clip from the frames between start and start + length seconds"""
+    frames_per_second = info.sample_rate
+    first_frame = int(start * frames_per_second)
+    frame_count = int(length * frames_per_second)
+    offset = info.data_offset + first_frame * info.block_align
+    size = min(frame_count * info.block_align, info.data_offset + info.data_size - offset)
+
+    fmt = info.wav_fmt
+    fmt_chunk = b'fmt ' + struct.pack('<I', len(fmt)) + fmt + (b'\x00' if len(fmt) & 1 else b'')
+    data_header = b'data' + struct.pack('<I', size)
+    riff_size = 4 + len(fmt_chunk) + len(data_header) + size + (size & 1)
+
+    parts = [b'RIFF', struct.pack('<I', riff_size), b'WAVE', fmt_chunk, data_header]
+    copied = 0
+    while copied < size:
+        chunk = reader.read(offset + copied, min(COPY_CHUNK_SIZE, size - copied))
+        if not chunk:
+            raise PreviewError("Unexpected end of WAV data")
+        parts.append(chunk)
+        copied += len(chunk)
+    if size & 1:
+        parts.append(b'\x00')
+    return b''.join(parts)
+
+
+class BaseTranscoder:
+    """Interface for turning a window of any audio file into a preview clip"""
+
+    # Extension (and container) of the produced clips
+    extension = 'mp3'
+
+    def transcode(self, source, start, length):
+        """Return the encoded clip bytes. ``source`` is a local path or a URL."""
+        raise NotImplementedError
+
+
+class FFmpegTranscoder(BaseTranscoder):
+    """Encode previews with the ffmpeg binary (seeks over HTTP for S3 sources)"""
+
+    extension = 'mp3'
+    bitrate = '128k'
+
+    def transcode(self, source, start, length):
+        command = [
+            settings.FFMPEG_BINARY, '-v', 'error',
+            '-ss', f'{start:.3f}', '-t', f'{length:.3f}', '-i', source,
+            '-vn', '-map_metadata', '-1', '-b:a', self.bitrate, '-f', 'mp3', 'pipe:1',
+        ]
+        try:
+            result = subprocess.run(command, capture_output=True, check=True, timeout=300)
+        except FileNotFoundError:
+            raise PreviewError("ffmpeg is not installed")
+        except subprocess.CalledProcessError as e:
+            raise PreviewError(f"ffmpeg failed: {e.stderr.decode(errors='replace').strip()}")
+        except subprocess.TimeoutExpired:
+            raise PreviewError("ffmpeg timed out")
+        return result.stdout
+
+
+def get_transcoder():
+    return import_string(settings.MUSIC_PREVIEW_TRANSCODER)()
+
+
+def build_preview(name, source_storage, target_storage):
+    """Create and store a preview clip for a stored track file.
+
+    Touches storage only (no database), so it is safe to call from worker
+    processes. Returns ``(preview_name, clip_size)``.
+    """
+    reader = open_reader(name, source_storage)
+    try:
+        info = probe(reader)
+        start, length = preview_window(info.duration, settings.MUSIC_PREVIEW_SECONDS)
+        if info.format == 'wav':
+            clip = cut_wav(reader, info, start, length)
+            extension = 'wav'
+        else:
+            transcoder = get_transcoder()
+            if is_s3_storage(source_storage):
+                source = presigned_url(source_storage, name)
+            else:
+                source = local_path(source_storage, name)
+            if source is None:
+                raise PreviewError("Storage can't provide a path or URL to transcode from")
+            clip = transcoder.transcode(source, start, length)
+            extension = transcoder.extension
+    finally:
+        reader.close()
+
+    if not clip:
+        raise PreviewError("Transcoder produced an empty clip")
+    saved_name = target_storage.save(preview_name(name, extension), ContentFile(clip))
+    return saved_name, len(clip)
+
+
+def generate_preview(track):
+    """Create the preview clip for a track and save it on the row"""
+    preview_field = track._meta.get_field('preview_file')
+    saved_name, _size = build_preview(track.file.name, track.file.storage, preview_field.storage)
+    track.preview_file.name = saved_name
+    track.save(update_fields=['preview_file'])
+    logger.info(f"Preview generated for track {track.pk}: {saved_name}")
+    return saved_name
@@ -0,0 +1,521 @@
+"""Audio metadata probing for WAV, FLAC and MP3 files.
+
+Only the container headers (and for MP3 the first audio frame and the
+trailing ID3v1 tag) are read, so probing a file stored on S3 costs a couple
+of small ranged GETs instead of a full download.
+"""
+import os
+import struct
+from dataclasses import dataclass, field
+
+from .storage import is_s3_storage, local_path, s3_object
+
+# Minimum size of a single read; small header reads are served from this block
+READ_BLOCK_SIZE = 64 * 1024
+
+# How far past the ID3v2 tag we search for the first MPEG frame sync
+MP3_SYNC_SEARCH = 64 * 1024
+
+
+class ProbeError(Exception):
+    """Raised when a file is not a supported or well-formed audio file"""
+
+
+@dataclass
+class AudioInfo:
+    format: str
+    duration: float
+    sample_rate: int
+    channels: int
+    bitrate: int
+    bits_per_sample: int = None
+    tags: dict = field(default_factory=dict)
+    # Location of the PCM frames (WAV only), used to cut preview clips
+    data_offset: int = None
+    data_size: int = None
+    block_align: int = None
+    wav_fmt: bytes = None
+
+    @property
+    def duration_seconds(self):
+        return int(round(self.duration))
+
+
+# ---------------------------------------------------------------------------
+# Readers: random access to a file via (offset, length) reads
+# ---------------------------------------------------------------------------
+
+class BufferedReader:
+    """Base reader that serves small reads from a single cached block"""
+
+    def __init__(self, size):
+        self.size = size
+        self._block_offset = 0
+        self._block = b''
+
+    def _fetch(self, offset, length):
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+    def read(self, offset, length):
+        if offset < 0 or offset >= self.size or length <= 0:
+            return b''
+        length = min(length, self.size - offset)
+        start = offset - self._block_offset
+        if 0 <= start and start + length <= len(self._block):
+            return self._block[start:start + length]
+        fetch_length = min(max(length, READ_BLOCK_SIZE), self.size - offset)
+        self._block = self._fetch(offset, fetch_length)
+        self._block_offset = offset
+        return self._block[:length]
+
+
+class FileReader(BufferedReader):
+    """Reader over a seekable binary file object"""
+
+    def __init__(self, fileobj, size=None):
+        if size is None:
+            fileobj.seek(0, os.SEEK_END)
+            size = fileobj.tell()
+        super().__init__(size)
+        self.fileobj = fileobj
+
+    def _fetch(self, offset, length):
+        self.fileobj.seek(offset)
+        return self.fileobj.read(length)
+
+    def close(self):
+        self.fileobj.close()
+
+
+class S3RangeReader(BufferedReader):
+    """Reader over an S3 object using HTTP range requests"""
+
+    def __init__(self, s3_obj):
+        super().__init__(s3_obj.content_length)
+        self.s3_obj = s3_obj
+
+    def _fetch(self, offset, length):
+        response = self.s3_obj.get(Range=f'bytes={offset}-{offset + length - 1}')
+        return response['Body'].read()
+
+
+# ---------------------------------------------------------------------------
+# WAV
+# ---------------------------------------------------------------------------
+
+WAV_INFO_TAGS = {
+    b'INAM': 'title',
+    b'IART': 'artist',
+    b'IPRD': 'album',
+    b'IGNR': 'genre',
+    b'ICRD': 'date',
+    b'ITRK': 'tracknumber',
+    b'ICMT': 'comment',
+}
+
+
+def _decode_text(raw, encoding='utf-8'):
+    text = raw.split(b'\x00', 1)[0]
+    try:
+        return text.decode(encoding).strip()
+    except UnicodeDecodeError:
+        return text.decode('latin-1').strip()
+
+
+def _parse_wav_info(data):
+    tags = {}
+    pos = 4  # skip the 'INFO' list type
+    while pos + 8 <= len(data):
+        chunk_id, chunk_size = struct.unpack_from('<4sI', data, pos)
+        value = data[pos + 8:pos + 8 + chunk_size]
+        if chunk_id in WAV_INFO_TAGS and value:
+            tags[WAV_INFO_TAGS[chunk_id]] = _decode_text(value)
+        pos += 8 + chunk_size + (chunk_size & 1)
+    return tags
+
+
+def probe_wav(reader):
+    header = reader.read(0, 12)
+    if len(header) < 12 or header[:4] != b'RIFF' or header[8:12] != b'WAVE':
+        raise ProbeError("Not a RIFF/WAVE file")
+
+    fmt = fmt_chunk = None
+    data_offset = data_size = None
+    tags = {}
+    pos = 12
+    while pos + 8 <= reader.size:
+        chunk_id, chunk_size = struct.unpack('<4sI', reader.read(pos, 8))
+        body = pos + 8
+        if chunk_id == b'fmt ':
+            fmt_chunk = reader.read(body, chunk_size)
+            fmt = struct.unpack_from('<HHIIHH', fmt_chunk)
+        elif chunk_id == b'data':
+            data_offset = body
+            # Streamed WAVs leave the size at 0 / 0xFFFFFFFF; truncated
+            # files claim more than they hold. Trust the file size instead.
+            data_size = min(chunk_size, reader.size - body) if chunk_size else reader.size - body
+        elif chunk_id == b'LIST' and chunk_size <= READ_BLOCK_SIZE:
+            data = reader.read(body, chunk_size)
+            if data[:4] == b'INFO':
+                tags = _parse_wav_info(data)
+        pos = body + chunk_size + (chunk_size & 1)
+
+    if fmt is None or data_offset is None:
+        raise ProbeError("WAV file is missing its fmt or data chunk")
+
+    _format_tag, channels, sample_rate, byte_rate, block_align, bits = fmt
+    if not sample_rate or not byte_rate or not block_align:
+        raise ProbeError("WAV fmt chunk is invalid")
+    # Ignore any partial frame at the end of the data chunk
+    data_size -= data_size % block_align
+
+    return AudioInfo(
+        format='wav',
+        duration=data_size / byte_rate,
+        sample_rate=sample_rate,
+        channels=channels,
+        bitrate=byte_rate * 8,
+        bits_per_sample=bits,
+        tags=tags,
+        data_offset=data_offset,
+        data_size=data_size,
+        block_align=block_align,
+        wav_fmt=fmt_chunk,
+    )
+
+
+# ---------------------------------------------------------------------------
+# FLAC
+# ---------------------------------------------------------------------------
+
+def _parse_vorbis_comment(data):
+    tags = {}
+    vendor_length, = struct.unpack_from('<I', data, 0)
+    pos = 4 + vendor_length
+    count, = struct.unpack_from('<I', data, pos)
+    pos += 4
+    for _ in range(count):
+        if pos + 4 > len(data):
+            break
+        length, = struct.unpack_from('<I', data, pos)
+        comment = data[pos + 4:pos + 4 + length].decode('utf-8', 'replace')
+        pos += 4 + length
+        key, sep, value = comment.partition('=')
+        key = key.lower()
+        if sep and value and key not in tags:
+            tags[key] = value.strip()
+    return tags
+
+
+def probe_flac(reader, start=0):
+    if reader.read(start, 4) != b'fLaC':
+        raise ProbeError("Not a FLAC file")
+
+    streaminfo = None
+    tags = {}
+    pos = start + 4
+    while pos + 4 <= reader.size:
+        header = reader.read(pos, 4)
+        is_last = header[0] & 0x80
+        block_type = header[0] & 0x7F
+        length = int.from_bytes(header[1:4], 'big')
+        body = pos + 4
+        if block_type == 0:
+            streaminfo = reader.read(body, 34)
+        elif block_type == 4:
+            tags = _parse_vorbis_comment(reader.read(body, length))
+        pos = body + length
+        if is_last:
+            break
+
+    if streaminfo is None or len(streaminfo) < 18:
+        raise ProbeError("FLAC file is missing its STREAMINFO block")
+
+    packed = int.from_bytes(streaminfo[10:18], 'big')
+    sample_rate = packed >> 44
+    channels = ((packed >> 41) & 0x07) + 1
+    bits = ((packed >> 36) & 0x1F) + 1
+    total_samples = packed & 0xFFFFFFFFF
+    if not sample_rate:
+        raise ProbeError("FLAC STREAMINFO has no sample rate")
+
+    duration = total_samples / sample_rate
+    audio_bytes = reader.size - pos
+    bitrate = int(audio_bytes * 8 / duration) if duration else 0
+
+    return AudioInfo(
+        format='flac',
+        duration=duration,
+        sample_rate=sample_rate,
+        channels=channels,
+        bitrate=bitrate,
+        bits_per_sample=bits,
+        tags=tags,
+    )
+
+
+# ---------------------------------------------------------------------------
+# MP3
+# ---------------------------------------------------------------------------
+
+MP3_BITRATES = {
+    (1, 1): [0, 32, 64, 96, 128, 160, 192, 224, 256, 288, 320, 352, 384, 416, 448],
+    (1, 2): [0, 32, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320, 384],
+    (1, 3): [0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320],
+    (2, 1): [0, 32, 48, 56, 64, 80, 96, 112, 128, 144, 160, 176, 192, 224, 256],
+    (2, 2): [0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160],
+    (2, 3): [0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160],
+}
+
+MP3_SAMPLE_RATES = {
+    1: [44100, 48000, 32000],
+    2: [22050, 24000, 16000],
+    2.5: [11025, 12000, 8000],
+}
+
+ID3V2_TEXT_FRAMES = {
+    'TIT2': 'title', 'TT2': 'title',
+    'TPE1': 'artist', 'TP1': 'artist',
+    'TALB': 'album', 'TAL': 'album',
+    'TCON': 'genre', 'TCO': 'genre',
+    'TRCK': 'tracknumber', 'TRK': 'tracknumber',
+    'TDRC': 'date', 'TYER': 'date', 'TYE': 'date',
+}
+
+ID3V2_ENCODINGS = ['latin-1', 'utf-16', 'utf-16-be', 'utf-8']
+
+
+def _syncsafe(data):
+    return (data[0] << 21) | (data[1] << 14) | (data[2] << 7) | data[3]
+
+
+def id3v2_size(reader):
+    """Return the total size of a leading ID3v2 tag (0 if there is none)"""
+    header = reader.read(0, 10)
+    if len(header) < 10 or header[:3] != b'ID3':
+        return 0
+    footer = 10 if header[5] & 0x10 else 0
+    return 10 + _syncsafe(header[6:10]) + footer
+
+
+def _decode_id3_text(raw):
+    if not raw:
+        return ''
+    encoding = ID3V2_ENCODINGS[raw[0]] if raw[0] < len(ID3V2_ENCODINGS) else 'latin-1'
+    try:
+        text = raw[1:].decode(encoding)
+    except UnicodeDecodeError:
+        return ''
+    # Multiple values are NUL separated; keep the first
+    return text.split('\x00', 1)[0].strip()
+
+
+def _parse_id3v2(reader, tag_size):
+    header = reader.read(0, 10)
+    version = header[3]
+    data = reader.read(10, min(tag_size - 10, READ_BLOCK_SIZE))
+    tags = {}
+    pos = 0
+    id_len, header_len = (3, 6) if version == 2 else (4, 10)
+    while pos + header_len <= len(data):
+        frame_id = data[pos:pos + id_len]
+        if not frame_id.strip(b'\x00') or not frame_id.isalnum():
+            break
+        if version == 2:
+            size = int.from_bytes(data[pos + 3:pos + 6], 'big')
+        elif version == 4:
+            size = _syncsafe(data[pos + 4:pos + 8])
+        else:
+            size = int.from_bytes(data[pos + 4:pos + 8], 'big')
+        key = ID3V2_TEXT_FRAMES.get(frame_id.decode('ascii'))
+        if key and key not in tags:
+            value = _decode_id3_text(data[pos + header_len:pos + header_len + size])
+            if key == 'genre' and value.startswith('('):
+                # ID3v1 style "(13)Pop" genre references
+                value = value.split(')', 1)[-1]
+            if value:
+                tags[key] = value
+        pos += header_len + size
+    return tags
+
+
+def _parse_id3v1(data):
+    if len(data) != 128 or data[:3] != b'TAG':
+        return {}
+    tags = {
+        'title': _decode_text(data[3:33], 'latin-1'),
+        'artist': _decode_text(data[33:63], 'latin-1'),
+        'album': _decode_text(data[63:93], 'latin-1'),
+        'date': _decode_text(data[93:97], 'latin-1'),
+    }
+    return {key: value for key, value in tags.items() if value}
+
+
+def _parse_mpeg_header(header):
+    """Decode a 4-byte MPEG audio frame header, or return None if invalid"""
+    if len(header) < 4 or header[0] != 0xFF or (header[1] & 0xE0) != 0xE0:
+        return None
+    version_bits = (header[1] >> 3) & 0x03
+    layer_bits = (header[1] >> 1) & 0x03
+    bitrate_index = header[2] >> 4
+    rate_index = (header[2] >> 2) & 0x03
+    if version_bits == 1 or layer_bits == 0 or bitrate_index in (0, 15) or rate_index == 3:
+        return None
+
+    version = {3: 1, 2: 2, 0: 2.5}[version_bits]
+    layer = 4 - layer_bits
+    bitrate = MP3_BITRATES[(1 if version == 1 else 2, layer)][bitrate_index] * 1000
+    sample_rate = MP3_SAMPLE_RATES[version][rate_index]
+    padding = (header[2] >> 1) & 0x01
+    channels = 1 if (header[3] >> 6) == 3 else 2
+
+    if layer == 1:
+        samples_per_frame = 384
+        frame_length = (12 * bitrate // sample_rate + padding) * 4
+    elif layer == 2 or version == 1:
+        samples_per_frame = 1152
+        frame_length = 144 * bitrate // sample_rate + padding
+    else:
+        samples_per_frame = 576
+        frame_length = 72 * bitrate // sample_rate + padding
+
+    return {
+        'version': version,
+        'layer': layer,
+        'bitrate': bitrate,
+        'sample_rate': sample_rate,
+        'channels': channels,
+        'samples_per_frame': samples_per_frame,
+        'frame_length': frame_length,
+    }
+
+
+def _find_first_frame(reader, start):
+    """Locate the first MPEG frame, requiring the following frame to agree"""
+    data = reader.read(start, MP3_SYNC_SEARCH)
+    pos = data.find(b'\xff')
+    while 0 <= pos < len(data) - 4:
+        frame = _parse_mpeg_header(data[pos:pos + 4])
+        if frame:
+            next_pos = start + pos + frame['frame_length']
+            following = _parse_mpeg_header(reader.read(next_pos, 4))
+            if next_pos >= reader.size or (
+                following and following['sample_rate'] == frame['sample_rate']
+            ):
+                return start + pos, frame
+        pos = data.find(b'\xff', pos + 1)
+    raise ProbeError("No MPEG audio frame found")
+
+
+def probe_mp3(reader):
+    tag_size = id3v2_size(reader)
+    tags = _parse_id3v2(reader, tag_size) if tag_size else {}
+
+    frame_offset, frame = _find_first_frame(reader, tag_size)
+    sample_rate = frame['sample_rate']
+
+    audio_end = reader.size
+    trailer = reader.read(reader.size - 128, 128) if reader.size >= 128 else b''
+    if trailer[:3] == b'TAG':
+        audio_end -= 128
+        for key, value in _parse_id3v1(trailer).items():
+            tags.setdefault(key, value)
+    audio_bytes = audio_end - frame_offset
+
+    # VBR files carry the exact frame count in a Xing/Info or VBRI header
+    # inside the first frame.
+    frame_data = reader.read(frame_offset, max(frame['frame_length'], 64))
+    if frame['version'] == 1:
+        side_info = 17 if frame['channels'] == 1 else 32
+    else:
+        side_info = 9 if frame['channels'] == 1 else 17
+    xing = 4 + side_info
+    frame_count = None
+    if frame_data[xing:xing + 4] in (b'Xing', b'Info'):
+        flags, = struct.unpack_from('>I', frame_data, xing + 4)
+        pos = xing + 8
+        if flags & 0x01:
+            frame_count, = struct.unpack_from('>I', frame_data, pos)
+            pos += 4
+        if flags & 0x02:
+            audio_bytes, = struct.unpack_from('>I', frame_data, pos)
+    elif frame_data[36:40] == b'VBRI':
+        audio_bytes, frame_count = struct.unpack_from('>II', frame_data, 46)
+
+    if frame_count:
+        duration = frame_count * frame['samples_per_frame'] / sample_rate
+        bitrate = int(audio_bytes * 8 / duration) if duration else frame['bitrate']
+    else:
+        # Constant bitrate: the duration follows from the stream length
+        bitrate = frame['bitrate']
+        duration = audio_bytes * 8 / bitrate
+
+    return AudioInfo(
+        format='mp3',
+        duration=duration,
+        sample_rate=sample_rate,
+        channels=frame['channels'],
+        bitrate=bitrate,
+        tags=tags,
+    )
+
+
+# ---------------------------------------------------------------------------
+# Entry points
+# ---------------------------------------------------------------------------
+
+def probe(reader):
+    """Detect the container format from its magic bytes and probe it"""
+    try:
+        return _probe(reader)
+    except struct.error as e:
+        # A header cut short by the end of the file
+        raise ProbeError(f"Truncated audio header: {e}") from e
+
+
+def _probe(reader):
+    magic = reader.read(0, 12)
+    if magic[:4] == b'RIFF' and magic[8:12] == b'WAVE':
+        return probe_wav(reader)
+    if magic[:4] == b'fLaC':
+        return probe_flac(reader)
+    if magic[:3] == b'ID3':
+        # FLAC files are occasionally prefixed with an ID3v2 tag
+        tag_size = id3v2_size(reader)
+        if reader.read(tag_size, 4) == b'fLaC':
+            return probe_flac(reader, start=tag_size)
+        return probe_mp3(reader)
+    if _parse_mpeg_header(magic[:4]):
+        return probe_mp3(reader)
+    raise ProbeError("Unsupported audio format")
+
+
+def probe_file(fileobj):
+    """Probe a seekable file object, leaving its position at the start"""
+    try:
+        return probe(FileReader(fileobj))
+    finally:
+        fileobj.seek(0)
+
+
+def open_reader(name, storage):
+    """Open a ranged reader for a stored file (S3 range GETs or local seeks)"""
+    if is_s3_storage(storage):
+        return S3RangeReader(s3_object(storage, name))
+    path = local_path(storage, name)
+    if path is not None:
+        return FileReader(open(path, 'rb'))
+    return FileReader(storage.open(name, 'rb'))
+
+
+def probe_storage_file(name, storage):
+    """Probe a file held by a storage backend without downloading all of it"""
+    reader = open_reader(name, storage)
+    try:
+        return probe(reader)
+    finally:
+        reader.close()
+
@@ -0,0 +1,163 @@
+"""Fractional rank keys for ordered lists (playlist items).
+
+A rank is a string of base-36 digits (``0-9a-z``). Items are ordered by
+comparing ranks as plain strings, and there is always another rank between
+any two, so inserting or moving an item writes only that item's row.
+
+This follows the fractional indexing scheme from "Implementing Fractional
+Indexing" (David Greenspan): a rank is a variable-length integer part
+followed by a fraction. The integer's first character encodes its length
+(``i``-``z`` for positive, ``h``-``0`` for negative), so appending or
+prepending increments or decrements the integer and keeps keys a few
+characters long. Only repeated inserts between the same two items make keys
+grow, by about one character per five inserts.
+
+Only lowercase letters and digits are used, so ranks sort the same under
+case-insensitive database collations.
+"""
+DIGITS = '0123456789abcdefghijklmnopqrstuvwxyz'
+BASE = len(DIGITS)
+# Integer heads at or above this are positive, with (index - 17) digits
+POSITIVE_HEAD = DIGITS.index('i')
+FIRST_RANK = 'i0'
+SMALLEST_INTEGER = '0' + '0' * POSITIVE_HEAD
+
+
+class RankError(ValueError):
+    pass
+
+
+def _integer_length(head):
+    index = DIGITS.find(head)
+    if index < 0:
+        raise RankError(f'Invalid rank head {head!r}')
+    if index >= POSITIVE_HEAD:
+        return index - POSITIVE_HEAD + 2
+    return POSITIVE_HEAD - index + 1
+
+
+def _split(key):
+    """(integer part, fraction) of a rank"""
+    if not key:
+        raise RankError('Empty rank')
+    length = _integer_length(key[0])
+    if len(key) < length:
+        raise RankError(f'Invalid rank {key!r}')
+    if key[length:].endswith('0'):
+        raise RankError(f'Rank {key!r} has a trailing zero')
+    return key[:length], key[length:]
+
+
+def _increment(integer):
+    head, digits = integer[0], list(integer[1:])
+    for i in reversed(range(len(digits))):
+        value = DIGITS.index(digits[i]) + 1
+        if value < BASE:
+            digits[i] = DIGITS[value]
+            return head + ''.join(digits)
+        digits[i] = '0'
+    if head == 'h':
+        return FIRST_RANK
+    if head == 'z':
+        return None
+    head = DIGITS[DIGITS.index(head) + 1]
+    if DIGITS.index(head) > POSITIVE_HEAD:
+        digits.append('0')
+    else:
+        digits.pop()
+    return head + ''.join(digits)
+
+
+def _decrement(integer):
+    head, digits = integer[0], list(integer[1:])
+    for i in reversed(range(len(digits))):
+        value = DIGITS.index(digits[i]) - 1
+        if value >= 0:
+            digits[i] = DIGITS[value]
+            return head + ''.join(digits)
+        digits[i] = DIGITS[-1]
+    if head == 'i':
+        return 'h' + DIGITS[-1]
+    if head == '0':
+        return None
+    head = DIGITS[DIGITS.index(head) - 1]
+    if DIGITS.index(head) < POSITIVE_HEAD - 1:
+        digits.append(DIGITS[-1])
+    else:
+        digits.pop()
+    return head + ''.join(digits)
+
+
+def _midpoint(a, b):
+    """A fraction between fractions ``a`` and ``b`` (None: no upper bound)"""
+    if b is not None:
+        # Skip the common prefix; a is padded with zeros to b's length
+        n = 0
+        while n < len(b) and (a[n] if n < len(a) else '0') == b[n]:
+            n += 1
+        if n:
+            return b[:n] + _midpoint(a[n:], b[n:])
+    digit_a = DIGITS.index(a[0]) if a else 0
+    digit_b = DIGITS.index(b[0]) if b is not None else BASE
+    if digit_b - digit_a > 1:
+        return DIGITS[(digit_a + digit_b + 1) // 2]
+    # Adjacent digits: b's first digit alone is between them if b goes on
+    if b is not None and len(b) > 1:
+        return b[:1]
+    return DIGITS[digit_a] + _midpoint(a[1:], None)
+
+
+def rank_between(before, after):
+    """A rank that sorts after ``before`` and before ``after``.
+
+    Either may be None for an open end: ``rank_between(last, None)``
+    appends, ``rank_between(None, first)`` prepends.
+    """
+    if before is not None and after is not None and before >= after:
+        raise RankError(f'{before!r} does not sort before {after!r}')
+    if before is None and after is None:
+        return FIRST_RANK
+    if before is None:
+        integer, fraction = _split(after)
+        if integer == SMALLEST_INTEGER:
+            if not fraction:
+                raise RankError(f'Nothing sorts before {after!r}')
+            return integer + _midpoint('', fraction)
+        if fraction:
+            return integer
+        return _decrement(integer)
+    if after is None:
+        integer, fraction = _split(before)
+        return _increment(integer) or integer + _midpoint(fraction, None)
+    integer_a, fraction_a = _split(before)
+    integer_b, fraction_b = _split(after)
+    if integer_a == integer_b:
+        return integer_a + _midpoint(fraction_a, fraction_b)
+    integer = _increment(integer_a)
+    if integer is not None and integer < after:
+        return integer
+    return integer_a + _midpoint(fraction_a, None)
+
+
+def ranks_between(before, after, count):
+    """``count`` ascending ranks between ``before`` and ``after``, spread out
+    so that the keys stay short"""
+    if count <= 0:
+        return []
+    if count == 1:
+        return [rank_between(before, after)]
+    if after is None:
+        ranks = []
+        for _ in range(count):
+            before = rank_between(before, None)
+            ranks.append(before)
+        return ranks
+    if before is None:
+        ranks = []
+        for _ in range(count):
+            after = rank_between(None, after)
+            ranks.append(after)
+        return ranks[::-1]
+    middle = count // 2
+    rank = rank_between(before, after)
+    return ranks_between(before, rank, middle) + [rank] + ranks_between(rank, after, count - middle - 1)
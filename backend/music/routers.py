@@ -0,0 +1,112 @@
+"""Read-replica routing for catalog reads.
+
+``ReplicaRouter`` sends reads of the ``DATABASE_REPLICA_APPS`` models to a
+replica while a request is being handled, and every write to ``default``.
+``ReplicaStickinessMiddleware`` tracks the request: each request picks one
+replica, so its queries see a consistent snapshot. Once the request writes
+to a replicated model, its remaining reads go to ``default``. The user is
+then pinned to ``default`` for ``DATABASE_REPLICA_PIN_SECONDS``, so a client
+doesn't read stale data from a lagging replica right after changing
+something. Writes that the user's reads don't depend on, such as download
+logs (``DATABASE_REPLICA_UNPINNED_MODELS``), don't pin. Pins are
+kept in the default cache; share it between workers (``CACHE_REDIS_URL``)
+so they hold for requests handled by another worker.
+
+Reads outside requests (management commands, jobs) and inside transactions
+always use ``default``.
+"""
+from contextvars import ContextVar
+import random
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, connections
+
+_current_request = ContextVar('replica_request', default=None)
+
+
+def replica_aliases():
+    return [f'replica_{index}' for index in range(1, len(settings.DATABASE_REPLICAS) + 1)]
+
+
+def _pin_key(user_id):
+    return f'db:pinned:user:{user_id}'
+
+
+def pin_user(user_id):
+    """Send the user's reads to the primary for the next few seconds"""
+    cache.set(_pin_key(user_id), True, settings.DATABASE_REPLICA_PIN_SECONDS)
+
+
+class _RequestState:
+    def __init__(self, request):
+        self.request = request
+        replicas = replica_aliases()
+        self.replica = random.choice(replicas) if replicas else None
+        self.wrote = False
+        self.pinned = False
+        self._checked_user_id = None
+
+    def use_primary(self):
+        if self.pinned or connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return True
+        # DRF authenticates in the view and sets the user on the Django
+        # request, so look it up again if it has changed since the last read
+        user = getattr(self.request, 'user', None)
+        if user is not None and user.is_authenticated and user.pk != self._checked_user_id:
+            self._checked_user_id = user.pk
+            self.pinned = bool(cache.get(_pin_key(user.pk)))
+        return self.pinned
+
+
+def _pins(model):
+    # Only writes to replicated models can make the user's next reads stale.
+    # Log rows (DATABASE_REPLICA_UNPINNED_MODELS) are written on every
+    # download and the user doesn't need to see them at once.
+    return (model._meta.app_label in settings.DATABASE_REPLICA_APPS
+            and model._meta.label not in settings.DATABASE_REPLICA_UNPINNED_MODELS)
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        if model._meta.app_label not in settings.DATABASE_REPLICA_APPS:
+            return None
+        state = _current_request.get()
+        if state is None or state.replica is None or state.use_primary():
+            return DEFAULT_DB_ALIAS
+        return state.replica
+
+    def db_for_write(self, model, **hints):
+        state = _current_request.get()
+        if state is not None and _pins(model):
+            state.wrote = state.pinned = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        databases = {DEFAULT_DB_ALIAS, *replica_aliases()}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Replicas get their schema from the primary
+        if db in replica_aliases():
+            return False
+        return None
+
+
+class ReplicaStickinessMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        state = _RequestState(request)
+        token = _current_request.set(state)
+        try:
+            response = self.get_response(request)
+        finally:
+            _current_request.reset(token)
+        user = getattr(request, 'user', None)
+        if state.wrote and user is not None and user.is_authenticated:
+            pin_user(user.pk)
+        return response
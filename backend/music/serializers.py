@@ -1,51 +1,117 @@
+from django.db import models
 from rest_framework import serializers
-from .models import Artist, Album, Track, DownloadLog
+from .images import variant_urls
+from .models import Artist, Album, Genre, Track, DownloadLog, Job, UploadSession, Playlist, PlaylistItem, SimilarTrack
+from .normalize import name_key
+from .storage import file_version, media_url, versioned_url
 
-class ArtistSerializer(serializers.ModelSerializer):
+
+class VersionedFileField(serializers.FileField):
+    """File URL with a version that changes when the file does (see storage.media_url)"""
+
+    def to_representation(self, value):
+        url = super().to_representation(value)
+        return url and versioned_url(url, value.name, file_version(value))
+
+
+class VersionedImageField(VersionedFileField, serializers.ImageField):
+    pass
+
+
+class MediaModelSerializer(serializers.ModelSerializer):
+    serializer_field_mapping = {
+        **serializers.ModelSerializer.serializer_field_mapping,
+        models.FileField: VersionedFileField,
+        models.ImageField: VersionedImageField,
+    }
+
+
+def _related_count(obj, name):
+    # Views that fetch counts up front (TrackBatchView) store them in
+    # obj.related_counts, saving a COUNT query per object
+    counts = getattr(obj, 'related_counts', None)
+    if counts is not None and name in counts:
+        return counts[name]
+    return getattr(obj, name).count()
+
+
+def _image_format(serializer):
+    # Clients that can't show WebP ask for ?image_format=jpeg
+    request = serializer.context.get('request')
+    return request.query_params.get('image_format') if request else None
+
+class ArtistSerializer(MediaModelSerializer):
     tracks_count = serializers.SerializerMethodField()
     albums_count = serializers.SerializerMethodField()
+    image_variants = serializers.SerializerMethodField()
     
     class Meta:
         model = Artist
-        fields = '__all__'
+        exclude = ['name_key']
+
+    def validate_name(self, value):
+        # name_key is unique, so "Beatles" and "beatles" are the same artist
+        existing = Artist.objects.filter(name_key=name_key(value))
+        if self.instance is not None:
+            existing = existing.exclude(pk=self.instance.pk)
+        if existing.exists():
+            raise serializers.ValidationError("An artist with this name already exists.")
+        return value
+
+    def get_image_variants(self, obj):
+        return variant_urls(obj.image, obj.image_variants, _image_format(self))
     
     def get_tracks_count(self, obj):
-        return obj.tracks.count()
+        return _related_count(obj, 'tracks')
     
     def get_albums_count(self, obj):
-        return obj.albums.count()
+        return _related_count(obj, 'albums')
 
-class AlbumSerializer(serializers.ModelSerializer):
+class AlbumSerializer(MediaModelSerializer):
     artist_name = serializers.ReadOnlyField(source='artist.name')
     artist = ArtistSerializer(read_only=True)
     tracks_count = serializers.SerializerMethodField()
+    cover_variants = serializers.SerializerMethodField()
 
     class Meta:
         model = Album
-        fields = '__all__'
+        exclude = ['title_key']
+
+    def get_cover_variants(self, obj):
+        return variant_urls(obj.cover_image, obj.cover_variants, _image_format(self))
     
     def get_tracks_count(self, obj):
-        return obj.tracks.count()
+        return _related_count(obj, 'tracks')
+
+class GenreSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Genre
+        fields = ['id', 'name', 'track_count']
 
-class TrackListSerializer(serializers.ModelSerializer):
+class TrackListSerializer(MediaModelSerializer):
     """Lightweight serializer for list views"""
+    genre = serializers.StringRelatedField()
     artist_name = serializers.ReadOnlyField(source='artist.name')
     album_title = serializers.ReadOnlyField(source='album.title')
     album_cover = serializers.SerializerMethodField()
+    album_cover_variants = serializers.SerializerMethodField()
 
     class Meta:
         model = Track
-        fields = ['id', 'title', 'artist_name', 'album_title', 'album_cover', 'duration', 'genre', 'preview_file', 'file', 'created_at']
+        fields = ['id', 'title', 'artist_name', 'album_title', 'album_cover', 'album_cover_variants',
+                  'duration', 'genre', 'preview_file', 'file', 'created_at']
 
     def get_album_cover(self, obj):
-        if obj.album.cover_image:
-            return obj.album.cover_image.url
-        return None
+        return media_url(obj.album.cover_image)
 
-class TrackDetailSerializer(serializers.ModelSerializer):
+    def get_album_cover_variants(self, obj):
+        return variant_urls(obj.album.cover_image, obj.album.cover_variants, _image_format(self))
+
+class TrackDetailSerializer(MediaModelSerializer):
     """Detailed serializer for single track view"""
     artist = ArtistSerializer(read_only=True)
     album = AlbumSerializer(read_only=True)
+    genre = serializers.StringRelatedField()
     download_count = serializers.SerializerMethodField()
     file_url = serializers.SerializerMethodField()
     preview_file_url = serializers.SerializerMethodField()
@@ -55,21 +121,24 @@ class TrackDetailSerializer(serializers.ModelSerializer):
         fields = '__all__'
 
     def get_download_count(self, obj):
-        return obj.downloads.count()
+        return _related_count(obj, 'downloads')
 
     def get_file_url(self, obj):
-        if obj.file:
-            return obj.file.url
-        return None
+        return media_url(obj.file)
 
     def get_preview_file_url(self, obj):
-        if obj.preview_file:
-            return obj.preview_file.url
-        return None
+        return media_url(obj.preview_file)
 
 # Alias for backward compatibility
 TrackSerializer = TrackListSerializer
 
+class SimilarTrackSerializer(serializers.ModelSerializer):
+    track = TrackListSerializer(source='similar', read_only=True)
+
+    class Meta:
+        model = SimilarTrack
+        fields = ['score', 'track']
+
 class DownloadLogSerializer(serializers.ModelSerializer):
     track = TrackListSerializer(read_only=True)
     track_id = serializers.IntegerField(write_only=True)
@@ -77,3 +146,39 @@ class DownloadLogSerializer(serializers.ModelSerializer):
     class Meta:
         model = DownloadLog
         fields = ['id', 'track', 'track_id', 'downloaded_at']
+
+class PlaylistSerializer(serializers.ModelSerializer):
+    item_count = serializers.SerializerMethodField()
+
+    class Meta:
+        model = Playlist
+        fields = ['id', 'name', 'description', 'item_count', 'created_at', 'updated_at']
+
+    def get_item_count(self, obj):
+        # Annotated by the list view
+        if hasattr(obj, 'item_count'):
+            return obj.item_count
+        return obj.items.count()
+
+class PlaylistItemSerializer(serializers.ModelSerializer):
+    track = TrackListSerializer(read_only=True)
+
+    class Meta:
+        model = PlaylistItem
+        fields = ['id', 'rank', 'track', 'added_at']
+
+class JobSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Job
+        fields = ['id', 'kind', 'payload', 'status', 'attempts', 'max_attempts',
+                  'run_after', 'last_error', 'result', 'created_at', 'updated_at']
+
+class UploadSessionSerializer(serializers.ModelSerializer):
+    part_count = serializers.ReadOnlyField()
+    received_bytes = serializers.ReadOnlyField()
+    missing_parts = serializers.ReadOnlyField()
+
+    class Meta:
+        model = UploadSession
+        fields = ['id', 'filename', 'total_size', 'chunk_size', 'part_count', 'received_bytes',
+                  'missing_parts', 'backend', 'status', 'metadata', 'track', 'created_at', 'expires_at']
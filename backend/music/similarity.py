@@ -0,0 +1,198 @@
+"""Co-download track similarity ("people who downloaded this also got ...").
+
+``build`` loads ``DownloadLog`` as a binary user x track matrix and scores
+pairs of tracks by the cosine similarity of their columns:
+
+    sim(a, b) = users who downloaded both / sqrt(users of a * users of b)
+
+The best ``MUSIC_SIMILAR_TRACKS`` neighbours of every track are stored in
+``SimilarTrack``, so ``/api/music/tracks/<pk>/similar/`` is a single indexed
+lookup. Pairs shared by fewer than ``min_shared`` users are left out, since
+one common listener says little.
+
+Runs are incremental. ``SimilarTracksRun`` records the last download
+processed, and the next run only recomputes the tracks downloaded since and
+the tracks whose top k they now enter (see ``stale_columns``). Run a full
+build (``full=True``) now and then: it also corrects scores that drifted and
+drops data of deleted users, which the watermark can't see.
+"""
+import time
+
+import numpy as np
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, Exists, Max, Min, OuterRef
+from scipy import sparse
+
+from .models import DownloadLog, SimilarTrack, SimilarTracksRun, Track
+
+# Tracks per block of the co-download product; bounds memory use
+BLOCK_SIZE = 2000
+DEFAULT_MIN_SHARED = 2
+
+
+def download_matrix(user_ids, track_ids):
+    """Binary CSR user x track matrix, and the user id of each row and track
+    id of each column"""
+    users, user_index = np.unique(user_ids, return_inverse=True)
+    tracks, track_index = np.unique(track_ids, return_inverse=True)
+    matrix = sparse.csr_matrix(
+        (np.ones(len(user_index), dtype=np.float32), (user_index, track_index)),
+        shape=(len(users), len(tracks)),
+    )
+    matrix.sum_duplicates()
+    # Downloading a track again doesn't make it more similar to anything
+    matrix.data[:] = 1
+    return matrix, users, tracks
+
+
+def neighbours(matrix, columns, k=None, min_shared=DEFAULT_MIN_SHARED):
+    """Yield (column, neighbour columns, scores) for each of ``columns``,
+    best first, at most ``k`` each (all with k=None)"""
+    counts = np.asarray(matrix.sum(axis=0)).ravel()
+    norms = np.sqrt(counts)
+    by_track = matrix.T.tocsr()
+    for start in range(0, len(columns), BLOCK_SIZE):
+        block = np.asarray(columns[start:start + BLOCK_SIZE])
+        # Row i, column j: users who downloaded both block[i] and j
+        shared = (by_track[block] @ matrix).tocsr()
+        rows = np.repeat(np.arange(len(block)), np.diff(shared.indptr))
+        scores = shared.data / (norms[block][rows] * norms[shared.indices])
+        keep = (shared.data >= min_shared) & (shared.indices != block[rows])
+        scores[~keep] = 0
+        for row, column in enumerate(block):
+            begin, end = shared.indptr[row], shared.indptr[row + 1]
+            row_scores = scores[begin:end]
+            others = shared.indices[begin:end]
+            if k is not None and len(row_scores) > k:
+                top = np.argpartition(-row_scores, k - 1)[:k]
+                row_scores, others = row_scores[top], others[top]
+            order = np.argsort(-row_scores, kind='stable')
+            row_scores, others = row_scores[order], others[order]
+            positive = row_scores > 0
+            yield column, others[positive], row_scores[positive]
+
+
+def stale_columns(matrix, new_rows, new_columns, thresholds, min_shared=DEFAULT_MIN_SHARED):
+    """Columns to recompute after new downloads.
+
+    ``new_rows``/``new_columns`` are the user/track pairs added since the
+    last build, and ``thresholds`` is each column's current k-th best score
+    (0 below k neighbours). A new pair (u, t) raises the co-download counts
+    of t with every other track of u. So t is recomputed, and so is every
+    such track that t now scores high enough to get into the top k of.
+    Tracks that merely list t keep a slightly outdated score for it (its
+    user count grew) until the next full build.
+    """
+    changed = np.unique(new_columns)
+    # Row t, column s: t and s share a user who downloaded t since the last build
+    added = sparse.csr_matrix(
+        (np.ones(len(new_rows), dtype=np.float32), (new_rows, new_columns)), shape=matrix.shape,
+    )
+    candidates = (added.T.tocsr()[changed] @ matrix).tocsr()
+    counts = np.asarray(matrix.sum(axis=0)).ravel()
+    by_track = matrix.T.tocsr()
+    stale = [changed]
+    for start in range(0, len(changed), BLOCK_SIZE):
+        block = changed[start:start + BLOCK_SIZE]
+        # Full co-download counts, at the candidate pairs only
+        shared = (by_track[block] @ matrix).multiply(candidates[start:start + BLOCK_SIZE] > 0).tocoo()
+        rows, others = block[shared.row], shared.col
+        scores = shared.data / np.sqrt(counts[rows] * counts[others])
+        stale.append(others[(shared.data >= min_shared) & (others != rows) & (scores >= thresholds[others])])
+    return np.unique(np.concatenate(stale))
+
+
+def _thresholds(tracks, k):
+    """Current k-th best stored score of each track (0 below k neighbours)"""
+    thresholds = np.zeros(len(tracks))
+    stored = SimilarTrack.objects.values('track_id').annotate(count=Count('pk'), lowest=Min('score'))
+    for row in stored.filter(count__gte=k).iterator():
+        column = np.searchsorted(tracks, row['track_id'])
+        if column < len(tracks) and tracks[column] == row['track_id']:
+            thresholds[column] = row['lowest']
+    return thresholds
+
+
+def _load_downloads(up_to):
+    rows = DownloadLog.objects.filter(pk__lte=up_to).values_list('user_id', 'track_id').distinct()
+    pairs = np.fromiter(rows.iterator(chunk_size=10000), dtype=[('user', np.int64), ('track', np.int64)])
+    return pairs['user'], pairs['track']
+
+
+def _store(track_ids, rows):
+    """Replace the neighbours of ``track_ids`` with ``rows``"""
+    with transaction.atomic():
+        SimilarTrack.objects.filter(track_id__in=track_ids).delete()
+        SimilarTrack.objects.bulk_create(rows, batch_size=1000)
+
+
+def build(full=False, k=None, min_shared=DEFAULT_MIN_SHARED, log=None):
+    """Recompute stored neighbours for tracks with new downloads (or all
+    tracks with ``full``). Returns the SimilarTracksRun, or None if there
+    was nothing new to process."""
+    log = log or (lambda message: None)
+    k = k or settings.MUSIC_SIMILAR_TRACKS
+    started = time.monotonic()
+    last_run = SimilarTracksRun.objects.order_by('-pk').first()
+    watermark = 0 if full or last_run is None else last_run.last_download_id
+    # Downloads logged while the build runs are left for the next one
+    up_to = DownloadLog.objects.aggregate(last=Max('pk'))['last'] or 0
+    if up_to <= watermark and not full:
+        return None
+
+    tracks_updated = 0
+    if up_to > watermark:
+        user_ids, track_ids = _load_downloads(up_to)
+        matrix, users, tracks = download_matrix(user_ids, track_ids)
+        log(f'Loaded {matrix.nnz} user/track pairs ({matrix.shape[0]} users, {matrix.shape[1]} tracks) '
+            f'in {time.monotonic() - started:.1f}s')
+        if watermark:
+            # Pairs downloaded since the last build, and never before it
+            new_pairs = DownloadLog.objects.filter(pk__gt=watermark, pk__lte=up_to).exclude(
+                Exists(DownloadLog.objects.filter(
+                    user_id=OuterRef('user_id'), track_id=OuterRef('track_id'), pk__lte=watermark,
+                ))
+            ).values_list('user_id', 'track_id').distinct()
+            new_pairs = np.fromiter(new_pairs.iterator(), dtype=[('user', np.int64), ('track', np.int64)])
+            columns = stale_columns(
+                matrix, np.searchsorted(users, new_pairs['user']), np.searchsorted(tracks, new_pairs['track']),
+                _thresholds(tracks, k), min_shared,
+            )
+        else:
+            columns = np.arange(len(tracks))
+        log(f'Recomputing {len(columns)} tracks')
+
+        # Tracks deleted since their downloads were read can't be referenced
+        existing = set(Track.objects.values_list('pk', flat=True))
+        batch_ids, batch_rows = [], []
+        for column, others, scores in neighbours(matrix, columns, k, min_shared):
+            track_id = int(tracks[column])
+            if track_id not in existing:
+                continue
+            batch_ids.append(track_id)
+            batch_rows.extend(
+                SimilarTrack(track_id=track_id, similar_id=int(similar_id), score=float(score))
+                for similar_id, score in zip(tracks[others], scores)
+                if int(similar_id) in existing
+            )
+            if len(batch_ids) >= BLOCK_SIZE:
+                _store(batch_ids, batch_rows)
+                tracks_updated += len(batch_ids)
+                batch_ids, batch_rows = [], []
+        if batch_ids:
+            _store(batch_ids, batch_rows)
+            tracks_updated += len(batch_ids)
+
+    if full:
+        # Tracks nobody has downloaded any more (e.g. their users were deleted)
+        SimilarTrack.objects.filter(
+            ~Exists(DownloadLog.objects.filter(track_id=OuterRef('track_id')))
+        ).delete()
+
+    return SimilarTracksRun.objects.create(
+        last_download_id=max(up_to, watermark),
+        full=full,
+        tracks_updated=tracks_updated,
+        seconds=time.monotonic() - started,
+    )
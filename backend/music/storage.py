@@ -0,0 +1,164 @@
+"""Helpers for working with the media storage backends (local or S3)."""
+import hashlib
+import os
+import posixpath
+
+from botocore.exceptions import ClientError
+from django.conf import settings
+from django.core.files import File
+from django.core.files.storage import FileSystemStorage
+from storages.backends.s3 import S3Storage
+from storages.utils import clean_name
+
+from .mediacache import get_media_cache
+
+
+def is_s3_storage(storage):
+    """Return True if the storage is a django-storages S3 backend"""
+    return hasattr(storage, 'bucket') and hasattr(storage, '_normalize_name')
+
+
+def s3_key(storage, name):
+    """Translate a FileField name into the full S3 object key (including location)"""
+    return storage._normalize_name(clean_name(name))
+
+
+def s3_object(storage, name):
+    """Return the boto3 ``Object`` resource backing a stored file"""
+    return storage.bucket.Object(s3_key(storage, name))
+
+
+def local_path(storage, name):
+    """Return the filesystem path of a stored file, or None for remote storages"""
+    try:
+        return storage.path(name)
+    except NotImplementedError:
+        return None
+
+
+def presigned_url(storage, name, expires=3600):
+    """Return a time-limited GET URL for an S3 object, regardless of querystring_auth"""
+    return storage.bucket.meta.client.generate_presigned_url(
+        'get_object',
+        Params={'Bucket': storage.bucket_name, 'Key': s3_key(storage, name)},
+        ExpiresIn=expires,
+    )
+
+
+def content_hash(content):
+    """SHA-256 of a File, reusing the digest the upload handler computed if present"""
+    digest = getattr(content, 'sha256', None)
+    if digest:
+        return digest
+    hasher = hashlib.sha256()
+    for chunk in content.chunks():
+        hasher.update(chunk)
+    content.seek(0)
+    return hasher.hexdigest()
+
+
+def content_name(name, sha256):
+    """``tracks/song.mp3`` -> ``tracks/ab/ab12...ef.mp3``"""
+    prefix = os.path.dirname(name)
+    extension = os.path.splitext(name)[1].lower()
+    return posixpath.join(prefix, sha256[:2], f'{sha256}{extension}')
+
+
+def is_content_name(name):
+    """True if a stored name already has the ``<prefix>/<ab>/<sha256>.<ext>`` form"""
+    parts = name.split('/')
+    stem = os.path.splitext(parts[-1])[0]
+    return (len(parts) >= 2 and len(stem) == 64 and parts[-2] == stem[:2]
+            and all(c in '0123456789abcdef' for c in stem))
+
+
+def versioned_url(url, name, version):
+    """Add ``?v=<version>`` to the URL of a file whose name doesn't already pin its content"""
+    if not version or is_content_name(name):
+        return url
+    return f'{url}{"&" if "?" in url else "?"}v={version}'
+
+
+def open_stream(storage, name):
+    """Open a stored file for one sequential read without buffering it whole.
+
+    django-storages' S3File downloads the entire object into a temp file on
+    first read; the raw GetObject body streams instead. Files in the local
+    media cache are opened from disk.
+    """
+    if is_s3_storage(storage) and get_media_cache() is None:
+        return s3_object(storage, name).get()['Body']
+    return storage.open(name, 'rb')
+
+
+def file_version(field_file):
+    """The owning row's ``updated_at`` as a URL version, if it has one"""
+    updated_at = getattr(field_file.instance, 'updated_at', None)
+    return int(updated_at.timestamp()) if updated_at else None
+
+
+def media_url(field_file):
+    """URL of a stored file that changes whenever the file does.
+
+    Content-addressed names change with the bytes on their own; other names
+    get the owning row's ``updated_at`` as a version.
+    """
+    if not field_file:
+        return None
+    return versioned_url(field_file.url, field_file.name, file_version(field_file))
+
+
+class ContentAddressedMixin:
+    """Store files under the hash of their bytes.
+
+    The requested name only contributes its directory and extension. Saving
+    bytes that are already stored skips the upload and returns the existing
+    name, so identical files share one object (see music.blobs for the
+    reference counting that decides when it can be deleted).
+    """
+
+    def save(self, name, content, max_length=None):
+        if name is None:
+            name = content.name
+        if not hasattr(content, 'chunks'):
+            content = File(content, name)
+        name = content_name(self.generate_filename(name), content_hash(content))
+        if self.exists(name):
+            return name
+        return self._save(name, content)
+
+
+class ContentAddressedFileSystemStorage(ContentAddressedMixin, FileSystemStorage):
+    pass
+
+
+class CachedReadMixin:
+    """Read S3 objects through the local disk cache (see music.mediacache), if enabled"""
+
+    def _open(self, name, mode='rb'):
+        media_cache = get_media_cache()
+        if media_cache is None or 'w' in mode:
+            return super()._open(name, mode)
+        key = s3_key(self, name)
+
+        def fill(out):
+            try:
+                self.bucket.meta.client.download_fileobj(self.bucket_name, key, out)
+            except ClientError as e:
+                if e.response.get('Error', {}).get('Code') in ('404', 'NoSuchKey'):
+                    raise FileNotFoundError(f"File does not exist: {name}")
+                raise
+
+        return File(media_cache.open(key, fill), name)
+
+
+class ContentAddressedS3Storage(ContentAddressedMixin, CachedReadMixin, S3Storage):
+    pass
+
+
+def media_storage():
+    """Content-addressed version of the default storage, for FileField(storage=...)"""
+    config = settings.STORAGES['default']
+    if config['BACKEND'].startswith('storages.backends.s3'):
+        return ContentAddressedS3Storage(**config.get('OPTIONS', {}))
+    return ContentAddressedFileSystemStorage(**config.get('OPTIONS', {}))
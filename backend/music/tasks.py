@@ -0,0 +1,76 @@
+"""Background job handlers (queued with music.jobs.enqueue)"""
+import logging
+import struct
+
+import requests
+from django.core.files.base import ContentFile
+from django.utils.text import slugify
+
+from .jobs import PermanentJobError, job_handler
+from .images import ImageVariantError, generate_variants, queue_image_variants
+from .models import Album, Artist, Track
+from .previews import PreviewError, generate_preview
+from .probe import ProbeError, probe_storage_file
+
+logger = logging.getLogger(__name__)
+
+
+def _get(model, pk):
+    try:
+        return model.objects.get(pk=pk)
+    except model.DoesNotExist:
+        raise PermanentJobError(f"{model.__name__} {pk} no longer exists")
+
+
+@job_handler('fetch_album_cover')
+def fetch_album_cover(album_id, url):
+    """Download a cover image from a URL and attach it to the album"""
+    album = _get(Album, album_id)
+    response = requests.get(url, timeout=10)
+    if 400 <= response.status_code < 500:
+        raise PermanentJobError(f"Cover download failed: HTTP {response.status_code}")
+    response.raise_for_status()
+
+    # Use slugify to create a safe filename for S3
+    safe_filename = slugify(album.title) or "album-cover"
+    album.cover_image.save(f"{safe_filename}.jpg", ContentFile(response.content), save=True)
+    logger.info(f"Album cover downloaded and saved: {album.cover_image.name}")
+    queue_image_variants(album)
+    return {'cover_image': album.cover_image.name}
+
+
+@job_handler('probe_track')
+def probe_track(track_id):
+    """Read duration, sample rate and bitrate from the stored track file"""
+    track = _get(Track, track_id)
+    try:
+        info = probe_storage_file(track.file.name, track.file.storage)
+    except (ProbeError, struct.error) as e:
+        raise PermanentJobError(f"Could not probe {track.file.name}: {str(e)}")
+    track.apply_audio_info(info)
+    track.save(update_fields=['duration', 'sample_rate', 'bitrate', 'probed_at'])
+    return {'duration': track.duration, 'sample_rate': track.sample_rate, 'bitrate': track.bitrate}
+
+
+@job_handler('generate_preview')
+def generate_track_preview(track_id):
+    """Create a preview clip for a track that was uploaded without one"""
+    track = _get(Track, track_id)
+    if track.preview_file:
+        return {'preview_file': track.preview_file.name, 'skipped': True}
+    try:
+        name = generate_preview(track)
+    except (PreviewError, ProbeError, struct.error) as e:
+        raise PermanentJobError(str(e))
+    return {'preview_file': name}
+
+
+@job_handler('generate_image_variants')
+def generate_image_variants(model, id):
+    """Render resized variants of an album cover or artist image"""
+    obj = _get({'album': Album, 'artist': Artist}[model], id)
+    try:
+        variants = generate_variants(obj)
+    except ImageVariantError as e:
+        raise PermanentJobError(str(e))
+    return {'sizes': sorted(variants.get('sizes', {}), key=int)}
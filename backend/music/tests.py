@@ -1,3 +1,1335 @@
-from django.test import TestCase
+from types import SimpleNamespace
+from unittest import mock
+import base64
+import datetime
+import hashlib
+import io
+import itertools
+import os
+import shutil
+import struct
+import tempfile
+import zipfile
 
-# Create your tests here.
+from asgiref.sync import async_to_sync
+import boto3
+from botocore.exceptions import ClientError
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.management import call_command
+from django.db import DatabaseError, connections
+from django.test import TestCase, TransactionTestCase, override_settings
+from PIL import Image
+from rest_framework.exceptions import Throttled
+from rest_framework.test import APIClient
+
+from . import playlists, uploads, zipstream
+from .batch import Batch, Progress, worker_map
+from .catalog import queue_track_processing, resolve_artist_album
+from .images import build_variants, generate_variants
+from .jobs import enqueue
+from .models import Album, Artist, DownloadLog, Playlist, PlaylistItem, Track, UploadSession
+from .probe import ProbeError, probe_file
+from .ranks import FIRST_RANK, SMALLEST_INTEGER, RankError, rank_between, ranks_between
+from .storage import is_content_name
+from .throttling import (
+    AsyncThrottledIterator, FileChunks, ListRateThrottle, SearchRateThrottle, ThrottledIterator, acquire_stream,
+)
+
+
+def make_track(title='Song', artist_name='Artist', album_title='Album', **fields):
+    artist, album = resolve_artist_album({'artist_name': artist_name, 'album_title': album_title})
+    fields.setdefault('duration', 180)
+    fields.setdefault('file', f'tracks/{title}.mp3')
+    return Track.objects.create(title=title, artist=artist, album=album, **fields)
+
+
+class APITestBase(TestCase):
+    def setUp(self):
+        # Throttle and stream slot counters live in the cache
+        cache.clear()
+        self.user = get_user_model().objects.create_user('listener', password='secret-password')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+
+def sha256_hex(data):
+    return hashlib.sha256(data).hexdigest()
+
+
+def _s3_error(code, operation):
+    return ClientError({'Error': {'Code': code, 'Message': code}}, operation)
+
+
+class FakeS3Client:
+    """In-memory stand-in for the boto3 S3 client calls music.uploads makes.
+
+    Presigned URLs come from a real client with dummy credentials (signing
+    needs no network). ``put_part`` plays the browser's PUT to such a URL.
+    """
+
+    def __init__(self):
+        self.objects = {}
+        self.uploads = {}
+        self._ids = itertools.count(1)
+        self._signer = boto3.client(
+            's3', region_name='us-east-1', aws_access_key_id='test', aws_secret_access_key='test',
+        )
+        # Makes complete_multipart_upload store a damaged object
+        self.truncate_completed = False
+
+    def generate_presigned_url(self, *args, **kwargs):
+        return self._signer.generate_presigned_url(*args, **kwargs)
+
+    def create_multipart_upload(self, Bucket, Key, ChecksumAlgorithm=None, **kwargs):
+        upload_id = f'upload-{next(self._ids)}'
+        self.uploads[upload_id] = {'key': Key, 'checksums': ChecksumAlgorithm == 'SHA256', 'parts': {}}
+        return {'UploadId': upload_id}
+
+    def _upload(self, upload_id, operation):
+        if upload_id not in self.uploads:
+            raise _s3_error('NoSuchUpload', operation)
+        return self.uploads[upload_id]
+
+    def put_part(self, upload_id, number, body):
+        self._upload(upload_id, 'UploadPart')['parts'][number] = body
+        return f'"{hashlib.md5(body).hexdigest()}"'
+
+    def upload_part(self, Bucket, Key, UploadId, PartNumber, Body, ContentLength):
+        return {'ETag': self.put_part(UploadId, PartNumber, Body.read())}
+
+    def list_parts(self, Bucket, Key, UploadId, **kwargs):
+        upload = self._upload(UploadId, 'ListParts')
+        parts = []
+        for number, body in sorted(upload['parts'].items()):
+            part = {'PartNumber': number, 'Size': len(body), 'ETag': f'"{hashlib.md5(body).hexdigest()}"'}
+            if upload['checksums']:
+                part['ChecksumSHA256'] = base64.b64encode(hashlib.sha256(body).digest()).decode()
+            parts.append(part)
+        return {'Parts': parts, 'IsTruncated': False}
+
+    def complete_multipart_upload(self, Bucket, Key, UploadId, MultipartUpload):
+        upload = self._upload(UploadId, 'CompleteMultipartUpload')
+        bodies = []
+        for part in MultipartUpload['Parts']:
+            body = upload['parts'].get(part['PartNumber'])
+            if body is None or part['ETag'] != f'"{hashlib.md5(body).hexdigest()}"':
+                raise _s3_error('InvalidPart', 'CompleteMultipartUpload')
+            bodies.append(body)
+        data = b''.join(bodies)
+        if self.truncate_completed:
+            data = data[:-1]
+        checksum = None
+        if upload['checksums']:
+            composite = hashlib.sha256(b''.join(hashlib.sha256(body).digest() for body in bodies)).digest()
+            checksum = f'{base64.b64encode(composite).decode()}-{len(bodies)}'
+        self.objects[Key] = (data, checksum)
+        del self.uploads[UploadId]
+        return {}
+
+    def abort_multipart_upload(self, Bucket, Key, UploadId):
+        self._upload(UploadId, 'AbortMultipartUpload')
+        del self.uploads[UploadId]
+
+    def head_object(self, Bucket, Key, **kwargs):
+        if Key not in self.objects:
+            raise _s3_error('404', 'HeadObject')
+        data, checksum = self.objects[Key]
+        head = {'ContentLength': len(data)}
+        if checksum:
+            head['ChecksumSHA256'] = checksum
+        return head
+
+    def delete_object(self, Bucket, Key):
+        self.objects.pop(Key, None)
+
+
+class FakeS3Storage:
+    """Just enough of S3Storage for music.storage.is_s3_storage and s3_key"""
+    bucket_name = 'test-bucket'
+
+    def __init__(self):
+        self.bucket = SimpleNamespace(meta=SimpleNamespace(client=FakeS3Client()))
+
+    def _normalize_name(self, name):
+        return f'media/{name}'
+
+    def get_available_name(self, name, max_length=None):
+        return name
+
+    def get_object_parameters(self, name):
+        return {}
+
+
+class S3UploadTestBase(TestCase):
+    def setUp(self):
+        self.admin = get_user_model().objects.create_user('admin', password='secret-password', is_staff=True)
+        self.client = APIClient()
+        self.client.force_authenticate(self.admin)
+        self.storage = FakeS3Storage()
+        self.s3 = self.storage.bucket.meta.client
+        patcher = mock.patch.object(uploads, '_track_storage', return_value=self.storage)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+
+class RankTests(TestCase):
+    def test_first_rank(self):
+        self.assertEqual(rank_between(None, None), FIRST_RANK)
+
+    def test_append_and_prepend_stay_short(self):
+        rank = FIRST_RANK
+        for _ in range(1000):
+            following = rank_between(rank, None)
+            self.assertGreater(following, rank)
+            rank = following
+        self.assertLessEqual(len(rank), 3)
+        rank = FIRST_RANK
+        for _ in range(1000):
+            preceding = rank_between(None, rank)
+            self.assertLess(preceding, rank)
+            rank = preceding
+        self.assertLessEqual(len(rank), 3)
+
+    def test_between(self):
+        before, after = FIRST_RANK, rank_between(FIRST_RANK, None)
+        for _ in range(50):
+            middle = rank_between(before, after)
+            self.assertTrue(before < middle < after)
+            # Keep inserting right after the same item
+            after = middle
+        self.assertLess(len(after), 20)
+
+    def test_between_requires_order(self):
+        with self.assertRaises(RankError):
+            rank_between('i1', 'i0')
+        with self.assertRaises(RankError):
+            rank_between('i0', 'i0')
+
+    def test_invalid_ranks(self):
+        for rank in ['', 'i', 'i10', '~0']:
+            with self.assertRaises(RankError):
+                rank_between(rank, None)
+
+    def test_smallest_and_largest_integers(self):
+        with self.assertRaises(RankError):
+            rank_between(None, SMALLEST_INTEGER)
+        preceding = rank_between(None, SMALLEST_INTEGER + 'i')
+        self.assertTrue(SMALLEST_INTEGER < preceding < SMALLEST_INTEGER + 'i')
+        self.assertLess(rank_between(None, preceding), preceding)
+        largest = 'z' * 19
+        following = rank_between(largest, None)
+        self.assertGreater(following, largest)
+        self.assertGreater(rank_between(following, None), following)
+
+    def test_ranks_between(self):
+        for before, after in [(None, None), ('i0', None), (None, 'i0'), ('i0', 'i1')]:
+            ranks = ranks_between(before, after, 25)
+            self.assertEqual(ranks, sorted(set(ranks)))
+            self.assertEqual(len(ranks), 25)
+            if before is not None:
+                self.assertGreater(ranks[0], before)
+            if after is not None:
+                self.assertLess(ranks[-1], after)
+        self.assertEqual(ranks_between('i0', None, 0), [])
+
+
+class PlaylistTests(APITestBase):
+    def setUp(self):
+        super().setUp()
+        self.tracks = [make_track(f'Song {n}') for n in range(5)]
+        self.playlist = Playlist.objects.create(user=self.user, name='Mix')
+        self.url = f'/api/music/playlists/{self.playlist.pk}/items/'
+
+    def track_order(self):
+        return list(PlaylistItem.objects.filter(playlist=self.playlist).order_by('rank')
+                    .values_list('track_id', flat=True))
+
+    def add(self, tracks, **extra):
+        return self.client.post(self.url, {'track_ids': [t.pk for t in tracks], **extra}, format='json')
+
+    def test_append_and_insert(self):
+        response = self.add(self.tracks[:2])
+        self.assertEqual(response.status_code, 201)
+        first = response.json()[0]['id']
+        self.assertEqual(self.add(self.tracks[2:3], after=None).status_code, 201)
+        self.assertEqual(self.add(self.tracks[3:5], after=first).status_code, 201)
+        t = [track.pk for track in self.tracks]
+        self.assertEqual(self.track_order(), [t[2], t[0], t[3], t[4], t[1]])
+
+    def test_insert_rejects_unknown_tracks_and_items(self):
+        response = self.client.post(self.url, {'track_ids': [999999]}, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()['missing'], [999999])
+        self.assertEqual(self.add(self.tracks[:1], after='x').status_code, 404)
+
+    def test_move(self):
+        items = self.add(self.tracks[:3]).json()
+        url = f'{self.url}{items[2]["id"]}/'
+        self.assertEqual(self.client.patch(url, {'after': None}, format='json').status_code, 200)
+        t = [track.pk for track in self.tracks]
+        self.assertEqual(self.track_order(), [t[2], t[0], t[1]])
+        self.client.patch(url, {'after': items[0]['id']}, format='json')
+        self.assertEqual(self.track_order(), [t[0], t[2], t[1]])
+        self.assertEqual(self.client.patch(url, {}, format='json').status_code, 400)
+
+    def test_move_writes_one_row(self):
+        items = self.add(self.tracks).json()
+        ranks = dict(PlaylistItem.objects.values_list('pk', 'rank'))
+        self.client.patch(f'{self.url}{items[0]["id"]}/', {'after': items[-1]['id']}, format='json')
+        changed = [pk for pk, rank in PlaylistItem.objects.values_list('pk', 'rank') if ranks[pk] != rank]
+        self.assertEqual(changed, [items[0]['id']])
+
+    def test_other_users_playlists_are_hidden(self):
+        other = get_user_model().objects.create_user('other', password='secret-password')
+        client = APIClient()
+        client.force_authenticate(other)
+        self.assertEqual(client.get(self.url).status_code, 404)
+
+    def test_cursor_pagination(self):
+        self.add(self.tracks)
+        seen = []
+        url = f'{self.url}?limit=2'
+        while url:
+            page = self.client.get(url).json()
+            self.assertLessEqual(len(page['results']), 2)
+            seen += [item['track']['id'] for item in page['results']]
+            url = page['next']
+        self.assertEqual(seen, [track.pk for track in self.tracks])
+
+    def test_rebalance_keeps_items(self):
+        self.add(self.tracks)
+        before = {item.pk: item.added_at for item in PlaylistItem.objects.all()}
+        order = self.track_order()
+        playlists.rebalance(self.playlist)
+        after = {item.pk: item.added_at for item in PlaylistItem.objects.all()}
+        self.assertEqual(after, before)
+        self.assertEqual(self.track_order(), order)
+
+    def test_deep_inserts_trigger_rebalance(self):
+        items = playlists.add_tracks(self.playlist, self.tracks[:2])
+        first = items[0]
+        with mock.patch.object(playlists, 'MAX_RANK_LENGTH', 6), \
+                mock.patch.object(playlists, 'rebalance', wraps=playlists.rebalance) as rebalance:
+            for _ in range(100):
+                playlists.add_tracks(self.playlist, self.tracks[2:3], after=first)
+            ranks = list(PlaylistItem.objects.values_list('rank', flat=True))
+            self.assertLessEqual(max(len(rank) for rank in ranks), playlists.MAX_RANK_LENGTH)
+        self.assertTrue(rebalance.called)
+        self.assertEqual(len(ranks), 102)
+        self.assertEqual(self.track_order()[0], self.tracks[0].pk)
+        self.assertEqual(self.track_order()[-1], self.tracks[1].pk)
+
+
+class DirectUploadTests(S3UploadTestBase):
+    part_size = uploads.S3_MIN_PART_SIZE
+
+    def setUp(self):
+        super().setUp()
+        self.parts = [b'a' * self.part_size, b'tail of the file']
+        self.data = b''.join(self.parts)
+
+    def create(self, checksums=None, **extra):
+        return self.client.post('/api/admin/direct-uploads/', {
+            'filename': 'Song.flac',
+            'size': len(self.data),
+            'part_size': self.part_size,
+            'part_checksums': checksums or [sha256_hex(part) for part in self.parts],
+            'title': 'Direct Song',
+            'artist_name': 'Direct Artist',
+            'album_title': 'Direct Album',
+            **extra,
+        }, format='json')
+
+    def complete(self, session_id):
+        return self.client.post(f'/api/admin/direct-uploads/{session_id}/complete/', {}, format='json')
+
+    def test_presigned_part_urls(self):
+        response = self.create()
+        self.assertEqual(response.status_code, 201)
+        body = response.json()
+        session = UploadSession.objects.get(pk=body['id'])
+        self.assertEqual(session.backend, UploadSession.BACKEND_S3_DIRECT)
+        self.assertEqual([url['part_number'] for url in body['urls']], [1, 2])
+        self.assertEqual([url['size'] for url in body['urls']], [len(part) for part in self.parts])
+        for url, part in zip(body['urls'], self.parts):
+            checksum = base64.b64encode(hashlib.sha256(part).digest()).decode()
+            self.assertEqual(url['headers'], {'x-amz-checksum-sha256': checksum})
+            self.assertIn(f'uploadId={session.s3_upload_id}', url['url'])
+            self.assertIn(f'partNumber={url["part_number"]}', url['url'])
+            self.assertIn('x-amz-checksum-sha256', url['url'])
+
+    def test_create_validates_parts(self):
+        self.assertEqual(self.create(part_size=1024).status_code, 400)
+        self.assertEqual(self.create(checksums=['00' * 32]).status_code, 400)
+        self.assertEqual(self.create(checksums=['abc', 'def']).status_code, 400)
+
+    def test_complete_creates_track(self):
+        session_id = self.create().json()['id']
+        session = UploadSession.objects.get(pk=session_id)
+        for number, part in enumerate(self.parts, start=1):
+            self.s3.put_part(session.s3_upload_id, number, part)
+
+        response = self.complete(session_id)
+        self.assertEqual(response.status_code, 201)
+        track = Track.objects.get(pk=response.json()['id'])
+        self.assertEqual(track.title, 'Direct Song')
+        self.assertEqual(track.file.name, session.storage_name)
+        self.assertEqual(self.s3.objects[f'media/{session.storage_name}'][0], self.data)
+        session.refresh_from_db()
+        self.assertEqual(session.status, UploadSession.STATUS_COMPLETE)
+        self.assertEqual(session.track, track)
+        # A retried completion returns the same track
+        self.assertEqual(self.complete(session_id).json()['id'], track.pk)
+        self.assertEqual(Track.objects.count(), 1)
+
+    def test_missing_part(self):
+        session_id = self.create().json()['id']
+        session = UploadSession.objects.get(pk=session_id)
+        self.s3.put_part(session.s3_upload_id, 1, self.parts[0])
+
+        response = self.complete(session_id)
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('missing parts: [2]', response.json()['error'])
+        session.refresh_from_db()
+        self.assertEqual(session.status, UploadSession.STATUS_ACTIVE)
+        # Resuming hands out URLs for the missing part only
+        resumed = self.client.get(f'/api/admin/direct-uploads/{session_id}/').json()
+        self.assertEqual([url['part_number'] for url in resumed['urls']], [2])
+
+        self.s3.put_part(session.s3_upload_id, 2, self.parts[1])
+        self.assertEqual(self.complete(session_id).status_code, 201)
+
+    def test_checksum_mismatch(self):
+        session_id = self.create().json()['id']
+        session = UploadSession.objects.get(pk=session_id)
+        self.s3.put_part(session.s3_upload_id, 1, self.parts[0])
+        self.s3.put_part(session.s3_upload_id, 2, b'TAIL OF THE FILE')
+
+        response = self.complete(session_id)
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('part 2 checksum mismatch', response.json()['error'])
+        self.assertFalse(Track.objects.exists())
+
+    def test_wrong_part_size(self):
+        session_id = self.create().json()['id']
+        session = UploadSession.objects.get(pk=session_id)
+        self.s3.put_part(session.s3_upload_id, 1, self.parts[0][:-1])
+        response = self.complete(session_id)
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('part 1 has the wrong size', response.json()['error'])
+
+    def test_client_etags_must_match(self):
+        session_id = self.create().json()['id']
+        session = UploadSession.objects.get(pk=session_id)
+        for number, part in enumerate(self.parts, start=1):
+            self.s3.put_part(session.s3_upload_id, number, part)
+        response = self.client.post(f'/api/admin/direct-uploads/{session_id}/complete/', {
+            'parts': [{'part_number': 1, 'etag': '"not-the-etag"'}],
+        }, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('part 1 was not received', response.json()['error'])
+
+    def test_damaged_object_ends_session(self):
+        session_id = self.create().json()['id']
+        session = UploadSession.objects.get(pk=session_id)
+        for number, part in enumerate(self.parts, start=1):
+            self.s3.put_part(session.s3_upload_id, number, part)
+        self.s3.truncate_completed = True
+
+        with self.assertLogs('music.uploads', 'ERROR'):
+            response = self.complete(session_id)
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('stored object is', response.json()['error'])
+        session.refresh_from_db()
+        self.assertEqual(session.status, UploadSession.STATUS_ABORTED)
+        self.assertEqual(self.s3.objects, {})
+        self.assertFalse(Track.objects.exists())
+        # The UploadId is spent; a retry is refused rather than completing it again
+        self.assertEqual(self.complete(session_id).status_code, 400)
+
+    def test_abort(self):
+        session_id = self.create().json()['id']
+        session = UploadSession.objects.get(pk=session_id)
+        self.assertEqual(self.client.delete(f'/api/admin/direct-uploads/{session_id}/').status_code, 204)
+        session.refresh_from_db()
+        self.assertEqual(session.status, UploadSession.STATUS_ABORTED)
+        self.assertEqual(self.s3.uploads, {})
+
+    def test_requires_s3(self):
+        with mock.patch.object(uploads, '_track_storage', return_value=Track._meta.get_field('file').storage):
+            response = self.create()
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('require S3', response.json()['error'])
+
+
+class ChunkedUploadMixin:
+    chunk_size = 1000
+
+    def setUp(self):
+        super().setUp()
+        self.chunks = [bytes([65 + n]) * self.chunk_size for n in range(2)] + [b'end of file']
+        self.data = b''.join(self.chunks)
+
+    def create(self):
+        response = self.client.post('/api/admin/uploads/', {
+            'filename': 'Song.mp3',
+            'size': len(self.data),
+            'title': 'Chunked Song',
+            'artist_name': 'Chunked Artist',
+            'album_title': 'Chunked Album',
+        }, format='json')
+        self.assertEqual(response.status_code, 201)
+        return response.json()['id']
+
+    def put(self, session_id, number, body=None, sha256=None, offset=None, **extra):
+        body = self.chunks[number - 1] if body is None else body
+        offset = (number - 1) * self.chunk_size if offset is None else offset
+        return self.client.put(
+            f'/api/admin/uploads/{session_id}/?offset={offset}', body,
+            content_type='application/octet-stream',
+            HTTP_X_CHUNK_SHA256=sha256 or sha256_hex(body), **extra,
+        )
+
+    def missing(self, session_id):
+        return self.client.get(f'/api/admin/uploads/{session_id}/').json()['missing_parts']
+
+    def finalize(self, session_id):
+        return self.client.post(f'/api/admin/uploads/{session_id}/finalize/', {}, format='json')
+
+
+@override_settings(MUSIC_UPLOAD_CHUNK_SIZE=ChunkedUploadMixin.chunk_size)
+class ChunkedUploadTests(ChunkedUploadMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root, ignore_errors=True)
+        self.enterContext(override_settings(
+            MEDIA_ROOT=media_root, MUSIC_UPLOAD_TEMP_DIR=os.path.join(media_root, 'uploads'),
+        ))
+        self.admin = get_user_model().objects.create_user('admin', password='secret-password', is_staff=True)
+        self.client = APIClient()
+        self.client.force_authenticate(self.admin)
+
+    def assert_track_has_the_file(self, response):
+        self.assertEqual(response.status_code, 201)
+        track = Track.objects.get(pk=response.json()['id'])
+        self.assertEqual(track.title, 'Chunked Song')
+        with track.file.open('rb') as fh:
+            self.assertEqual(fh.read(), self.data)
+        return track
+
+    def test_parts_in_any_order(self):
+        session_id = self.create()
+        self.assertEqual(self.missing(session_id), [1, 2, 3])
+        for number in (3, 1, 2):
+            self.assertEqual(self.put(session_id, number).status_code, 200)
+        self.assertEqual(self.missing(session_id), [])
+        track = self.assert_track_has_the_file(self.finalize(session_id))
+        session = UploadSession.objects.get(pk=session_id)
+        self.assertEqual((session.status, session.track), (UploadSession.STATUS_COMPLETE, track))
+        self.assertFalse(os.path.exists(session.temp_path))
+
+    def test_duplicate_part_is_accepted_once(self):
+        session_id = self.create()
+        self.put(session_id, 1)
+        response = self.put(session_id, 1)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['received_bytes'], self.chunk_size)
+        self.put(session_id, 2)
+        self.put(session_id, 3)
+        self.assert_track_has_the_file(self.finalize(session_id))
+
+    def test_wrong_part_size_or_offset(self):
+        session_id = self.create()
+        short = self.put(session_id, 1, body=self.chunks[0][:-1])
+        self.assertEqual(short.status_code, 400)
+        self.assertIn('must be 1000 bytes', short.json()['error'])
+        # Only the last part may be short, and only by the right amount
+        self.assertEqual(self.put(session_id, 3, body=b'end').status_code, 400)
+        self.assertEqual(self.put(session_id, 1, offset=10).status_code, 400)
+        self.assertEqual(self.put(session_id, 1, offset=3 * self.chunk_size).status_code, 400)
+        no_offset = self.client.put(f'/api/admin/uploads/{session_id}/', b'x', content_type='application/octet-stream')
+        self.assertEqual(no_offset.status_code, 400)
+        self.assertEqual(self.missing(session_id), [1, 2, 3])
+
+    def test_checksum_mismatch_is_not_recorded_and_can_be_resent(self):
+        session_id = self.create()
+        damaged = self.put(session_id, 2, body=b'X' * self.chunk_size, sha256=sha256_hex(self.chunks[1]))
+        self.assertEqual(damaged.status_code, 400)
+        self.assertIn('checksum mismatch', damaged.json()['error'])
+        self.assertEqual(self.missing(session_id), [1, 2, 3])
+        self.assertEqual(self.put(session_id, 2, sha256=sha256_hex(self.chunks[1]).upper()).status_code, 200)
+        self.put(session_id, 1)
+        self.put(session_id, 3)
+        # The damaged bytes were overwritten by the good chunk
+        self.assert_track_has_the_file(self.finalize(session_id))
+
+    def test_resume_after_interrupted_chunk(self):
+        session_id = self.create()
+        self.put(session_id, 1)
+        # The connection drops partway through the second chunk (the test
+        # client can't send a body shorter than its Content-Length)
+        session = UploadSession.objects.get(pk=session_id)
+        with self.assertRaisesMessage(uploads.UploadError, 'truncated (300 of 1000 bytes)'):
+            uploads.write_chunk(session, self.chunk_size, io.BytesIO(self.chunks[1][:300]),
+                                self.chunk_size, sha256_hex(self.chunks[1]))
+
+        incomplete = self.finalize(session_id)
+        self.assertEqual(incomplete.status_code, 400)
+        self.assertIn('missing parts: [2, 3]', incomplete.json()['error'])
+        self.assertEqual(UploadSession.objects.get(pk=session_id).status, UploadSession.STATUS_ACTIVE)
+
+        for number in self.missing(session_id):
+            self.put(session_id, number)
+        self.assert_track_has_the_file(self.finalize(session_id))
+
+    def test_failed_finalize_can_be_retried(self):
+        session_id = self.create()
+        for number in (1, 2, 3):
+            self.put(session_id, number)
+        with mock.patch('music.uploads.resolve_artist_album', side_effect=DatabaseError('connection lost')):
+            with self.assertRaises(DatabaseError):
+                self.finalize(session_id)
+        self.assertEqual(UploadSession.objects.get(pk=session_id).status, UploadSession.STATUS_ACTIVE)
+        self.assertFalse(Track.objects.exists())
+
+        track = self.assert_track_has_the_file(self.finalize(session_id))
+        # A retried finalize returns the same track
+        self.assertEqual(self.finalize(session_id).json()['id'], track.pk)
+        self.assertEqual(Track.objects.count(), 1)
+
+    def test_abort(self):
+        session_id = self.create()
+        self.put(session_id, 1)
+        temp_path = UploadSession.objects.get(pk=session_id).temp_path
+        self.assertEqual(self.client.delete(f'/api/admin/uploads/{session_id}/').status_code, 204)
+        self.assertFalse(os.path.exists(temp_path))
+        self.assertEqual(self.put(session_id, 2).status_code, 400)
+        self.assertEqual(self.finalize(session_id).status_code, 400)
+
+
+@override_settings(MUSIC_UPLOAD_CHUNK_SIZE=ChunkedUploadMixin.chunk_size)
+class ChunkedS3UploadTests(ChunkedUploadMixin, S3UploadTestBase):
+    def send_all(self, session_id):
+        for number in (2, 3, 1):
+            self.assertEqual(self.put(session_id, number).status_code, 200)
+
+    def test_parts_are_uploaded_and_completed(self):
+        session_id = self.create()
+        session = UploadSession.objects.get(pk=session_id)
+        self.assertEqual(session.backend, UploadSession.BACKEND_S3)
+        self.send_all(session_id)
+        response = self.finalize(session_id)
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(self.s3.objects[f'media/{session.storage_name}'][0], self.data)
+
+    def test_bad_chunk_never_reaches_storage(self):
+        session_id = self.create()
+        session = UploadSession.objects.get(pk=session_id)
+        response = self.put(session_id, 1, body=b'X' * self.chunk_size, sha256=sha256_hex(self.chunks[0]))
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.s3.uploads[session.s3_upload_id]['parts'], {})
+
+    def test_damaged_object_ends_session(self):
+        session_id = self.create()
+        self.send_all(session_id)
+        self.s3.truncate_completed = True
+        with self.assertLogs('music.uploads', 'ERROR'):
+            response = self.finalize(session_id)
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('stored object is', response.json()['error'])
+        self.assertEqual(UploadSession.objects.get(pk=session_id).status, UploadSession.STATUS_ABORTED)
+        self.assertEqual(self.s3.objects, {})
+        self.assertFalse(Track.objects.exists())
+        self.assertEqual(self.finalize(session_id).status_code, 400)
+
+    def test_completion_rejected_by_storage_can_be_retried(self):
+        session_id = self.create()
+        self.send_all(session_id)
+        with mock.patch.object(self.s3, 'complete_multipart_upload',
+                               side_effect=_s3_error('InternalError', 'CompleteMultipartUpload')):
+            response = self.finalize(session_id)
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(UploadSession.objects.get(pk=session_id).status, UploadSession.STATUS_ACTIVE)
+        self.assertEqual(self.finalize(session_id).status_code, 201)
+
+    def test_spent_upload_id_ends_session(self):
+        session_id = self.create()
+        self.send_all(session_id)
+        session = UploadSession.objects.get(pk=session_id)
+        del self.s3.uploads[session.s3_upload_id]
+        with self.assertLogs('music.uploads', 'ERROR'):
+            response = self.finalize(session_id)
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(UploadSession.objects.get(pk=session_id).status, UploadSession.STATUS_ABORTED)
+
+    def test_abort_after_completion_is_refused(self):
+        session_id = self.create()
+        self.send_all(session_id)
+        self.finalize(session_id)
+        response = self.client.delete(f'/api/admin/uploads/{session_id}/')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(UploadSession.objects.get(pk=session_id).status, UploadSession.STATUS_COMPLETE)
+
+
+class JobListTests(TestCase):
+    def setUp(self):
+        self.admin = get_user_model().objects.create_user('admin', password='secret-password', is_staff=True)
+        self.client = APIClient()
+        self.client.force_authenticate(self.admin)
+
+    def kinds(self, **params):
+        response = self.client.get('/api/admin/jobs/', params)
+        self.assertEqual(response.status_code, 200)
+        return sorted(job['kind'] for job in response.json())
+
+    def test_track_filter_includes_album_cover_jobs(self):
+        track = make_track()
+        other = make_track('Other', album_title='Other Album')
+        queue_track_processing(track, cover_url='https://example.com/cover.jpg')
+        queue_track_processing(other, cover_url='https://example.com/other.jpg')
+        enqueue('generate_image_variants', {'model': 'album', 'id': track.album_id})
+        # An artist sharing the album's id is a different object
+        enqueue('generate_image_variants', {'model': 'artist', 'id': track.album_id})
+
+        self.assertEqual(self.kinds(track=track.pk), [
+            'fetch_album_cover', 'generate_image_variants', 'generate_preview', 'probe_track',
+        ])
+        self.assertEqual(self.kinds(track=other.pk), ['fetch_album_cover', 'generate_preview', 'probe_track'])
+        self.assertEqual(self.kinds(track=track.pk, kind='fetch_album_cover'), ['fetch_album_cover'])
+
+    def test_track_filter_for_unknown_track(self):
+        make_track()
+        self.assertEqual(self.kinds(track=999999), [])
+
+    def test_non_numeric_track_is_rejected(self):
+        for value in ('abc', '1.5', '-1'):
+            response = self.client.get('/api/admin/jobs/', {'track': value})
+            self.assertEqual(response.status_code, 400)
+            self.assertEqual(response.json(), {'error': 'track must be a track id'})
+
+
+ZERO_CHUNK = bytes(zipstream.COPY_CHUNK_SIZE)
+
+
+class ZeroFile:
+    """Reads as zero bytes, reusing one buffer for full-size reads"""
+
+    def read(self, size):
+        return ZERO_CHUNK if size == len(ZERO_CHUNK) else bytes(size)
+
+    def close(self):
+        pass
+
+
+class SegmentedArchive(io.RawIOBase):
+    """Seekable view of a streamed archive that keeps its zero-filled data as lengths only"""
+
+    def __init__(self, chunks):
+        self.segments = []
+        self.size = 0
+        for chunk in chunks:
+            zeros = chunk is ZERO_CHUNK
+            if zeros and self.segments and self.segments[-1][1] is None:
+                start, _, length = self.segments[-1]
+                self.segments[-1] = (start, None, length + len(chunk))
+            else:
+                self.segments.append((self.size, None if zeros else chunk, len(chunk)))
+            self.size += len(chunk)
+        self.position = 0
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        self.position = {io.SEEK_SET: 0, io.SEEK_CUR: self.position, io.SEEK_END: self.size}[whence] + offset
+        return self.position
+
+    def tell(self):
+        return self.position
+
+    def readinto(self, buffer):
+        end = min(self.position + len(buffer), self.size)
+        written = 0
+        for start, data, length in self.segments:
+            if start + length <= self.position or start >= end:
+                continue
+            lo, hi = max(start, self.position), min(start + length, end)
+            piece = data[lo - start:hi - start] if data is not None else bytes(hi - lo)
+            buffer[written:written + len(piece)] = piece
+            written += len(piece)
+        self.position += written
+        return written
+
+
+def zip_entry(name, data):
+    return zipstream.ZipEntry(name, len(data), lambda: io.BytesIO(data), datetime.datetime(2024, 5, 17, 12, 30, 44))
+
+
+class ZipStreamTests(TestCase):
+    def stream(self, entries, chunk_size=zipstream.COPY_CHUNK_SIZE):
+        chunks = list(zipstream.stream_archive(entries, chunk_size))
+        self.assertEqual(sum(len(chunk) for chunk in chunks), zipstream.archive_size(entries))
+        return chunks
+
+    def test_plain_archive(self):
+        files = {
+            'Artist - Album/01 - Intro.mp3': b'ID3' + bytes(range(256)) * 40,
+            'Artist - Album/02 - 노래.flac': b'fLaC' + b'\x01' * 5000,
+            'Artist - Album/03 - Empty.mp3': b'',
+        }
+        entries = [zip_entry(name, data) for name, data in files.items()]
+        archive = zipfile.ZipFile(io.BytesIO(b''.join(self.stream(entries, chunk_size=1000))))
+        self.assertIsNone(archive.testzip())
+        self.assertEqual(archive.namelist(), list(files))
+        for info in archive.infolist():
+            self.assertEqual(archive.read(info), files[info.filename])
+            self.assertEqual(info.compress_type, zipfile.ZIP_STORED)
+            self.assertEqual(info.date_time, (2024, 5, 17, 12, 30, 44))
+
+    def test_zip64_for_large_entry_and_offsets(self):
+        size = zipstream.ZIP32_LIMIT + len(ZERO_CHUNK) - zipstream.ZIP32_LIMIT % len(ZERO_CHUNK)
+        entries = [
+            zip_entry('before.txt', b'first'),
+            zipstream.ZipEntry('big.wav', size, ZeroFile, datetime.datetime(2024, 1, 1)),
+            zip_entry('after.txt', b'past the 4 GiB mark'),
+        ]
+        archive = zipfile.ZipFile(SegmentedArchive(self.stream(entries)))
+        before, big, after = archive.infolist()
+        self.assertEqual(big.file_size, size)
+        self.assertGreater(after.header_offset, zipstream.ZIP32_LIMIT)
+        self.assertEqual(archive.read(before), b'first')
+        self.assertEqual(archive.read(after), b'past the 4 GiB mark')
+        with archive.open(big) as fh:
+            self.assertEqual(fh.read(1000), bytes(1000))
+
+    def test_zip64_for_many_entries(self):
+        entries = [zip_entry(f'{n}.txt', str(n).encode()) for n in range(zipstream.ZIP32_MAX_ENTRIES + 1)]
+        archive = zipfile.ZipFile(io.BytesIO(b''.join(self.stream(entries))))
+        self.assertEqual(len(archive.infolist()), len(entries))
+        self.assertEqual(archive.read('65535.txt'), b'65535')
+
+    def test_short_file_is_an_error(self):
+        entry = zipstream.ZipEntry('short.mp3', 10, lambda: io.BytesIO(b'12345'), datetime.datetime(2024, 1, 1))
+        with self.assertRaises(zipstream.ZipSizeError):
+            list(zipstream.stream_archive([entry]))
+
+
+@override_settings(
+    DATABASE_REPLICAS=['replica'],
+    DATABASE_ROUTERS=['music.routers.ReplicaRouter'],
+    MIDDLEWARE=[*settings.MIDDLEWARE, 'music.routers.ReplicaStickinessMiddleware'],
+)
+class ReplicaRouterTests(TransactionTestCase):
+    """A separate in-memory SQLite database plays a replica that never catches up.
+
+    Not a TestCase: reads inside a transaction always go to the primary.
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        connections.settings['replica_1'] = {**connections['default'].settings_dict, 'NAME': ':memory:'}
+        call_command('migrate', database='replica_1', verbosity=0)
+        # Set only now: the test runner would try to create the alias's test
+        # database otherwise
+        cls.databases = {'default', 'replica_1'}
+        super().setUpClass()
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        connections['replica_1'].close()
+        del connections['replica_1']
+        del connections.settings['replica_1']
+
+    def setUp(self):
+        # The router keeps flush away from replicas
+        with self.settings(DATABASE_ROUTERS=[]):
+            call_command('flush', database='replica_1', interactive=False, verbosity=0)
+        cache.clear()
+        self.admin = get_user_model().objects.create_user('admin', password='secret-password', is_staff=True)
+        get_user_model().objects.using('replica_1').create(pk=self.admin.pk, username='admin', is_staff=True)
+        self.client = APIClient()
+        self.client.force_authenticate(self.admin)
+        self.anonymous = APIClient()
+
+    def artist_names(self, client):
+        response = client.get('/api/music/artists/')
+        self.assertEqual(response.status_code, 200)
+        return {artist['name'] for artist in response.json()}
+
+    def test_reads_go_to_replica(self):
+        Artist.objects.create(name='Primary Only')
+        Artist.objects.using('replica_1').create(name='Replica Only')
+        self.assertEqual(self.artist_names(self.anonymous), {'Replica Only'})
+        self.assertEqual(self.artist_names(self.client), {'Replica Only'})
+
+    def test_read_your_writes(self):
+        response = self.client.post('/api/admin/create-artist/', {'name': 'Fresh Artist'}, format='json')
+        self.assertEqual(response.status_code, 201)
+        # The writer reads from the primary; everyone else still sees the replica
+        self.assertEqual(self.artist_names(self.client), {'Fresh Artist'})
+        self.assertEqual(self.artist_names(self.anonymous), set())
+        cache.clear()
+        self.assertEqual(self.artist_names(self.client), set())
+
+    def test_download_logs_do_not_pin(self):
+        track = make_track()
+        artist, album = track.artist, track.album
+        Artist.objects.using('replica_1').create(pk=artist.pk, name=artist.name)
+        album.save(using='replica_1')
+        Track.objects.using('replica_1').create(
+            pk=track.pk, title=track.title, artist_id=artist.pk, album_id=album.pk, duration=180, file=track.file.name,
+        )
+        Artist.objects.create(name='Primary Only')
+
+        response = self.client.post(f'/api/music/tracks/{track.pk}/log-download/')
+        self.assertEqual(response.status_code, 201)
+        self.assertTrue(DownloadLog.objects.filter(user=self.admin, track=track).exists())
+        self.assertEqual(self.artist_names(self.client), {track.artist.name})
+
+
+def riff_chunk(chunk_id, body):
+    return chunk_id + struct.pack('<I', len(body)) + body + b'\x00' * (len(body) & 1)
+
+
+def make_wav(data_size, sample_rate=44100, channels=2, bits=16, title=b'', declared_size=None):
+    block_align = channels * bits // 8
+    fmt = struct.pack('<HHIIHH', 1, channels, sample_rate, sample_rate * block_align, block_align, bits)
+    chunks = riff_chunk(b'fmt ', fmt)
+    if title:
+        chunks += riff_chunk(b'LIST', b'INFO' + riff_chunk(b'INAM', title + b'\x00'))
+    data_header = b'data' + struct.pack('<I', data_size if declared_size is None else declared_size)
+    body = b'WAVE' + chunks + data_header + b'\x01' * data_size
+    return b'RIFF' + struct.pack('<I', len(body)) + body
+
+
+def make_flac(total_samples, sample_rate=48000, channels=2, bits=24, audio_bytes=1000, comments=()):
+    packed = sample_rate << 44 | (channels - 1) << 41 | (bits - 1) << 36 | total_samples
+    streaminfo = bytes(10) + packed.to_bytes(8, 'big') + bytes(16)
+    vendor = b'test'
+    vorbis = struct.pack('<I', len(vendor)) + vendor + struct.pack('<I', len(comments))
+    for comment in comments:
+        vorbis += struct.pack('<I', len(comment)) + comment
+    blocks = bytes([0]) + len(streaminfo).to_bytes(3, 'big') + streaminfo
+    blocks += bytes([0x80 | 4]) + len(vorbis).to_bytes(3, 'big') + vorbis
+    return b'fLaC' + blocks + b'\x01' * audio_bytes
+
+
+# MPEG-1 Layer III, 128 kbit/s, 44.1 kHz, stereo: 417-byte frames
+MP3_FRAME_HEADER = b'\xff\xfb\x90\x00'
+MP3_FRAME_LENGTH = 417
+
+
+def make_mp3_frames(count, first_frame=None):
+    frames = [MP3_FRAME_HEADER + b'\x00' * (MP3_FRAME_LENGTH - 4) for _ in range(count)]
+    if first_frame is not None:
+        frames[0] = (MP3_FRAME_HEADER + first_frame).ljust(MP3_FRAME_LENGTH, b'\x00')
+    return b''.join(frames)
+
+
+def id3v2_tag(frames, padding=100):
+    body = b''
+    for frame_id, text in frames:
+        value = b'\x03' + text.encode('utf-8')
+        body += frame_id + struct.pack('>I', len(value)) + b'\x00\x00' + value
+    body += b'\x00' * padding
+    size = len(body)
+    syncsafe = bytes([(size >> 21) & 0x7F, (size >> 14) & 0x7F, (size >> 7) & 0x7F, size & 0x7F])
+    return b'ID3\x03\x00\x00' + syncsafe + body
+
+
+def probe_bytes(data):
+    return probe_file(io.BytesIO(data))
+
+
+class ProbeTests(TestCase):
+    def test_wav(self):
+        info = probe_bytes(make_wav(44100 * 4 * 3, title=b'Wave Song'))
+        self.assertEqual(info.format, 'wav')
+        self.assertEqual(info.duration, 3)
+        self.assertEqual(info.sample_rate, 44100)
+        self.assertEqual(info.channels, 2)
+        self.assertEqual(info.bitrate, 44100 * 4 * 8)
+        self.assertEqual(info.bits_per_sample, 16)
+        self.assertEqual(info.tags, {'title': 'Wave Song'})
+
+    def test_wav_with_unknown_or_truncated_data_size(self):
+        # Streamed WAVs leave the size at 0; truncated ones claim more than they hold
+        for declared in [0, 44100 * 4 * 10]:
+            info = probe_bytes(make_wav(8000 * 2 * 2 + 1, sample_rate=8000, channels=1, declared_size=declared))
+            self.assertEqual(info.duration, 2)
+            self.assertEqual(info.data_size, 8000 * 2 * 2)
+
+    def test_flac(self):
+        info = probe_bytes(make_flac(48000 * 5, audio_bytes=60000, comments=[b'TITLE=Lossless', b'ARTIST=Band']))
+        self.assertEqual(info.format, 'flac')
+        self.assertEqual(info.duration, 5)
+        self.assertEqual(info.sample_rate, 48000)
+        self.assertEqual(info.channels, 2)
+        self.assertEqual(info.bits_per_sample, 24)
+        self.assertEqual(info.bitrate, 60000 * 8 // 5)
+        self.assertEqual(info.tags, {'title': 'Lossless', 'artist': 'Band'})
+
+    def test_flac_after_id3_tag(self):
+        info = probe_bytes(id3v2_tag([(b'TIT2', 'Tagged')]) + make_flac(44100, sample_rate=44100))
+        self.assertEqual(info.format, 'flac')
+        self.assertEqual(info.duration, 1)
+
+    def test_cbr_mp3(self):
+        data = make_mp3_frames(100)
+        info = probe_bytes(data)
+        self.assertEqual(info.format, 'mp3')
+        self.assertEqual(info.sample_rate, 44100)
+        self.assertEqual(info.channels, 2)
+        self.assertEqual(info.bitrate, 128000)
+        self.assertAlmostEqual(info.duration, len(data) * 8 / 128000)
+
+    def test_mp3_id3_tags(self):
+        trailer = b'TAG' + b'V1 Title'.ljust(30, b'\x00') + b'V1 Artist'.ljust(30, b'\x00') + bytes(65)
+        data = id3v2_tag([(b'TIT2', 'V2 Title'), (b'TCON', '(13)Pop')]) + make_mp3_frames(10) + trailer
+        info = probe_bytes(data)
+        self.assertEqual(info.tags, {'title': 'V2 Title', 'genre': 'Pop', 'artist': 'V1 Artist'})
+        # Neither tag counts as audio
+        self.assertAlmostEqual(info.duration, 10 * MP3_FRAME_LENGTH * 8 / 128000)
+
+    def test_xing_header(self):
+        # Side info for MPEG-1 stereo is 32 bytes; the Xing header follows it
+        xing = bytes(32) + b'Xing' + struct.pack('>III', 0x03, 1000, 2_000_000)
+        info = probe_bytes(make_mp3_frames(5, first_frame=xing))
+        self.assertAlmostEqual(info.duration, 1000 * 1152 / 44100)
+        self.assertEqual(info.bitrate, int(2_000_000 * 8 / (1000 * 1152 / 44100)))
+
+    def test_info_header_without_byte_count(self):
+        info_header = bytes(32) + b'Info' + struct.pack('>II', 0x01, 500)
+        data = make_mp3_frames(5, first_frame=info_header)
+        info = probe_bytes(data)
+        self.assertAlmostEqual(info.duration, 500 * 1152 / 44100)
+        self.assertEqual(info.bitrate, int(len(data) * 8 / info.duration))
+
+    def test_vbri_header(self):
+        vbri = bytes(32) + b'VBRI' + bytes(6) + struct.pack('>II', 3_000_000, 2000)
+        info = probe_bytes(make_mp3_frames(5, first_frame=vbri))
+        self.assertAlmostEqual(info.duration, 2000 * 1152 / 44100)
+
+    def test_garbage_and_truncated_input(self):
+        wav = make_wav(44100 * 4)
+        flac = make_flac(48000)
+        for data in [
+            b'',
+            b'not an audio file at all',
+            bytes(range(256)) * 4,
+            wav[:12],
+            wav[:30],
+            flac[:4],
+            flac[:20],
+            id3v2_tag([(b'TIT2', 'No audio')]),
+            # Frame sync with a reserved bitrate index
+            b'\xff\xfb\xf0\x00' + bytes(1000),
+        ]:
+            with self.subTest(data=data[:16]), self.assertRaises(ProbeError):
+                probe_bytes(data)
+
+
+def png_bytes(width, height, color=(200, 40, 40)):
+    buffer = io.BytesIO()
+    Image.new('RGB', (width, height), color).save(buffer, 'PNG')
+    return buffer.getvalue()
+
+
+@override_settings(MUSIC_IMAGE_VARIANT_WIDTHS=[200, 400], MUSIC_IMAGE_VARIANT_FORMATS=['webp', 'jpeg'])
+class ImageVariantTests(TestCase):
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root, ignore_errors=True)
+        self.enterContext(override_settings(MEDIA_ROOT=media_root))
+        self.artist = Artist.objects.create(name='Artist')
+
+    def assert_variants_beside(self, field_file, variants):
+        self.assertEqual(variants['source'], field_file.name)
+        self.assertEqual(set(variants['sizes']), {'200', '400'})
+        stem = os.path.splitext(field_file.name)[0]
+        for width, formats in variants['sizes'].items():
+            self.assertEqual(formats, {'webp': f'{stem}_{width}.webp', 'jpeg': f'{stem}_{width}.jpg'})
+            for name in formats.values():
+                with default_storage.open(name) as fh:
+                    self.assertEqual(Image.open(fh).width, int(width))
+
+    def test_artist_image_variants(self):
+        self.artist.image.save('portrait.png', ContentFile(png_bytes(600, 300)))
+        variants = generate_variants(self.artist)
+        self.assert_variants_beside(self.artist.image, variants)
+        self.artist.refresh_from_db()
+        self.assertEqual(self.artist.image_variants, variants)
+
+    def test_album_cover_variants_are_stored_beside_content_addressed_cover(self):
+        album = Album.objects.create(title='Album', artist=self.artist, release_date=datetime.date(2020, 1, 1))
+        album.cover_image.save('cover.png', ContentFile(png_bytes(600, 600)))
+        self.assertTrue(is_content_name(album.cover_image.name))
+        variants = generate_variants(album)
+        self.assert_variants_beside(album.cover_image, variants)
+        # Rebuilding overwrites the same files instead of adding suffixed copies
+        self.assertEqual(build_variants(album.cover_image.name, album.cover_image.storage), variants['sizes'])
+        directory = os.path.dirname(album.cover_image.name)
+        self.assertEqual(len(default_storage.listdir(directory)[1]), 1 + 2 * 2)
+
+    def test_small_image_gets_one_variant_at_its_own_width(self):
+        self.artist.image.save('tiny.png', ContentFile(png_bytes(120, 80)))
+        variants = generate_variants(self.artist)
+        self.assertEqual(set(variants['sizes']), {'120'})
+
+    def test_replaced_cover_drops_old_variants(self):
+        album = Album.objects.create(title='Album', artist=self.artist, release_date=datetime.date(2020, 1, 1))
+        album.cover_image.save('cover.png', ContentFile(png_bytes(600, 600)))
+        old = generate_variants(album)
+        album.cover_image.save('cover.png', ContentFile(png_bytes(600, 600, color=(0, 0, 255))))
+        generate_variants(album)
+        for formats in old['sizes'].values():
+            for name in formats.values():
+                self.assertFalse(default_storage.exists(name))
+
+
+class BatchTests(TestCase):
+    def test_worker_map_keeps_order_inline_and_in_processes(self):
+        items = [-3, 1, -2, 5]
+        for workers in (1, 2):
+            with worker_map(abs, items, workers, chunksize=1) as results:
+                self.assertEqual(list(results), [3, 1, 2, 5])
+
+    def test_worker_map_cancels_queued_items_on_error(self):
+        with mock.patch('music.batch.ProcessPoolExecutor') as executor:
+            with self.assertRaises(KeyboardInterrupt):
+                with worker_map(abs, [1, 2], 2):
+                    raise KeyboardInterrupt
+        executor.return_value.shutdown.assert_called_once_with(cancel_futures=True)
+
+    def test_batch_flushes_full_batches_and_the_rest_on_error(self):
+        flushed = []
+        with self.assertRaises(RuntimeError):
+            with Batch(flushed.append, 2) as pending:
+                for item in range(5):
+                    pending.add(item)
+                raise RuntimeError
+        self.assertEqual(flushed, [[0, 1], [2, 3], [4]])
+
+    def test_progress_reports_every_n_and_at_the_end(self):
+        progress = Progress(5, 2)
+        self.assertEqual([progress.step() for _ in range(5)], [False, True, False, True, True])
+
+
+class BatchCommandTests(TestCase):
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root, ignore_errors=True)
+        self.enterContext(override_settings(MEDIA_ROOT=media_root))
+
+    def test_probe_tracks_writes_results_with_one_or_more_workers(self):
+        storage = Track._meta.get_field('file').storage
+        good = make_track('Good', file=storage.save('tracks/good.wav', ContentFile(make_wav(44100 * 4 * 3))))
+        bad = make_track('Bad', file=storage.save('tracks/bad.wav', ContentFile(b'not audio')))
+        for workers in ('1', '2'):
+            Track.objects.update(duration=0, probed_at=None)
+            out = io.StringIO()
+            call_command('probe_tracks', '--workers', workers, '--batch-size', '1', stdout=out)
+            self.assertIn('Probed 1 tracks (1 failed)', out.getvalue())
+            good.refresh_from_db()
+            bad.refresh_from_db()
+            self.assertEqual((good.duration, good.sample_rate), (3, 44100))
+            self.assertIsNone(bad.probed_at)
+
+
+class FakeClock:
+    """Stands in for the ``time`` module in music.throttling"""
+
+    def __init__(self, now=1_000_000.0):
+        self.now = now
+        self.slept = 0
+
+    def time(self):
+        return self.now
+
+    monotonic = time
+
+    def sleep(self, seconds):
+        self.slept += seconds
+        self.now += seconds
+
+
+LOCMEM_CACHES = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+
+
+@override_settings(CACHES=LOCMEM_CACHES, MUSIC_THROTTLE_CACHE='default',
+                   MUSIC_THROTTLE_RATES={'search': '3/3s', 'list': ''})
+class TokenBucketTests(APITestBase):
+    def setUp(self):
+        super().setUp()
+        self.clock = FakeClock()
+        self.enterContext(mock.patch('music.throttling.time', self.clock))
+
+    def allowed(self, user=None):
+        request = SimpleNamespace(user=user or self.user, META={'REMOTE_ADDR': '10.0.0.1'})
+        throttle = SearchRateThrottle()
+        return throttle.allow_request(request, None), throttle.wait()
+
+    def test_burst_up_to_capacity_then_refused(self):
+        self.assertEqual([self.allowed()[0] for _ in range(3)], [True, True, True])
+        allowed, wait = self.allowed()
+        self.assertFalse(allowed)
+        self.assertAlmostEqual(wait, 1.0)
+
+    def test_refills_at_the_configured_rate(self):
+        for _ in range(3):
+            self.allowed()
+        self.clock.now += 0.5
+        allowed, wait = self.allowed()
+        self.assertFalse(allowed)
+        self.assertAlmostEqual(wait, 0.5)
+        self.clock.now += 0.5
+        self.assertTrue(self.allowed()[0])
+        self.assertFalse(self.allowed()[0])
+
+    def test_refill_stops_at_capacity(self):
+        self.allowed()
+        self.clock.now += 3600
+        self.assertEqual([self.allowed()[0] for _ in range(4)], [True, True, True, False])
+
+    def test_buckets_are_per_client(self):
+        other = get_user_model().objects.create_user('other', password='secret-password')
+        for _ in range(3):
+            self.allowed()
+        self.assertFalse(self.allowed()[0])
+        self.assertTrue(self.allowed(other)[0])
+
+    def test_empty_rate_disables_the_throttle(self):
+        request = SimpleNamespace(user=self.user, META={})
+        self.assertTrue(all(ListRateThrottle().allow_request(request, None) for _ in range(100)))
+
+    def test_api_answers_429_with_retry_after(self):
+        for _ in range(3):
+            self.assertEqual(self.client.get('/api/search/', {'q': 'a'}).status_code, 200)
+        response = self.client.get('/api/search/', {'q': 'a'})
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response['Retry-After'], '1')
+
+
+@override_settings(CACHES=LOCMEM_CACHES, MUSIC_THROTTLE_CACHE='default',
+                   MUSIC_MAX_STREAMS_PER_USER=1, MUSIC_MAX_STREAMS=2, MUSIC_STREAM_BYTES_PER_SECOND=0)
+class StreamSlotTests(APITestBase):
+    def setUp(self):
+        super().setUp()
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root, ignore_errors=True)
+        self.enterContext(override_settings(MEDIA_ROOT=media_root))
+        storage = Track._meta.get_field('file').storage
+        self.track = make_track(file=storage.save('tracks/song.mp3', ContentFile(b'x' * 100_000)))
+        self.url = f'/api/music/tracks/{self.track.pk}/download/'
+
+    def request(self, user=None):
+        return SimpleNamespace(user=user or self.user, META={})
+
+    def slots(self):
+        return cache.get(f'streams:user:{self.user.pk}'), cache.get('streams:all')
+
+    def assert_released(self):
+        self.assertEqual(self.slots(), (0, 0))
+        # Another download can start
+        release = acquire_stream(self.request())
+        release()
+
+    def test_second_download_refused_while_first_is_open(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.slots(), (1, 1))
+        refused = self.client.get(self.url)
+        self.assertEqual(refused.status_code, 429)
+        self.assertEqual(self.slots(), (1, 1))
+        response.close()
+        self.assert_released()
+
+    def test_released_when_download_finishes(self):
+        response = self.client.get(self.url)
+        self.assertEqual(b''.join(response.streaming_content), b'x' * 100_000)
+        response.close()
+        self.assert_released()
+
+    def test_released_when_client_disconnects_midway(self):
+        response = self.client.get(self.url)
+        next(iter(response.streaming_content))
+        # The server closes the response when the client goes away
+        response.close()
+        self.assert_released()
+
+    def test_released_when_opening_the_file_fails(self):
+        with mock.patch('django.db.models.fields.files.FieldFile.open', side_effect=PermissionError('denied')), \
+                self.assertLogs('music.views', 'ERROR'):
+            response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 500)
+        self.assert_released()
+
+    def test_released_when_the_stream_raises(self):
+        def chunks():
+            yield b'first'
+            raise OSError('storage went away')
+
+        iterator = ThrottledIterator(chunks(), acquire_stream(self.request()))
+        self.assertEqual(next(iterator), b'first')
+        with self.assertRaises(OSError):
+            next(iterator)
+        iterator.close()
+        self.assert_released()
+
+    def test_async_stream_released_on_end_and_on_close(self):
+        async def consume(iterator, limit=None):
+            received = []
+            async for chunk in iterator:
+                received.append(chunk)
+                if len(received) == limit:
+                    break
+            iterator.close()
+            return received
+
+        finished = AsyncThrottledIterator([b'a', b'b'], acquire_stream(self.request()))
+        self.assertEqual(async_to_sync(consume)(finished), [b'a', b'b'])
+        self.assert_released()
+        dropped = AsyncThrottledIterator(FileChunks(io.BytesIO(b'x' * 10), chunk_size=1), acquire_stream(self.request()))
+        self.assertEqual(async_to_sync(consume)(dropped, limit=1), [b'x'])
+        self.assert_released()
+
+    def test_release_is_idempotent(self):
+        release = acquire_stream(self.request())
+        release()
+        release()
+        self.assertEqual(self.slots(), (0, 0))
+
+    def test_release_after_counter_expired_never_goes_negative(self):
+        release = acquire_stream(self.request())
+        # Expired and recreated by a stream that has since finished
+        cache.set('streams:all', 0)
+        release()
+        self.assertEqual(self.slots(), (0, 0))
+
+    def test_total_limit_applies_across_users(self):
+        other = get_user_model().objects.create_user('other', password='secret-password')
+        third = get_user_model().objects.create_user('third', password='secret-password')
+        acquire_stream(self.request())
+        acquire_stream(self.request(other))
+        with self.assertRaises(Throttled):
+            acquire_stream(self.request(third))
+        # The refused request gave back the slot it took
+        self.assertEqual(cache.get(f'streams:user:{third.pk}'), 0)
+        self.assertEqual(cache.get('streams:all'), 2)
+
+    def test_paced_stream_sleeps_to_hold_the_rate(self):
+        clock = FakeClock()
+        with mock.patch('music.throttling.time', clock), \
+                self.settings(MUSIC_STREAM_BYTES_PER_SECOND=1000):
+            iterator = ThrottledIterator([b'x' * 500] * 4, lambda: None)
+            self.assertEqual(len(b''.join(iterator)), 2000)
+        self.assertAlmostEqual(clock.slept, 2.0)
@@ -0,0 +1,282 @@
+"""Rate limits and admission control for the public API.
+
+- ``SearchRateThrottle`` and ``ListRateThrottle`` are DRF throttles backed
+  by token buckets, keyed by user (or by client IP for anonymous requests).
+  Rates come from ``MUSIC_THROTTLE_RATES``.
+- ``acquire_stream`` caps concurrent file downloads per user and in total,
+  and ``ThrottledFile`` / ``ThrottledIterator`` release the slot when the
+  response is closed, optionally holding each stream to
+  ``MUSIC_STREAM_BYTES_PER_SECOND``. Under ASGI, ``stream_response`` streams
+  through ``AsyncThrottledIterator`` instead.
+
+State lives in the cache named by ``MUSIC_THROTTLE_CACHE``. With the default
+local-memory cache every worker process enforces the limits on its own;
+point it at a shared cache (see ``CACHES``) to enforce them across workers.
+Over-limit requests get a 429 with ``Retry-After``.
+"""
+import asyncio
+import re
+import time
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import caches
+from django.core.handlers.asgi import ASGIRequest
+from django.http import StreamingHttpResponse
+from rest_framework.exceptions import Throttled
+from rest_framework.throttling import BaseThrottle
+
+# Stream slots are counters that expire, so slots leaked by a crashed
+# worker are eventually reclaimed
+STREAM_SLOT_TTL = 60 * 60
+# Suggested wait when all stream slots are taken; the actual wait is unknown
+STREAM_RETRY_AFTER = 10
+# Read size for files streamed under ASGI
+STREAM_CHUNK_SIZE = 64 * 1024
+
+PERIODS = {'s': 1, 'm': 60, 'h': 60 * 60, 'd': 24 * 60 * 60}
+RATE_PATTERN = re.compile(r'^(\d+)/(\d*)([smhd])')
+
+
+def _cache():
+    return caches[settings.MUSIC_THROTTLE_CACHE]
+
+
+def parse_rate(rate):
+    """'20/10s' -> (20, 10.0): bucket size and seconds to refill it"""
+    match = RATE_PATTERN.match(rate)
+    if not match:
+        raise ValueError(f"Invalid rate {rate!r}; expected e.g. '20/10s' or '600/m'")
+    requests, count, unit = match.groups()
+    return int(requests), int(count or 1) * PERIODS[unit]
+
+
+def client_key(request):
+    if request.user and request.user.is_authenticated:
+        return f'user:{request.user.pk}'
+    # get_ident honours NUM_PROXIES for X-Forwarded-For
+    return f'ip:{BaseThrottle().get_ident(request)}'
+
+
+class TokenBucketThrottle(BaseThrottle):
+    """Allows bursts up to the bucket size, refilled at a steady rate"""
+    scope = None
+
+    def __init__(self):
+        rate = settings.MUSIC_THROTTLE_RATES.get(self.scope)
+        self.capacity, period = parse_rate(rate) if rate else (None, None)
+        self.refill_per_second = self.capacity / period if rate else None
+        self._wait = None
+
+    def allow_request(self, request, view):
+        if self.capacity is None:
+            return True
+        cache = _cache()
+        key = f'throttle:{self.scope}:{client_key(request)}'
+        now = time.time()
+        # Not atomic across processes: concurrent requests may occasionally
+        # both take the last token, which is fine for rate limiting
+        tokens, updated = cache.get(key, (self.capacity, now))
+        tokens = min(self.capacity, tokens + (now - updated) * self.refill_per_second)
+        if tokens < 1:
+            self._wait = (1 - tokens) / self.refill_per_second
+            return False
+        timeout = int(self.capacity / self.refill_per_second) + 1
+        cache.set(key, (tokens - 1, now), timeout)
+        return True
+
+    def wait(self):
+        return self._wait
+
+
+class SearchRateThrottle(TokenBucketThrottle):
+    scope = 'search'
+
+
+class ListRateThrottle(TokenBucketThrottle):
+    scope = 'list'
+
+
+def _incr(cache, key):
+    try:
+        count = cache.incr(key)
+    except ValueError:
+        if cache.add(key, 1, STREAM_SLOT_TTL):
+            return 1
+        count = cache.incr(key)
+    # incr keeps the expiry set by add; push it back so a counter that is
+    # busy for longer than the TTL doesn't vanish under open streams
+    cache.touch(key, STREAM_SLOT_TTL)
+    return count
+
+
+def _decr(cache, key):
+    try:
+        count = cache.decr(key)
+    except ValueError:
+        return  # expired in the meantime
+    if count < 0:
+        # The counter expired and was recreated while streams were open;
+        # never let releases take it below zero
+        cache.incr(key, -count)
+
+
+def acquire_stream(request):
+    """Take a download slot for the request's user, or raise Throttled.
+
+    Returns a function that gives the slot back; calling it again is a no-op.
+    """
+    cache = _cache()
+    keys = [f'streams:{client_key(request)}', 'streams:all']
+    limits = [settings.MUSIC_MAX_STREAMS_PER_USER, settings.MUSIC_MAX_STREAMS]
+    taken = []
+    for key, limit in zip(keys, limits):
+        if not limit:
+            continue
+        taken.append(key)
+        if _incr(cache, key) > limit:
+            for taken_key in taken:
+                _decr(cache, taken_key)
+            raise Throttled(
+                wait=STREAM_RETRY_AFTER,
+                detail='Too many downloads in progress. Try again shortly.',
+            )
+
+    def release():
+        while taken:
+            _decr(cache, taken.pop())
+    return release
+
+
+class _Pacer:
+    """Sleeps as needed to keep the average throughput under a ceiling"""
+
+    def __init__(self, bytes_per_second):
+        self.bytes_per_second = bytes_per_second
+        self.sent = 0
+        self.started = time.monotonic()
+
+    def delay(self, size):
+        """Seconds to wait after sending ``size`` more bytes"""
+        if not self.bytes_per_second:
+            return 0
+        self.sent += size
+        return max(0, self.sent / self.bytes_per_second - (time.monotonic() - self.started))
+
+    def sent_chunk(self, size):
+        delay = self.delay(size)
+        if delay:
+            time.sleep(delay)
+
+
+class ThrottledFile:
+    """File wrapper for FileResponse that calls ``release`` when closed.
+
+    With a bandwidth ceiling the wrapper hides ``fileno``, so the server
+    can't bypass the pacing with ``sendfile``.
+    """
+
+    def __init__(self, fileobj, release):
+        self._file = fileobj
+        self._release = release
+        self._pacer = _Pacer(settings.MUSIC_STREAM_BYTES_PER_SECOND)
+
+    def read(self, size=-1):
+        chunk = self._file.read(size)
+        self._pacer.sent_chunk(len(chunk))
+        return chunk
+
+    def close(self):
+        try:
+            self._file.close()
+        finally:
+            self._release()
+
+    def __getattr__(self, name):
+        if name == 'fileno' and self._pacer.bytes_per_second:
+            raise AttributeError(name)
+        return getattr(self._file, name)
+
+
+class ThrottledIterator:
+    """Iterator wrapper for StreamingHttpResponse that calls ``release`` when closed"""
+
+    def __init__(self, chunks, release):
+        self._chunks = iter(chunks)
+        self._release = release
+        self._pacer = _Pacer(settings.MUSIC_STREAM_BYTES_PER_SECOND)
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        chunk = next(self._chunks)
+        self._pacer.sent_chunk(len(chunk))
+        return chunk
+
+    def close(self):
+        try:
+            if hasattr(self._chunks, 'close'):
+                self._chunks.close()
+        finally:
+            self._release()
+
+
+class FileChunks:
+    """Iterable of a file's contents in chunks; closing it closes the file"""
+
+    def __init__(self, fileobj, chunk_size=STREAM_CHUNK_SIZE):
+        self._file = fileobj
+        self._chunk_size = chunk_size
+
+    def __iter__(self):
+        return iter(lambda: self._file.read(self._chunk_size), b'')
+
+    def close(self):
+        self._file.close()
+
+
+class AsyncThrottledIterator:
+    """ThrottledIterator for ASGI servers.
+
+    Each chunk is produced in a worker thread and the connection then waits
+    on the event loop, so a slow client doesn't hold a thread for the whole
+    download. (Django would otherwise read a synchronous iterator into
+    memory in full before sending any of it.)
+    """
+
+    def __init__(self, chunks, release):
+        self._source = chunks
+        self._chunks = iter(chunks)
+        self._release = release
+        self._pacer = _Pacer(settings.MUSIC_STREAM_BYTES_PER_SECOND)
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        chunk = await sync_to_async(next, thread_sensitive=False)(self._chunks, None)
+        if chunk is None:
+            raise StopAsyncIteration
+        delay = self._pacer.delay(len(chunk))
+        if delay:
+            await asyncio.sleep(delay)
+        return chunk
+
+    def close(self):
+        try:
+            if hasattr(self._source, 'close'):
+                self._source.close()
+        finally:
+            self._release()
+
+
+def is_asgi_request(request):
+    return isinstance(getattr(request, '_request', request), ASGIRequest)
+
+
+def stream_response(request, chunks, release, content_type):
+    """StreamingHttpResponse over ``chunks`` that gives the stream slot back when closed"""
+    if is_asgi_request(request):
+        return StreamingHttpResponse(AsyncThrottledIterator(chunks, release), content_type=content_type)
+    return StreamingHttpResponse(ThrottledIterator(chunks, release), content_type=content_type)
@@ -0,0 +1,112 @@
+"""Upload handler that hashes and probes files while they are received.
+
+Replaces Django's memory/temp-file handler pair. Each uploaded file is kept
+in memory up to ``FILE_UPLOAD_MAX_MEMORY_SIZE`` and spooled to a temp file
+past it. In the same pass the handler computes the SHA-256 and keeps the
+first and last few KB, which is all the audio prober needs. The results are
+attached to the returned ``UploadedFile``:
+
+    uploaded.sha256      hex digest of the content
+    uploaded.audio_info  music.probe.AudioInfo, or None if not a known audio file
+
+so later stages never have to read the bytes again.
+"""
+import hashlib
+from io import BytesIO
+import struct
+
+from django.conf import settings
+from django.core.files.uploadedfile import InMemoryUploadedFile, TemporaryUploadedFile
+from django.core.files.uploadhandler import FileUploadHandler
+
+from .probe import ProbeError, probe
+
+# Bytes kept from the start and end of each file for header probing
+HEAD_SIZE = 256 * 1024
+TAIL_SIZE = 64 * 1024
+
+
+class HeadTailReader:
+    """Probe reader serving reads from the retained head/tail bytes.
+
+    Anything in between (rare: a WAV LIST chunk in the middle of a file)
+    falls back to reading the received file.
+    """
+
+    def __init__(self, head, tail, size, fileobj):
+        self.head = head
+        self.tail = tail
+        self.size = size
+        self.fileobj = fileobj
+
+    def read(self, offset, length):
+        if offset < 0 or offset >= self.size or length <= 0:
+            return b''
+        length = min(length, self.size - offset)
+        if offset + length <= len(self.head):
+            return bytes(self.head[offset:offset + length])
+        tail_start = self.size - len(self.tail)
+        if offset >= tail_start:
+            start = offset - tail_start
+            return bytes(self.tail[start:start + length])
+        position = self.fileobj.tell()
+        try:
+            self.fileobj.seek(offset)
+            return self.fileobj.read(length)
+        finally:
+            self.fileobj.seek(position)
+
+
+class HashingUploadHandler(FileUploadHandler):
+    """Spool uploads to disk past a threshold, hashing and probing in one pass"""
+
+    def new_file(self, *args, **kwargs):
+        super().new_file(*args, **kwargs)
+        self.buffer = BytesIO()
+        self.temp_file = None
+        self.digest = hashlib.sha256()
+        self.head = bytearray()
+        self.tail = bytearray()
+
+    def receive_data_chunk(self, raw_data, start):
+        self.digest.update(raw_data)
+        if len(self.head) < HEAD_SIZE:
+            self.head += raw_data[:HEAD_SIZE - len(self.head)]
+        self.tail += raw_data
+        del self.tail[:-TAIL_SIZE]
+
+        if self.temp_file is None and start + len(raw_data) > settings.FILE_UPLOAD_MAX_MEMORY_SIZE:
+            self.temp_file = TemporaryUploadedFile(
+                self.file_name, self.content_type, 0, self.charset, self.content_type_extra
+            )
+            self.temp_file.write(self.buffer.getvalue())
+            self.buffer = None
+        (self.temp_file or self.buffer).write(raw_data)
+
+    def file_complete(self, file_size):
+        if self.temp_file is not None:
+            uploaded = self.temp_file
+            uploaded.size = file_size
+        else:
+            uploaded = InMemoryUploadedFile(
+                file=self.buffer,
+                field_name=self.field_name,
+                name=self.file_name,
+                content_type=self.content_type,
+                size=file_size,
+                charset=self.charset,
+                content_type_extra=self.content_type_extra,
+            )
+        uploaded.seek(0)
+
+        uploaded.sha256 = self.digest.hexdigest()
+        try:
+            uploaded.audio_info = probe(HeadTailReader(self.head, self.tail, file_size, uploaded.file))
+        except (ProbeError, struct.error, IndexError):
+            uploaded.audio_info = None
+        uploaded.seek(0)
+        return uploaded
+
+    def upload_interrupted(self):
+        if getattr(self, 'temp_file', None) is not None:
+            self.temp_file.close()
@@ -0,0 +1,439 @@
+"""Resumable chunked uploads for large track files.
+
+Protocol (admin only):
+
+    POST   /api/admin/uploads/                  create a session (filename, size, track metadata)
+    GET    /api/admin/uploads/<id>/             received/missing parts, to resume after a failure
+    PUT    /api/admin/uploads/<id>/?offset=N    upload one chunk, with an X-Chunk-SHA256 header
+    POST   /api/admin/uploads/<id>/finalize/    assemble the file and create the Track
+    DELETE /api/admin/uploads/<id>/             abort
+
+Chunks are written straight into a preallocated temp file (local storage) or
+uploaded as S3 multipart parts, so a worker never holds more than one spooled
+chunk of the file. Every chunk is verified against its SHA-256 before it is
+recorded; a chunk that fails verification can simply be sent again.
+
+Direct uploads skip the app server entirely when media is on S3:
+
+    POST   /api/admin/direct-uploads/                 declare size, part size and per-part SHA-256
+    GET    /api/admin/direct-uploads/<id>/            fresh presigned URLs for the parts still missing
+    POST   /api/admin/direct-uploads/<id>/complete/   verify the parts, complete, create the Track
+
+The client PUTs each part to its presigned URL in parallel. The URLs are
+signed with the part's checksum, so S3 rejects corrupted parts, and the
+assembled object's size and composite checksum are checked on completion.
+"""
+from datetime import timedelta
+import base64
+import hashlib
+import logging
+import mimetypes
+import os
+import tempfile
+
+from botocore.exceptions import ClientError
+from django.conf import settings
+from django.core.files import File
+from django.db import transaction
+from django.utils import timezone
+
+from .catalog import CatalogResolver, resolve_artist_album, queue_track_processing
+from .models import Track, UploadSession
+from .storage import is_s3_storage, s3_key
+
+logger = logging.getLogger(__name__)
+
+# Request bodies are copied in reads of this size
+COPY_CHUNK_SIZE = 64 * 1024
+
+# S3 multipart limits
+S3_MIN_PART_SIZE = 5 * 1024 * 1024
+S3_MAX_PARTS = 10000
+
+# Track metadata accepted when a session is created
+METADATA_FIELDS = [
+    'title', 'artist_name', 'artist_bio', 'album_title', 'release_date',
+    'duration', 'genre', 'album_cover_url',
+]
+
+
+class UploadError(Exception):
+    """A client error in the upload protocol (reported as HTTP 400)"""
+
+
+class TemporaryFile(File):
+    """A finished upload on local disk; FileSystemStorage moves it instead of copying"""
+
+    def temporary_file_path(self):
+        return self.file.name
+
+
+def _track_storage():
+    return Track._meta.get_field('file').storage
+
+
+def _s3_client(storage):
+    return storage.bucket.meta.client
+
+
+def _new_session(user, filename, total_size, chunk_size, metadata):
+    filename = os.path.basename(filename or '')
+    if not filename:
+        raise UploadError("filename is required")
+    if total_size <= 0:
+        raise UploadError("size must be a positive number of bytes")
+    if total_size > settings.MUSIC_UPLOAD_MAX_SIZE:
+        raise UploadError(f"size exceeds the {settings.MUSIC_UPLOAD_MAX_SIZE} byte limit")
+
+    return UploadSession(
+        user=user,
+        filename=filename,
+        total_size=total_size,
+        chunk_size=chunk_size,
+        metadata={key: metadata[key] for key in METADATA_FIELDS if key in metadata},
+        expires_at=timezone.now() + timedelta(seconds=settings.MUSIC_UPLOAD_SESSION_TTL),
+    )
+
+
+def _start_multipart(session, storage, **extra):
+    field = Track._meta.get_field('file')
+    name = storage.get_available_name(field.generate_filename(None, session.filename))
+    content_type = mimetypes.guess_type(session.filename)[0] or 'application/octet-stream'
+    response = _s3_client(storage).create_multipart_upload(
+        Bucket=storage.bucket_name,
+        Key=s3_key(storage, name),
+        ContentType=content_type,
+        **storage.get_object_parameters(name),
+        **extra,
+    )
+    session.storage_name = name
+    session.s3_upload_id = response['UploadId']
+
+
+def create_session(user, filename, total_size, metadata):
+    session = _new_session(user, filename, total_size, settings.MUSIC_UPLOAD_CHUNK_SIZE, metadata)
+
+    storage = _track_storage()
+    if is_s3_storage(storage):
+        session.backend = UploadSession.BACKEND_S3
+        _start_multipart(session, storage)
+    else:
+        os.makedirs(settings.MUSIC_UPLOAD_TEMP_DIR, exist_ok=True)
+        fd, path = tempfile.mkstemp(
+            prefix='upload-', suffix=os.path.splitext(session.filename)[1],
+            dir=settings.MUSIC_UPLOAD_TEMP_DIR,
+        )
+        try:
+            os.ftruncate(fd, total_size)
+        finally:
+            os.close(fd)
+        session.backend = UploadSession.BACKEND_LOCAL
+        session.temp_path = path
+
+    session.save()
+    logger.info(f"Upload session {session.pk} created for {session.filename} ({total_size} bytes, {session.backend})")
+    return session
+
+
+def create_direct_session(user, filename, total_size, part_size, part_checksums, metadata):
+    """Start a multipart upload that the client sends straight to S3.
+
+    The client declares the SHA-256 (hex) of every part up front; each
+    presigned part URL is signed with its checksum, so S3 itself rejects a
+    part whose bytes don't match.
+    """
+    storage = _track_storage()
+    if not is_s3_storage(storage):
+        raise UploadError("Direct uploads require S3 storage")
+
+    session = _new_session(user, filename, total_size, part_size, metadata)
+    if session.part_count > 1 and part_size < S3_MIN_PART_SIZE:
+        raise UploadError(f"part_size must be at least {S3_MIN_PART_SIZE} bytes")
+    if session.part_count > S3_MAX_PARTS:
+        raise UploadError(f"a file can have at most {S3_MAX_PARTS} parts")
+    checksums = [str(checksum).strip().lower() for checksum in part_checksums or []]
+    if len(checksums) != session.part_count:
+        raise UploadError(f"expected {session.part_count} part checksums")
+    if any(len(checksum) != 64 for checksum in checksums):
+        raise UploadError("part checksums must be hex SHA-256 digests")
+
+    session.backend = UploadSession.BACKEND_S3_DIRECT
+    session.part_checksums = checksums
+    _start_multipart(session, storage, ChecksumAlgorithm='SHA256')
+    session.save()
+    logger.info(f"Direct upload session {session.pk} created for {session.filename} ({total_size} bytes)")
+    return session
+
+
+def _b64_checksum(hex_digest):
+    return base64.b64encode(bytes.fromhex(hex_digest)).decode()
+
+
+def presign_parts(session, part_numbers=None):
+    """Presigned PUT URLs (and the headers they were signed with) for parts"""
+    storage = _track_storage()
+    client = _s3_client(storage)
+    key = s3_key(storage, session.storage_name)
+    urls = []
+    for number in part_numbers or range(1, session.part_count + 1):
+        checksum = _b64_checksum(session.part_checksums[number - 1])
+        urls.append({
+            'part_number': number,
+            'size': session.part_size(number),
+            'url': client.generate_presigned_url(
+                'upload_part',
+                Params={
+                    'Bucket': storage.bucket_name,
+                    'Key': key,
+                    'UploadId': session.s3_upload_id,
+                    'PartNumber': number,
+                    'ChecksumSHA256': checksum,
+                },
+                ExpiresIn=settings.MUSIC_DIRECT_UPLOAD_URL_EXPIRY,
+            ),
+            'headers': {'x-amz-checksum-sha256': checksum},
+        })
+    return urls
+
+
+def sync_direct_parts(session, client_parts=None):
+    """Record the parts S3 has received for a direct upload.
+
+    Sizes (and checksums, when S3 reports them) must match what was
+    declared. If the client sent its own list of part ETags, it has to agree
+    with S3's.
+    """
+    storage = _track_storage()
+    client = _s3_client(storage)
+    received = {}
+    params = {
+        'Bucket': storage.bucket_name,
+        'Key': s3_key(storage, session.storage_name),
+        'UploadId': session.s3_upload_id,
+    }
+    while True:
+        response = client.list_parts(**params)
+        for part in response.get('Parts', []):
+            number = part['PartNumber']
+            if number > session.part_count or part['Size'] != session.part_size(number):
+                raise UploadError(f"part {number} has the wrong size ({part['Size']} bytes)")
+            expected = session.part_checksums[number - 1]
+            if part.get('ChecksumSHA256') and part['ChecksumSHA256'] != _b64_checksum(expected):
+                raise UploadError(f"part {number} checksum mismatch")
+            received[str(number)] = {'size': part['Size'], 'sha256': expected, 'etag': part['ETag']}
+        if not response.get('IsTruncated'):
+            break
+        params['PartNumberMarker'] = response['NextPartNumberMarker']
+
+    for part in client_parts or []:
+        number = str(part.get('part_number', part.get('PartNumber')))
+        etag = str(part.get('etag', part.get('ETag', ''))).strip('"')
+        if not etag:
+            # Browsers can only read ETag when the bucket's CORS rules expose it
+            continue
+        if number not in received or received[number]['etag'].strip('"') != etag:
+            raise UploadError(f"part {number} was not received by storage")
+
+    session.parts = received
+    session.save(update_fields=['parts'])
+    return session
+
+
+def _check_active(session):
+    if session.status != UploadSession.STATUS_ACTIVE:
+        raise UploadError(f"Upload session is {session.status}")
+    if session.expires_at < timezone.now():
+        raise UploadError("Upload session has expired")
+
+
+def _copy_body(stream, size, target, digest):
+    received = 0
+    while received < size:
+        chunk = stream.read(min(COPY_CHUNK_SIZE, size - received))
+        if not chunk:
+            break
+        digest.update(chunk)
+        target.write(chunk)
+        received += len(chunk)
+    return received
+
+
+def write_chunk(session, offset, stream, content_length, sha256):
+    """Receive one chunk at the given offset and record it as a finished part"""
+    _check_active(session)
+    if session.backend == UploadSession.BACKEND_S3_DIRECT:
+        raise UploadError("Parts of a direct upload are sent to storage, not to this endpoint")
+    if not sha256:
+        raise UploadError("X-Chunk-SHA256 header is required")
+    if offset < 0 or offset % session.chunk_size:
+        raise UploadError(f"offset must be a multiple of the chunk size ({session.chunk_size})")
+    part_number = offset // session.chunk_size + 1
+    if part_number > session.part_count:
+        raise UploadError("offset is past the end of the file")
+    expected_size = session.part_size(part_number)
+    if content_length != expected_size:
+        raise UploadError(f"chunk at offset {offset} must be {expected_size} bytes")
+
+    digest = hashlib.sha256()
+    etag = ''
+    if session.backend == UploadSession.BACKEND_LOCAL:
+        with open(session.temp_path, 'r+b') as target:
+            target.seek(offset)
+            received = _copy_body(stream, expected_size, target, digest)
+        # A bad chunk is left in place; it isn't recorded and gets overwritten on retry
+        _verify_chunk(received, expected_size, digest, sha256)
+    else:
+        # S3 parts can't be un-sent, so verify before uploading. The spool
+        # keeps small chunks in memory and large ones on disk.
+        with tempfile.SpooledTemporaryFile(max_size=1024 * 1024) as spool:
+            received = _copy_body(stream, expected_size, spool, digest)
+            _verify_chunk(received, expected_size, digest, sha256)
+            spool.seek(0)
+            storage = _track_storage()
+            response = _s3_client(storage).upload_part(
+                Bucket=storage.bucket_name,
+                Key=s3_key(storage, session.storage_name),
+                UploadId=session.s3_upload_id,
+                PartNumber=part_number,
+                Body=spool,
+                ContentLength=received,
+            )
+            etag = response['ETag']
+
+    # Parallel chunk uploads update the same JSON column, so lock the row
+    with transaction.atomic():
+        session = UploadSession.objects.select_for_update().get(pk=session.pk)
+        session.parts[str(part_number)] = {
+            'size': received,
+            'sha256': digest.hexdigest(),
+            'etag': etag,
+        }
+        session.save(update_fields=['parts'])
+    return session
+
+
+def _verify_chunk(received, expected_size, digest, sha256):
+    if received != expected_size:
+        raise UploadError(f"chunk was truncated ({received} of {expected_size} bytes)")
+    if digest.hexdigest() != sha256.strip().lower():
+        raise UploadError("chunk checksum mismatch")
+
+
+def finalize(session):
+    """Assemble the uploaded parts and create the Track. Returns (track, jobs)."""
+    if session.status == UploadSession.STATUS_COMPLETE and session.track_id:
+        # A retried finalize (e.g. after a dropped response) is a no-op
+        return session.track, []
+    _check_active(session)
+    missing = session.missing_parts
+    if missing:
+        raise UploadError(f"missing parts: {missing[:20]}")
+
+    # Claim the session so a concurrent finalize can't create a second track
+    claimed = UploadSession.objects.filter(
+        pk=session.pk, status=UploadSession.STATUS_ACTIVE
+    ).update(status=UploadSession.STATUS_COMPLETE)
+    if not claimed:
+        raise UploadError("Upload session is already being finalized")
+
+    metadata = session.metadata
+    # Once S3 has completed the upload its UploadId is spent, so a failure
+    # after that point can't be retried and ends the session instead
+    completed = False
+    try:
+        resolver = CatalogResolver()
+        artist, album = resolve_artist_album(metadata, resolver)
+        track = Track(
+            title=metadata.get('title') or os.path.splitext(session.filename)[0],
+            artist=artist,
+            album=album,
+            duration=int(metadata.get('duration') or 0),
+            genre=resolver.genre(metadata.get('genre', '')),
+        )
+        if session.backend == UploadSession.BACKEND_LOCAL:
+            with open(session.temp_path, 'rb') as fh:
+                track.file.save(session.filename, TemporaryFile(fh), save=False)
+            track.save()
+            if os.path.exists(session.temp_path):
+                os.remove(session.temp_path)
+        else:
+            storage = _track_storage()
+            key = s3_key(storage, session.storage_name)
+            client = _s3_client(storage)
+            direct = session.backend == UploadSession.BACKEND_S3_DIRECT
+            parts = []
+            for number in range(1, session.part_count + 1):
+                part = {'PartNumber': number, 'ETag': session.parts[str(number)]['etag']}
+                if direct:
+                    part['ChecksumSHA256'] = _b64_checksum(session.parts[str(number)]['sha256'])
+                parts.append(part)
+            try:
+                client.complete_multipart_upload(
+                    Bucket=storage.bucket_name,
+                    Key=key,
+                    UploadId=session.s3_upload_id,
+                    MultipartUpload={'Parts': parts},
+                )
+            except ClientError as e:
+                if e.response.get('Error', {}).get('Code') == 'NoSuchUpload':
+                    completed = True
+                raise UploadError(f"Storage could not complete the upload: {e}") from e
+            completed = True
+            _verify_object(session, client, storage.bucket_name, key)
+            track.file.name = session.storage_name
+            track.save()
+    except Exception:
+        if completed:
+            UploadSession.objects.filter(pk=session.pk).update(status=UploadSession.STATUS_ABORTED)
+            logger.error(f"Upload session {session.pk} failed after storage completed it", exc_info=True)
+            try:
+                # No track refers to the assembled object
+                client.delete_object(Bucket=storage.bucket_name, Key=key)
+            except ClientError:
+                pass
+        else:
+            UploadSession.objects.filter(pk=session.pk).update(status=UploadSession.STATUS_ACTIVE)
+        raise
+
+    session.status = UploadSession.STATUS_COMPLETE
+    session.track = track
+    session.save(update_fields=['status', 'track'])
+    logger.info(f"Upload session {session.pk} finalized as track {track.pk}")
+    return track, queue_track_processing(track, cover_url=metadata.get('album_cover_url'))
+
+
+def _verify_object(session, client, bucket, key):
+    """Check the assembled object's size and, for direct uploads, its checksum"""
+    head = client.head_object(Bucket=bucket, Key=key, ChecksumMode='ENABLED')
+    problem = None
+    if head['ContentLength'] != session.total_size:
+        problem = f"stored object is {head['ContentLength']} bytes, expected {session.total_size}"
+    elif session.backend == UploadSession.BACKEND_S3_DIRECT and head.get('ChecksumSHA256'):
+        # S3 reports multipart checksums as sha256(concat(part digests))-N
+        composite = hashlib.sha256(b''.join(
+            bytes.fromhex(checksum) for checksum in session.part_checksums
+        )).digest()
+        expected = base64.b64encode(composite).decode()
+        if head['ChecksumSHA256'].split('-')[0] != expected:
+            problem = "stored object checksum mismatch"
+    if problem:
+        client.delete_object(Bucket=bucket, Key=key)
+        raise UploadError(problem)
+
+
+def abort(session):
+    """Discard an upload session and whatever was received so far"""
+    if session.status == UploadSession.STATUS_COMPLETE:
+        raise UploadError("Upload session is already complete")
+    if session.backend == UploadSession.BACKEND_LOCAL:
+        if session.temp_path and os.path.exists(session.temp_path):
+            os.remove(session.temp_path)
+    elif session.s3_upload_id and session.status == UploadSession.STATUS_ACTIVE:
+        storage = _track_storage()
+        _s3_client(storage).abort_multipart_upload(
+            Bucket=storage.bucket_name,
+            Key=s3_key(storage, session.storage_name),
+            UploadId=session.s3_upload_id,
+        )
+    session.status = UploadSession.STATUS_ABORTED
+    session.save(update_fields=['status'])
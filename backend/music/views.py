@@ -1,31 +1,64 @@
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date
+from functools import partial
+import logging
+import os
+from urllib.parse import quote
+
+from botocore.exceptions import ClientError
 from rest_framework import generics, permissions, filters, status
 from rest_framework.views import APIView
 from rest_framework.response import Response
-from rest_framework.decorators import api_view, permission_classes
+from rest_framework.decorators import api_view, permission_classes, throttle_classes
+from rest_framework.pagination import CursorPagination
 from rest_framework.parsers import MultiPartParser, FormParser
+from django.conf import settings
 from django.shortcuts import get_object_or_404
-from django.http import FileResponse
-from django.db.models import Q, Count
-from .models import Track, DownloadLog, Artist, Album
+from django.http import FileResponse, Http404
+from django.db.models import Q, Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+from .models import Track, DownloadLog, Artist, Album, Genre, Job, UploadSession, Playlist, PlaylistItem, SimilarTrack
+from .catalog import CatalogResolver, create_album_tracks, resolve_artist_album, queue_track_processing
+from .facets import FacetError, cached_facet_counts, parse_facets
+from .images import queue_image_variants
+from .jobs import enqueue
+from . import playlists, uploads
+from .mediacache import cache_stats
+from .normalize import genre_key
+from .storage import open_stream
+from .throttling import (
+    FileChunks, ListRateThrottle, SearchRateThrottle, ThrottledFile, acquire_stream, is_asgi_request,
+    stream_response,
+)
+from .zipstream import ZipEntry, archive_size, stream_archive
 from .serializers import (
     TrackListSerializer, 
     TrackDetailSerializer,
     ArtistSerializer, 
     AlbumSerializer,
-    DownloadLogSerializer
+    GenreSerializer,
+    DownloadLogSerializer,
+    SimilarTrackSerializer,
+    PlaylistSerializer,
+    PlaylistItemSerializer,
+    JobSerializer,
+    UploadSessionSerializer
 )
 
+logger = logging.getLogger(__name__)
+
 class TrackListView(generics.ListAPIView):
     """List all tracks with search and filtering"""
     serializer_class = TrackListSerializer
     permission_classes = [permissions.AllowAny]
+    throttle_classes = [ListRateThrottle]
     filter_backends = [filters.SearchFilter, filters.OrderingFilter]
-    search_fields = ['title', 'artist__name', 'album__title', 'genre']
+    search_fields = ['title', 'artist__name', 'album__title', 'genre__name']
     ordering_fields = ['created_at', 'title', 'duration']
     ordering = ['-created_at']
     
     def get_queryset(self):
-        queryset = Track.objects.select_related('artist', 'album').all()
+        queryset = Track.objects.select_related('artist', 'album', 'genre').all()
         
         # Filter by artist
         artist_id = self.request.query_params.get('artist', None)
@@ -40,28 +73,146 @@ class TrackListView(generics.ListAPIView):
         # Filter by genre
         genre = self.request.query_params.get('genre', None)
         if genre:
-            queryset = queryset.filter(genre__iexact=genre)
+            # Matches on the indexed key, so 'Rock' and 'rock ' are the same genre
+            queryset = queryset.filter(genre__key=genre_key(genre))
+
+        # Filter by decade of the album's release (e.g. ?decade=1990)
+        decade = self.request.query_params.get('decade', None)
+        if decade and decade.isdigit():
+            start = int(decade) // 10 * 10
+            queryset = queryset.filter(
+                album__release_date__gte=date(start, 1, 1),
+                album__release_date__lt=date(start + 10, 1, 1),
+            )
         
         return queryset
 
+    def list(self, request, *args, **kwargs):
+        # ?facets=genre,artist,decade wraps the results with refinement counts
+        facets = request.query_params.get('facets', None)
+        if not facets:
+            return super().list(request, *args, **kwargs)
+        try:
+            facets = parse_facets(facets)
+        except FacetError as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        queryset = self.filter_queryset(self.get_queryset())
+        params = {
+            name: request.query_params.get(name, '')
+            for name in ['artist', 'album', 'genre', 'decade', 'search']
+        }
+        return Response({
+            'results': self.get_serializer(queryset, many=True).data,
+            'facets': cached_facet_counts(queryset, facets, {**params, 'facets': ','.join(facets)}),
+        })
+
 class TrackDetailView(generics.RetrieveAPIView):
     """Get detailed information about a single track"""
-    queryset = Track.objects.select_related('artist', 'album').all()
+    queryset = Track.objects.select_related('artist', 'album', 'genre').all()
     serializer_class = TrackDetailSerializer
     permission_classes = [permissions.AllowAny]
 
+def _count_subquery(model, field, outer_ref):
+    """COUNT of ``model`` rows whose ``field`` matches ``outer_ref``, as a subquery"""
+    counts = model.objects.filter(**{field: OuterRef(outer_ref)}).order_by().values(field).annotate(n=Count('pk'))
+    return Coalesce(Subquery(counts.values('n')), 0)
+
+def _with_detail_counts(queryset):
+    """Counts shown by TrackDetailSerializer, annotated so they come with the tracks"""
+    return queryset.select_related('album__artist').annotate(
+        download_count=_count_subquery(DownloadLog, 'track', 'pk'),
+        artist_tracks_count=_count_subquery(Track, 'artist', 'artist_id'),
+        artist_albums_count=_count_subquery(Album, 'artist', 'artist_id'),
+        album_tracks_count=_count_subquery(Track, 'album', 'album_id'),
+        album_artist_tracks_count=_count_subquery(Track, 'artist', 'album__artist_id'),
+        album_artist_albums_count=_count_subquery(Album, 'artist', 'album__artist_id'),
+    )
+
+def _attach_detail_counts(track):
+    track.related_counts = {'downloads': track.download_count}
+    track.artist.related_counts = {'tracks': track.artist_tracks_count, 'albums': track.artist_albums_count}
+    track.album.related_counts = {'tracks': track.album_tracks_count}
+    track.album.artist.related_counts = {
+        'tracks': track.album_artist_tracks_count,
+        'albums': track.album_artist_albums_count,
+    }
+
+class TrackBatchView(APIView):
+    """Several tracks in one request, in the order asked for (?ids=3,1,2).
+
+    Rebuilds player queues without a request per track. ``?fields=lite``
+    returns the track list fields instead of the full detail. Ids that
+    don't exist are listed under ``missing``.
+    """
+    permission_classes = [permissions.AllowAny]
+    throttle_classes = [ListRateThrottle]
+
+    def get(self, request):
+        try:
+            ids = [int(value) for value in request.query_params.get('ids', '').split(',') if value.strip()]
+        except ValueError:
+            return Response({"error": "ids must be a comma-separated list of track ids"},
+                            status=status.HTTP_400_BAD_REQUEST)
+        if not ids:
+            return Response({"error": "No track ids given"}, status=status.HTTP_400_BAD_REQUEST)
+        if len(ids) > settings.MUSIC_TRACK_BATCH_MAX_IDS:
+            return Response({"error": f"At most {settings.MUSIC_TRACK_BATCH_MAX_IDS} ids per request"},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        fields = request.query_params.get('fields', 'full')
+        queryset = Track.objects.select_related('artist', 'album', 'genre')
+        if fields == 'lite':
+            serializer_class = TrackListSerializer
+        elif fields == 'full':
+            serializer_class = TrackDetailSerializer
+            queryset = _with_detail_counts(queryset)
+        else:
+            return Response({"error": "fields must be 'full' or 'lite'"}, status=status.HTTP_400_BAD_REQUEST)
+
+        tracks = queryset.in_bulk(set(ids))
+        if fields == 'full':
+            for track in tracks.values():
+                _attach_detail_counts(track)
+        # A queue may hold the same track twice, so duplicates are kept
+        ordered = [tracks[pk] for pk in ids if pk in tracks]
+        return Response({
+            'results': serializer_class(ordered, many=True, context={'request': request}).data,
+            'missing': [pk for pk in dict.fromkeys(ids) if pk not in tracks],
+        })
+
+
+class SimilarTrackListView(generics.ListAPIView):
+    """Tracks often downloaded by the same users (built by `manage.py build_similar_tracks`)"""
+    serializer_class = SimilarTrackSerializer
+    permission_classes = [permissions.AllowAny]
+    throttle_classes = [ListRateThrottle]
+
+    def get_queryset(self):
+        # ?limit= returns fewer than the MUSIC_SIMILAR_TRACKS stored per track
+        limit = self.request.query_params.get('limit', '')
+        limit = int(limit) if limit.isdigit() else settings.MUSIC_SIMILAR_TRACKS
+        return SimilarTrack.objects.filter(track_id=self.kwargs['pk']).select_related(
+            'similar__artist', 'similar__album', 'similar__genre'
+        ).order_by('-score', 'similar_id')[:limit]
+
+
 class DownloadTrackView(APIView):
     """Download a track file (requires authentication)"""
     permission_classes = [permissions.IsAuthenticated]
 
     def get(self, request, pk):
         track = get_object_or_404(Track, pk=pk)
+        # Refused before logging when the user has too many downloads running;
+        # the slot is given back when the response is closed
+        release = acquire_stream(request)
 
-        # Log download
-        DownloadLog.objects.create(user=request.user, track=track)
-        
         try:
+            # Log download
+            DownloadLog.objects.create(user=request.user, track=track)
+
             if not track.file:
+                release()
                 return Response(
                     {"error": "No file associated with this track"},
                     status=status.HTTP_404_NOT_FOUND
@@ -69,7 +220,6 @@ class DownloadTrackView(APIView):
 
             # Get filename and extension
             import os
-            from django.http import StreamingHttpResponse
             from urllib.parse import quote
             
             original_filename = track.file.name
@@ -83,11 +233,21 @@ class DownloadTrackView(APIView):
             # URLEncode filename for Content-Disposition header (RFC 5987)
             encoded_filename = quote(download_filename)
 
-            # Open the file handler (works for both Local and S3 via django-storages)
-            file_handle = track.file.open('rb')
+            if is_asgi_request(request):
+                # Async stream: a slow client waits on the event loop, not in a thread
+                size = track.file.size
+                response = stream_response(
+                    request, FileChunks(open_stream(track.file.storage, track.file.name)),
+                    release, 'application/octet-stream',
+                )
+                response['Content-Length'] = str(size)
+            else:
+                # Open the file handler (works for both Local and S3 via django-storages).
+                # With the media cache enabled, S3 files come from local disk too.
+                file_handle = ThrottledFile(track.file.open('rb'), release)
 
-            # Create StreamingHttpResponse
-            response = StreamingHttpResponse(file_handle, content_type='application/octet-stream')
+                # FileResponse lets the WSGI server send local files with sendfile
+                response = FileResponse(file_handle, content_type='application/octet-stream')
             
             # Set Content-Disposition header correctly for all browsers
             response['Content-Disposition'] = f"attachment; filename*=UTF-8''{encoded_filename}"
@@ -96,6 +256,7 @@ class DownloadTrackView(APIView):
             return response
 
         except FileNotFoundError:
+            release()
             return Response(
                 {"error": "File not found on server"},
                 status=status.HTTP_404_NOT_FOUND
@@ -104,11 +265,76 @@ class DownloadTrackView(APIView):
             import logging
             logger = logging.getLogger(__name__)
             logger.error(f"Download failed: {str(e)}", exc_info=True)
+            release()
             return Response(
                 {"error": "Download failed. Please try again later."},
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR
             )
 
+class AlbumDownloadView(APIView):
+    """Download a whole album as a ZIP streamed on the fly (requires authentication)"""
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get(self, request, pk):
+        album = get_object_or_404(Album.objects.select_related('artist'), pk=pk)
+        tracks = list(album.tracks.select_related('artist').exclude(file='').order_by('id'))
+        if not tracks:
+            return Response({"error": "This album has no downloadable tracks"}, status=status.HTTP_404_NOT_FOUND)
+
+        # One size lookup per file (a HEAD request on S3), in parallel
+        with ThreadPoolExecutor(max_workers=min(8, len(tracks))) as pool:
+            sizes = list(pool.map(_stored_size, tracks))
+        missing = [track.title for track, size in zip(tracks, sizes) if size is None]
+        if missing:
+            logger.warning(f"Album {album.pk} download is missing files for: {missing}")
+        entries = []
+        names = set()
+        for number, (track, size) in enumerate(zip(tracks, sizes), start=1):
+            if size is None:
+                continue
+            extension = os.path.splitext(track.file.name)[1] or '.mp3'
+            name = _safe_filename(f"{number:02d} - {track.artist.name} - {track.title}") + extension
+            if name in names:
+                name = f"{os.path.splitext(name)[0]} ({track.pk}){extension}"
+            names.add(name)
+            entries.append(ZipEntry(
+                name=name,
+                size=size,
+                open=partial(open_stream, track.file.storage, track.file.name),
+                modified=track.created_at,
+            ))
+        if not entries:
+            return Response({"error": "Files not found on server"}, status=status.HTTP_404_NOT_FOUND)
+
+        release = acquire_stream(request)
+        try:
+            DownloadLog.objects.bulk_create([
+                DownloadLog(user=request.user, track=track)
+                for track, size in zip(tracks, sizes) if size is not None
+            ])
+            response = stream_response(request, stream_archive(entries), release, 'application/zip')
+        except Exception:
+            release()
+            raise
+
+        filename = _safe_filename(f"{album.artist.name} - {album.title}") + '.zip'
+        response['Content-Length'] = str(archive_size(entries))
+        response['Content-Disposition'] = f"attachment; filename*=UTF-8''{quote(filename)}"
+        response["Access-Control-Allow-Origin"] = "*"
+        return response
+
+
+def _stored_size(track):
+    try:
+        return track.file.storage.size(track.file.name)
+    except (FileNotFoundError, OSError, ClientError):
+        return None
+
+
+def _safe_filename(name):
+    return name.replace('/', '_').replace('\\', '_')
+
+
 @api_view(['POST'])
 @permission_classes([permissions.IsAuthenticated])
 def log_download(request, pk):
@@ -117,6 +343,13 @@ def log_download(request, pk):
     DownloadLog.objects.create(user=request.user, track=track)
     return Response({"message": "Download logged successfully"}, status=status.HTTP_201_CREATED)
 
+class GenreListView(generics.ListAPIView):
+    """List genres that have tracks, with their track counts"""
+    queryset = Genre.objects.filter(track_count__gt=0)
+    serializer_class = GenreSerializer
+    permission_classes = [permissions.AllowAny]
+    throttle_classes = [ListRateThrottle]
+
 class ArtistListView(generics.ListAPIView):
     """List all artists with track/album counts"""
     queryset = Artist.objects.annotate(
@@ -125,6 +358,7 @@ class ArtistListView(generics.ListAPIView):
     ).all()
     serializer_class = ArtistSerializer
     permission_classes = [permissions.AllowAny]
+    throttle_classes = [ListRateThrottle]
     filter_backends = [filters.SearchFilter, filters.OrderingFilter]
     search_fields = ['name']
     ordering_fields = ['name', 'tracks_count']
@@ -139,6 +373,7 @@ class AlbumListView(generics.ListAPIView):
     """List all albums with filtering"""
     serializer_class = AlbumSerializer
     permission_classes = [permissions.AllowAny]
+    throttle_classes = [ListRateThrottle]
     filter_backends = [filters.SearchFilter, filters.OrderingFilter]
     search_fields = ['title', 'artist__name']
     ordering_fields = ['release_date', 'title']
@@ -164,14 +399,110 @@ class UserDownloadListView(generics.ListAPIView):
     """List all downloads for the authenticated user"""
     serializer_class = DownloadLogSerializer
     permission_classes = [permissions.IsAuthenticated]
+    throttle_classes = [ListRateThrottle]
 
     def get_queryset(self):
         return DownloadLog.objects.filter(
             user=self.request.user
-        ).select_related('track__artist', 'track__album').order_by('-downloaded_at')
+        ).select_related('track__artist', 'track__album', 'track__genre').order_by('-downloaded_at')
+
+class PlaylistListCreateView(generics.ListCreateAPIView):
+    """List and create the authenticated user's playlists"""
+    serializer_class = PlaylistSerializer
+    permission_classes = [permissions.IsAuthenticated]
+    throttle_classes = [ListRateThrottle]
+
+    def get_queryset(self):
+        return Playlist.objects.filter(user=self.request.user).annotate(item_count=Count('items'))
+
+    def perform_create(self, serializer):
+        serializer.save(user=self.request.user)
+
+class PlaylistDetailView(generics.RetrieveUpdateDestroyAPIView):
+    """Rename, describe or delete one of the user's playlists"""
+    serializer_class = PlaylistSerializer
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get_queryset(self):
+        return Playlist.objects.filter(user=self.request.user)
+
+class PlaylistItemPagination(CursorPagination):
+    """Keyset pagination on rank: deep pages cost the same as the first"""
+    ordering = 'rank'
+    page_size = 100
+    page_size_query_param = 'limit'
+    max_page_size = 500
+
+def _playlist_item(playlist, item_id):
+    """An item of ``playlist`` by id, for the ``after`` parameters (None stays None)"""
+    if item_id is None:
+        return None
+    if not isinstance(item_id, int):
+        raise Http404("No such playlist item")
+    return get_object_or_404(PlaylistItem, playlist=playlist, pk=item_id)
+
+class PlaylistItemListView(generics.ListAPIView):
+    """Items of a playlist in order, and adding tracks to it.
+
+    POST {"track_ids": [...], "after": <item id>} inserts the tracks after
+    that item, at the start for "after": null, or at the end without "after".
+    """
+    serializer_class = PlaylistItemSerializer
+    permission_classes = [permissions.IsAuthenticated]
+    pagination_class = PlaylistItemPagination
+
+    def get_playlist(self):
+        return get_object_or_404(Playlist, pk=self.kwargs['pk'], user=self.request.user)
+
+    def get_queryset(self):
+        return PlaylistItem.objects.filter(
+            playlist=self.get_playlist()
+        ).select_related('track__artist', 'track__album', 'track__genre')
+
+    def post(self, request, pk):
+        playlist = self.get_playlist()
+        track_ids = request.data.get('track_ids')
+        if not isinstance(track_ids, list) or not track_ids or not all(isinstance(i, int) for i in track_ids):
+            return Response({"error": "track_ids must be a non-empty list of track ids"},
+                            status=status.HTTP_400_BAD_REQUEST)
+        tracks = Track.objects.select_related('artist', 'album', 'genre').in_bulk(set(track_ids))
+        missing = [pk for pk in dict.fromkeys(track_ids) if pk not in tracks]
+        if missing:
+            return Response({"error": "Unknown tracks", "missing": missing}, status=status.HTTP_400_BAD_REQUEST)
+
+        after = _playlist_item(playlist, request.data['after']) if 'after' in request.data else playlists.END
+        try:
+            items = playlists.add_tracks(playlist, [tracks[pk] for pk in track_ids], after=after)
+        except playlists.PlaylistError as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(PlaylistItemSerializer(items, many=True, context={'request': request}).data,
+                        status=status.HTTP_201_CREATED)
+
+class PlaylistItemDetailView(APIView):
+    """Move an item (PATCH {"after": <item id or null>}) or remove it"""
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get_item(self, request, pk, item_pk):
+        return get_object_or_404(
+            PlaylistItem.objects.select_related('playlist', 'track__artist', 'track__album', 'track__genre'),
+            pk=item_pk, playlist_id=pk, playlist__user=request.user,
+        )
+
+    def patch(self, request, pk, item_pk):
+        item = self.get_item(request, pk, item_pk)
+        if 'after' not in request.data:
+            return Response({"error": "after is required"}, status=status.HTTP_400_BAD_REQUEST)
+        after = _playlist_item(item.playlist, request.data['after'])
+        item = playlists.move_item(item, after)
+        return Response(PlaylistItemSerializer(item, context={'request': request}).data)
+
+    def delete(self, request, pk, item_pk):
+        playlists.remove_item(self.get_item(request, pk, item_pk))
+        return Response(status=status.HTTP_204_NO_CONTENT)
 
 @api_view(['GET'])
 @permission_classes([permissions.AllowAny])
+@throttle_classes([SearchRateThrottle])
 def search_all(request):
     """Search across tracks, artists, and albums"""
     query = request.query_params.get('q', '')
@@ -188,7 +519,7 @@ def search_all(request):
         Q(title__icontains=query) |
         Q(artist__name__icontains=query) |
         Q(album__title__icontains=query)
-    ).select_related('artist', 'album')[:10]
+    ).select_related('artist', 'album', 'genre')[:10]
     
     # Search artists
     artists = Artist.objects.filter(name__icontains=query)[:10]
@@ -215,24 +546,9 @@ class TrackUploadView(APIView):
         logger = logging.getLogger(__name__)
         
         try:
-            # 1. Get or create the Artist
-            artist_name = request.data.get('artist_name')
-            logger.info(f"Creating/getting artist: {artist_name}")
-            artist, _ = Artist.objects.get_or_create(
-                name=artist_name,
-                defaults={'bio': request.data.get('artist_bio', '')}
-            )
-            
-            # 2. Get or create the Album
-            album_title = request.data.get('album_title')
-            logger.info(f"Creating/getting album: {album_title}")
-            album, _ = Album.objects.get_or_create(
-                title=album_title,
-                artist=artist,
-                defaults={
-                    'release_date': request.data.get('release_date', '2024-01-01')
-                }
-            )
+            # 1-2. Get or create the Artist and Album
+            resolver = CatalogResolver()
+            artist, album = resolve_artist_album(request.data, resolver)
             
             # 3. Create the Track
             track_title = request.data.get('title')
@@ -248,17 +564,27 @@ class TrackUploadView(APIView):
             
             music_file = request.FILES.get('file')
             logger.info(f"Music file: {music_file.name}, size: {music_file.size} bytes")
+
+            # The upload handler probed the headers while receiving the file;
+            # the submitted duration is only used if that failed (a probe job
+            # then retries against the stored file).
+            audio_info = getattr(music_file, 'audio_info', None)
+            if audio_info and not track_title:
+                track_title = audio_info.tags.get('title', track_title)
             
             try:
-                track = Track.objects.create(
+                track = Track(
                     title=track_title,
                     artist=artist,
                     album=album,
                     file=music_file,
                     preview_file=request.FILES.get('preview_file'),
                     duration=int(request.data.get('duration', 0)),
-                    genre=request.data.get('genre', '')
+                    genre=resolver.genre(request.data.get('genre') or (audio_info.tags.get('genre', '') if audio_info else ''))
                 )
+                if audio_info:
+                    track.apply_audio_info(audio_info)
+                track.save()
                 logger.info(f"Track created successfully. File path: {track.file.name if track.file else 'None'}")
             except Exception as e:
                 logger.error(f"Failed to create track: {str(e)}", exc_info=True)
@@ -268,6 +594,9 @@ class TrackUploadView(APIView):
                 )
             
             # 4. Handle Album Cover
+            # Slow work (remote downloads, reading the stored file back) runs
+            # as queued jobs so the response returns once the track row exists.
+            cover_url = None
             if 'album_cover' in request.FILES:
                 logger.info("Uploading album cover from file")
                 try:
@@ -277,35 +606,16 @@ class TrackUploadView(APIView):
                 except Exception as e:
                     logger.error(f"Failed to save album cover: {str(e)}", exc_info=True)
             elif 'album_cover_url' in request.data:
-                logger.info(f"Downloading album cover from URL: {request.data['album_cover_url']}")
-                try:
-                    import requests
-                    from django.core.files.base import ContentFile
-                    from django.utils.text import slugify
-                    
-                    image_url = request.data['album_cover_url']
-                    response = requests.get(image_url, timeout=10)
-                    if response.status_code == 200:
-                        # Use slugify to create a safe filename for S3
-                        safe_filename = slugify(album.title) or "album-cover"
-                        file_name = f"{safe_filename}.jpg"
-                        
-                        album.cover_image.save(
-                            file_name,
-                            ContentFile(response.content),
-                            save=True
-                        )
-                        logger.info(f"Album cover downloaded and saved: {album.cover_image.name}")
-                    else:
-                        logger.warning(f"Failed to download cover image: HTTP {response.status_code}")
-                except Exception as e:
-                    logger.error(f"Failed to download cover image: {str(e)}", exc_info=True)
+                cover_url = request.data['album_cover_url']
+            jobs = queue_track_processing(track, cover_url=cover_url)
+            variants_job = queue_image_variants(album)
+            if variants_job:
+                jobs.append(variants_job)
             
             logger.info(f"Upload completed successfully for track: {track.title}")
-            return Response(
-                TrackDetailSerializer(track).data,
-                status=status.HTTP_201_CREATED
-            )
+            data = TrackDetailSerializer(track).data
+            data['jobs'] = JobSerializer(jobs, many=True).data
+            return Response(data, status=status.HTTP_201_CREATED)
             
         except Exception as e:
             logger.error(f"Unexpected error in track upload: {str(e)}", exc_info=True)
@@ -314,18 +624,195 @@ class TrackUploadView(APIView):
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR
             )
 
+class AlbumUploadView(APIView):
+    """Upload many tracks of one album in a single request (admin only)
+
+    Multipart fields: the album metadata used by TrackUploadView, an optional
+    ``album_cover`` file or ``album_cover_url``, one ``files`` part per track
+    and optionally one ``titles`` value per file (same order). Responds 201
+    when every file was stored, 207 with per-file results otherwise.
+    """
+    permission_classes = [permissions.IsAdminUser]
+    parser_classes = [MultiPartParser, FormParser]
+
+    def post(self, request):
+        files = request.FILES.getlist('files')
+        if not files:
+            return Response({"error": "No music files provided"}, status=status.HTTP_400_BAD_REQUEST)
+        if not request.data.get('artist_name') or not request.data.get('album_title'):
+            return Response(
+                {"error": "artist_name and album_title are required"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        album, results, album_jobs = create_album_tracks(
+            request.data, files,
+            titles=request.data.getlist('titles'),
+            cover=request.FILES.get('album_cover'),
+        )
+        failed = [result for result in results if result.error]
+        return Response({
+            "album": AlbumSerializer(album, context={'request': request}).data,
+            "results": [{
+                "index": result.index,
+                "filename": result.filename,
+                "status": "failed" if result.error else "created",
+                "error": result.error or None,
+                "track": TrackListSerializer(result.track, context={'request': request}).data if result.track else None,
+                "jobs": JobSerializer(result.jobs, many=True).data,
+            } for result in results],
+            "jobs": JobSerializer(album_jobs, many=True).data,
+            "created": len(results) - len(failed),
+            "failed": len(failed),
+        }, status=status.HTTP_207_MULTI_STATUS if failed else status.HTTP_201_CREATED)
+
+class ChunkedUploadCreateView(APIView):
+    """Start a resumable chunked upload (admin only, see music.uploads)"""
+    permission_classes = [permissions.IsAdminUser]
+
+    def post(self, request):
+        try:
+            session = uploads.create_session(
+                request.user,
+                request.data.get('filename'),
+                int(request.data.get('size') or 0),
+                request.data,
+            )
+        except (uploads.UploadError, ValueError) as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(UploadSessionSerializer(session).data, status=status.HTTP_201_CREATED)
+
+class ChunkedUploadView(APIView):
+    """Inspect, send a chunk to, or abort a chunked upload (admin only)"""
+    permission_classes = [permissions.IsAdminUser]
+
+    def get_session(self, request, pk):
+        return get_object_or_404(UploadSession, pk=pk, user=request.user)
+
+    def get(self, request, pk):
+        return Response(UploadSessionSerializer(self.get_session(request, pk)).data)
+
+    def put(self, request, pk):
+        session = self.get_session(request, pk)
+        offset = request.query_params.get('offset', request.META.get('HTTP_UPLOAD_OFFSET'))
+        try:
+            session = uploads.write_chunk(
+                session,
+                int(offset),
+                request.stream,
+                int(request.META.get('CONTENT_LENGTH') or 0),
+                request.META.get('HTTP_X_CHUNK_SHA256'),
+            )
+        except (uploads.UploadError, TypeError, ValueError) as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(UploadSessionSerializer(session).data)
+
+    def delete(self, request, pk):
+        try:
+            uploads.abort(self.get_session(request, pk))
+        except uploads.UploadError as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+class ChunkedUploadFinalizeView(APIView):
+    """Assemble a chunked upload and create its Track (admin only)"""
+    permission_classes = [permissions.IsAdminUser]
+
+    def post(self, request, pk):
+        session = get_object_or_404(UploadSession, pk=pk, user=request.user)
+        try:
+            track, jobs = uploads.finalize(session)
+        except uploads.UploadError as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        data = TrackDetailSerializer(track).data
+        data['jobs'] = JobSerializer(jobs, many=True).data
+        return Response(data, status=status.HTTP_201_CREATED)
+
+class DirectUploadCreateView(APIView):
+    """Start a direct-to-S3 upload and hand out presigned part URLs (admin only)"""
+    permission_classes = [permissions.IsAdminUser]
+
+    def post(self, request):
+        try:
+            session = uploads.create_direct_session(
+                request.user,
+                request.data.get('filename'),
+                int(request.data.get('size') or 0),
+                int(request.data.get('part_size') or 0),
+                request.data.get('part_checksums'),
+                request.data,
+            )
+            urls = uploads.presign_parts(session)
+        except (uploads.UploadError, ValueError) as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        data = UploadSessionSerializer(session).data
+        data['urls'] = urls
+        return Response(data, status=status.HTTP_201_CREATED)
+
+class DirectUploadView(APIView):
+    """Resume (fresh URLs for missing parts) or abort a direct upload (admin only)"""
+    permission_classes = [permissions.IsAdminUser]
+
+    def get_session(self, request, pk):
+        return get_object_or_404(
+            UploadSession, pk=pk, user=request.user, backend=UploadSession.BACKEND_S3_DIRECT
+        )
+
+    def get(self, request, pk):
+        session = self.get_session(request, pk)
+        data = UploadSessionSerializer(session).data
+        if session.status == UploadSession.STATUS_ACTIVE:
+            try:
+                session = uploads.sync_direct_parts(session)
+            except uploads.UploadError as e:
+                return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+            data = UploadSessionSerializer(session).data
+            data['urls'] = uploads.presign_parts(session, session.missing_parts)
+        return Response(data)
+
+    def delete(self, request, pk):
+        try:
+            uploads.abort(self.get_session(request, pk))
+        except uploads.UploadError as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+class DirectUploadCompleteView(APIView):
+    """Verify the parts in S3, complete the upload and create its Track (admin only)"""
+    permission_classes = [permissions.IsAdminUser]
+
+    def post(self, request, pk):
+        session = get_object_or_404(
+            UploadSession, pk=pk, user=request.user, backend=UploadSession.BACKEND_S3_DIRECT
+        )
+        try:
+            if session.status == UploadSession.STATUS_ACTIVE:
+                session = uploads.sync_direct_parts(session, request.data.get('parts'))
+            track, jobs = uploads.finalize(session)
+        except uploads.UploadError as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        data = TrackDetailSerializer(track).data
+        data['jobs'] = JobSerializer(jobs, many=True).data
+        return Response(data, status=status.HTTP_201_CREATED)
+
 class ArtistCreateView(generics.CreateAPIView):
     """Create a new artist (admin only)"""
     queryset = Artist.objects.all()
     serializer_class = ArtistSerializer
     permission_classes = [permissions.IsAdminUser]
 
+    def perform_create(self, serializer):
+        queue_image_variants(serializer.save())
+
 class AlbumCreateView(generics.CreateAPIView):
     """Create a new album (admin only)"""
     queryset = Album.objects.all()
     serializer_class = AlbumSerializer
     permission_classes = [permissions.IsAdminUser]
 
+    def perform_create(self, serializer):
+        queue_image_variants(serializer.save())
+
 class TrackUpdateView(generics.UpdateAPIView):
     """Update a track (admin only)"""
     queryset = Track.objects.all()
@@ -340,24 +827,22 @@ class TrackUpdateView(generics.UpdateAPIView):
         
         # 1. Handle Artist Update
         # If artist name is changed, find or create the new artist.
+        resolver = CatalogResolver()
         if 'artist_name' in request.data:
-            artist, _ = Artist.objects.get_or_create(
-                name=request.data['artist_name'],
-                defaults={'bio': request.data.get('artist_bio', '')}
+            instance.artist = resolver.artist(
+                request.data['artist_name'], request.data.get('artist_bio', '')
             )
-            instance.artist = artist
         
         # 2. Handle Album Update
         # If album title is changed, find or create the new album.
         if 'album_title' in request.data:
-            album, created = Album.objects.get_or_create(
-                title=request.data['album_title'],
-                artist=instance.artist,
-                defaults={'release_date': request.data.get('release_date', '2024-01-01')}
+            album = resolver.album(
+                instance.artist, request.data['album_title'],
+                request.data.get('release_date', '2024-01-01'),
             )
             
-            # If album existed, update release_date if provided
-            if not created and 'release_date' in request.data:
+            # Update release_date if provided (a new album already has it)
+            if 'release_date' in request.data and str(album.release_date) != request.data['release_date']:
                 album.release_date = request.data['release_date']
                 album.save()
 
@@ -367,21 +852,28 @@ class TrackUpdateView(generics.UpdateAPIView):
             if 'album_cover' in request.FILES:
                 album.cover_image = request.FILES['album_cover']
                 album.save()
+                queue_image_variants(album)
         
         # 3. Update Track Fields
         # Update standard fields and files.
+        audio_info = None
         if 'title' in request.data:
             instance.title = request.data['title']
         if 'duration' in request.data:
             instance.duration = int(request.data['duration'])
         if 'file' in request.FILES:
             instance.file = request.FILES['file']
+            audio_info = getattr(request.FILES['file'], 'audio_info', None)
+            if audio_info:
+                instance.apply_audio_info(audio_info)
         if 'preview_file' in request.FILES:
             instance.preview_file = request.FILES['preview_file']
         if 'genre' in request.data:
-            instance.genre = request.data['genre']
+            instance.genre = resolver.genre(request.data['genre'])
         
         instance.save()
+        if 'file' in request.FILES and audio_info is None:
+            enqueue('probe_track', {'track_id': instance.pk})
         serializer = self.get_serializer(instance)
         return Response(serializer.data)
 
@@ -392,11 +884,59 @@ class TrackDeleteView(generics.DestroyAPIView):
     
     def destroy(self, request, *args, **kwargs):
         instance = self.get_object()
-        # Delete associated files
-        if instance.file:
-            instance.file.delete()
-        if instance.preview_file:
-            instance.preview_file.delete()
+        # Files are shared between identical uploads; music.blobs deletes
+        # them once no track references them any more
         self.perform_destroy(instance)
         return Response(status=status.HTTP_204_NO_CONTENT)
 
+
+class JobListView(generics.ListAPIView):
+    """List background jobs, optionally filtered by status, kind or track (admin only).
+
+    ``?track=`` also matches the cover jobs of the track's album.
+    """
+    serializer_class = JobSerializer
+    permission_classes = [permissions.IsAdminUser]
+
+    def get_queryset(self):
+        queryset = Job.objects.order_by('-created_at')
+
+        job_status = self.request.query_params.get('status', None)
+        if job_status:
+            queryset = queryset.filter(status=job_status)
+
+        kind = self.request.query_params.get('kind', None)
+        if kind:
+            queryset = queryset.filter(kind=kind)
+
+        track_id = self.request.query_params.get('track', None)
+        if track_id:
+            # The track's own jobs, plus those for its album's cover
+            track_jobs = Q(payload__track_id=int(track_id))
+            album_id = Track.objects.filter(pk=track_id).values_list('album_id', flat=True).first()
+            if album_id:
+                track_jobs |= Q(payload__album_id=album_id) | Q(
+                    kind='generate_image_variants', payload__model='album', payload__id=album_id,
+                )
+            queryset = queryset.filter(track_jobs)
+
+        return queryset[:100]
+
+    def list(self, request, *args, **kwargs):
+        track_id = request.query_params.get('track', None)
+        if track_id and not track_id.isdigit():
+            return Response({"error": "track must be a track id"}, status=status.HTTP_400_BAD_REQUEST)
+        return super().list(request, *args, **kwargs)
+
+class JobDetailView(generics.RetrieveAPIView):
+    """Poll the status of a background job (admin only)"""
+    queryset = Job.objects.all()
+    serializer_class = JobSerializer
+    permission_classes = [permissions.IsAdminUser]
+
+class MediaCacheStatsView(APIView):
+    """Hit ratio and disk usage of the S3 media cache (admin only)"""
+    permission_classes = [permissions.IsAdminUser]
+
+    def get(self, request):
+        return Response(cache_stats())
@@ -0,0 +1,135 @@
+"""Token authentication with a lookup cache and token expiry.
+
+DRF's ``TokenAuthentication`` queries the token and its user on every
+request. ``CachedTokenAuthentication`` keeps recent lookups in a bounded,
+per-process LRU for ``AUTH_TOKEN_CACHE_SECONDS``. Entries are dropped when a
+token is deleted or its user is saved or deleted. Other worker processes
+only notice such changes once their entry times out, so that timeout stays
+short.
+
+Tokens older than ``AUTH_TOKEN_TTL`` are rejected and deleted. Clients
+swap their token for a new one with ``rotate_token`` (``/api/auth/token/refresh/``)
+before it expires.
+"""
+from collections import OrderedDict
+import copy
+from datetime import timedelta
+import threading
+import time
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.utils import timezone
+from rest_framework import exceptions
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.authtoken.models import Token
+
+
+class TokenCache:
+    """Thread-safe LRU of token key -> Token (with its user), with a TTL"""
+
+    def __init__(self, max_size, ttl):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            token, stored_at = entry
+            if time.monotonic() - stored_at > self.ttl:
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return token
+
+    def set(self, key, token):
+        if self.max_size <= 0:
+            return
+        with self._lock:
+            self._entries[key] = (token, time.monotonic())
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def discard(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def discard_user(self, user_id):
+        with self._lock:
+            for key in [key for key, (token, _) in self._entries.items() if token.user_id == user_id]:
+                del self._entries[key]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+token_cache = TokenCache(settings.AUTH_TOKEN_CACHE_SIZE, settings.AUTH_TOKEN_CACHE_SECONDS)
+
+
+def token_expires_at(token):
+    """When the token stops being accepted, or None if tokens don't expire"""
+    if not settings.AUTH_TOKEN_TTL:
+        return None
+    return token.created + timedelta(seconds=settings.AUTH_TOKEN_TTL)
+
+
+def token_expired(token):
+    expires_at = token_expires_at(token)
+    return expires_at is not None and expires_at <= timezone.now()
+
+
+def rotate_token(user):
+    """Replace the user's token with a new one"""
+    Token.objects.filter(user=user).delete()
+    return Token.objects.create(user=user)
+
+
+def get_login_token(user):
+    """The user's current token, replaced first if it has expired"""
+    token, _ = Token.objects.get_or_create(user=user)
+    if token_expired(token):
+        token = rotate_token(user)
+    return token
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    def authenticate_credentials(self, key):
+        token = token_cache.get(key)
+        if token is None:
+            try:
+                token = Token.objects.select_related('user').get(key=key)
+            except Token.DoesNotExist:
+                raise exceptions.AuthenticationFailed('Invalid token.')
+            token_cache.set(key, token)
+
+        if token_expired(token):
+            token_cache.discard(key)
+            Token.objects.filter(key=key).delete()
+            raise exceptions.AuthenticationFailed('Token has expired.')
+        if not token.user.is_active:
+            raise exceptions.AuthenticationFailed('User inactive or deleted.')
+
+        # Each request gets its own copy, so nothing set on request.user
+        # leaks into other requests through the cache
+        token = copy.copy(token)
+        token.user = copy.copy(token.user)
+        return token.user, token
+
+
+@receiver(post_delete, sender=Token)
+def _discard_token(sender, instance, **kwargs):
+    token_cache.discard(instance.key)
+
+
+@receiver(post_save, sender=get_user_model())
+@receiver(post_delete, sender=get_user_model())
+def _discard_user(sender, instance, **kwargs):
+    token_cache.discard_user(instance.pk)
@@ -1,8 +1,14 @@
-from rest_framework import generics, permissions
+from rest_framework import generics, permissions, status
+from rest_framework.authtoken.views import ObtainAuthToken
 from rest_framework.response import Response
 from rest_framework.views import APIView
+from .authentication import get_login_token, rotate_token, token_expires_at
 from .serializers import UserSerializer, RegisterSerializer
 
+
+def _token_response(token):
+    return Response({'token': token.key, 'expires_at': token_expires_at(token)})
+
 class RegisterView(generics.CreateAPIView):
     serializer_class = RegisterSerializer
     permission_classes = [permissions.AllowAny]
@@ -13,3 +19,29 @@ class MeView(APIView):
     def get(self, request):
         serializer = UserSerializer(request.user)
         return Response(serializer.data)
+
+class LoginView(ObtainAuthToken):
+    """Exchange a username and password for an API token"""
+    # A stale token still stored by the client mustn't block logging in again
+    authentication_classes = []
+
+    def post(self, request, *args, **kwargs):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        return _token_response(get_login_token(serializer.validated_data['user']))
+
+class TokenRefreshView(APIView):
+    """Replace the current token with a new one, restarting its lifetime"""
+    permission_classes = [permissions.IsAuthenticated]
+
+    def post(self, request):
+        return _token_response(rotate_token(request.user))
+
+class LogoutView(APIView):
+    """Delete the current token"""
+    permission_classes = [permissions.IsAuthenticated]
+
+    def post(self, request):
+        if request.auth is not None:
+            request.auth.delete()
+        return Response(status=status.HTTP_204_NO_CONTENT)
@@ -9,9 +9,56 @@ const api = axios.create({
     baseURL: '/api', // 항상 /api로 시작
 });
 
-// 요청 인터셉터: 토큰이 있으면 헤더에 추가
+// 토큰 만료까지 이 시간보다 적게 남으면 새 토큰으로 교체
+const TOKEN_REFRESH_MARGIN_MS = 24 * 60 * 60 * 1000;
+
+export interface TokenResponse {
+    token: string;
+    expires_at: string | null;
+}
+
+// 로그인/토큰 갱신 응답을 저장
+export const storeToken = (data: TokenResponse) => {
+    localStorage.setItem('token', data.token);
+    if (data.expires_at) {
+        localStorage.setItem('tokenExpiresAt', data.expires_at);
+    } else {
+        localStorage.removeItem('tokenExpiresAt');
+    }
+};
+
+export const clearToken = () => {
+    localStorage.removeItem('token');
+    localStorage.removeItem('tokenExpiresAt');
+    localStorage.removeItem('userInfo');
+};
+
+// 동시에 여러 요청이 나가도 갱신은 한 번만
+let refreshing: Promise<void> | null = null;
+
+const refreshTokenIfExpiring = async (url?: string) => {
+    const expiresAt = localStorage.getItem('tokenExpiresAt');
+    if (!expiresAt || url?.startsWith('/auth/')) {
+        return;
+    }
+    if (Date.parse(expiresAt) - Date.now() > TOKEN_REFRESH_MARGIN_MS) {
+        return;
+    }
+    if (!refreshing) {
+        refreshing = api.post<TokenResponse>('/auth/token/refresh/')
+            .then((res) => storeToken(res.data))
+            .catch(() => undefined)
+            .finally(() => { refreshing = null; });
+    }
+    await refreshing;
+};
+
+// 요청 인터셉터: 토큰이 있으면 헤더에 추가 (만료가 가까우면 먼저 갱신)
 api.interceptors.request.use(
-    (config) => {
+    async (config) => {
+        if (localStorage.getItem('token')) {
+            await refreshTokenIfExpiring(config.url);
+        }
         const token = localStorage.getItem('token');
         if (token) {
             config.headers.Authorization = `Token ${token}`;
@@ -21,4 +68,15 @@ api.interceptors.request.use(
     (error) => Promise.reject(error)
 );
 
+// 응답 인터셉터: 만료되었거나 삭제된 토큰은 버림
+api.interceptors.response.use(
+    (response) => response,
+    (error) => {
+        if (error.response?.status === 401 && localStorage.getItem('token')) {
+            clearToken();
+        }
+        return Promise.reject(error);
+    }
+);
+
 export default api;
@@ -1,7 +1,7 @@
 import React, { useState, useEffect } from 'react';
 import { Link, useNavigate } from 'react-router-dom';
 import { Music, LogOut, User as UserIcon, Upload } from 'lucide-react';
-import api from '../api';
+import api, { clearToken } from '../api';
 
 const Navbar: React.FC = () => {
     const navigate = useNavigate();
@@ -40,8 +40,14 @@ const Navbar: React.FC = () => {
     }, [token]);
 
     // Handle user logout
-    const handleLogout = () => {
-        localStorage.removeItem('token');
+    const handleLogout = async () => {
+        try {
+            // Revoke the token on the server, not just in this browser
+            await api.post('/auth/logout/');
+        } catch (err) {
+            console.error('Failed to revoke token:', err);
+        }
+        clearToken();
         setIsAdmin(false);
         navigate('/login');
     };
@@ -9,6 +9,7 @@ interface Track {
     title: string;
     artist_name: string;
     album_cover: string | null;
+    album_cover_variants?: Record<string, string>;
     preview_file?: string | null;
     file?: string | null;
     duration: number;
@@ -32,13 +33,16 @@ const TrackCard: React.FC<TrackCardProps> = ({ track }) => {
         return `${API_BASE_URL}${path}`;
     };
 
+    // "url 200w, url 400w, ..." from the cover's resized variants
+    const coverSrcSet = Object.entries(track.album_cover_variants || {})
+        .map(([width, url]) => `${getImageUrl(url)} ${width}w`)
+        .join(', ');
+
     const getAudioUrl = (path: string | null) => {
         if (!path) return null;
-        if (path.startsWith('http')) {
-            // Add timestamp to prevent caching
-            return `${path}?t=${Date.now()}`;
-        }
-        return `${API_BASE_URL}${path}?t=${Date.now()}`;
+        // Media URLs are versioned by the API, so they can be cached as-is
+        if (path.startsWith('http')) return path;
+        return `${API_BASE_URL}${path}`;
     };
 
     useEffect(() => {
@@ -126,6 +130,9 @@ const TrackCard: React.FC<TrackCardProps> = ({ track }) => {
                 {!imgError && track.album_cover ? (
                     <img
                         src={getImageUrl(track.album_cover)!}
+                        srcSet={coverSrcSet || undefined}
+                        sizes="(min-width: 1024px) 20vw, (min-width: 640px) 33vw, 50vw"
+                        loading="lazy"
                         alt={track.title}
                         className="w-full h-full object-cover"
                         onError={() => setImgError(true)}
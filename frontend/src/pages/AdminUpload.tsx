@@ -3,6 +3,7 @@ import { useNavigate } from 'react-router-dom';
 import { motion } from 'framer-motion';
 import api from '../api';
 import { searchItunes } from '../utils/itunes';
+import { directUpload, DirectUploadUnavailable } from '../utils/directUpload';
 import { Upload, Music, User, Disc, Calendar, Clock, Sparkles } from 'lucide-react';
 
 const AdminUpload: React.FC = () => {
@@ -89,6 +90,26 @@ const AdminUpload: React.FC = () => {
         setLoading(true);
 
         try {
+            // Large files go straight to S3 when the backend supports it
+            if (files.file && !files.preview_file && !files.album_cover) {
+                try {
+                    await directUpload(files.file, {
+                        title: formData.title,
+                        artist_name: formData.artist_name,
+                        artist_bio: formData.artist_bio,
+                        album_title: formData.album_title,
+                        release_date: formData.release_date || '2024-01-01',
+                        duration: formData.duration.toString(),
+                        genre: formData.genre,
+                        album_cover_url: albumCoverUrl || '',
+                    });
+                    navigate('/admin/manage');
+                    return;
+                } catch (err) {
+                    if (!(err instanceof DirectUploadUnavailable)) throw err;
+                }
+            }
+
             const uploadData = new FormData();
             uploadData.append('title', formData.title);
             uploadData.append('artist_name', formData.artist_name);
@@ -12,7 +12,7 @@ interface Track {
     preview_file?: string | null;
     file?: string | null;
     duration: number;
-    genre?: string;
+    genre?: string | null;
 }
 
 const Home: React.FC = () => {
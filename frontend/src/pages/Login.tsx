@@ -1,7 +1,7 @@
 import React, { useState } from 'react';
 import { useNavigate, Link } from 'react-router-dom';
 import { Music } from 'lucide-react';
-import api from '../api';
+import api, { storeToken } from '../api';
 
 const Login: React.FC = () => {
     const [isLogin, setIsLogin] = useState(true);
@@ -17,7 +17,7 @@ const Login: React.FC = () => {
         try {
             if (isLogin) {
                 const res = await api.post('/auth/login/', { username, password });
-                localStorage.setItem('token', res.data.token);
+                storeToken(res.data);
 
                 // Fetch user info to cache admin status
                 try {
@@ -32,7 +32,7 @@ const Login: React.FC = () => {
                 await api.post('/auth/register/', { username, password, email });
                 // Auto login after successful registration
                 const loginRes = await api.post('/auth/login/', { username, password });
-                localStorage.setItem('token', loginRes.data.token);
+                storeToken(loginRes.data);
 
                 // Fetch user info
                 try {
@@ -94,9 +94,18 @@ const TrackDetail: React.FC = () => {
         playTrack(playerTrack);
     };
 
-    const handleDownload = async () => {
+    const handleDownload = () => {
         if (!track) return;
+        downloadFile(`/api/music/tracks/${id}/download/`, `${track.artist.name} - ${track.title}.mp3`);
+    };
+
+    // The whole album as one ZIP, streamed by the server
+    const handleAlbumDownload = () => {
+        if (!track) return;
+        downloadFile(`/api/music/albums/${track.album.id}/download/`, `${track.artist.name} - ${track.album.title}.zip`);
+    };
 
+    const downloadFile = async (downloadUrl: string, fallbackFilename: string) => {
         try {
             const token = localStorage.getItem('token');
             if (!token) {
@@ -104,8 +113,6 @@ const TrackDetail: React.FC = () => {
                 return;
             }
 
-            const downloadUrl = `/api/music/tracks/${id}/download/`;
-
             const response = await fetch(downloadUrl, {
                 headers: {
                     'Authorization': `Token ${token}`
@@ -128,7 +135,7 @@ const TrackDetail: React.FC = () => {
 
             // Try to extract filename from Content-Disposition header
             const contentDisposition = response.headers.get('Content-Disposition');
-            let filename = `${track.artist.name} - ${track.title}.mp3`; // Default fallback
+            let filename = fallbackFilename;
 
             if (contentDisposition) {
                 // Try to extract filename* (UTF-8) first
@@ -279,6 +286,14 @@ const TrackDetail: React.FC = () => {
                                 <Download size={24} />
                                 Download
                             </button>
+
+                            <button
+                                onClick={handleAlbumDownload}
+                                className="border-2 border-gray-500 text-white px-8 py-4 rounded-full font-bold text-lg flex items-center gap-3 hover:border-white hover:bg-white/10 transition"
+                            >
+                                <Download size={24} />
+                                Download Album
+                            </button>
                         </div>
 
                         <div className="mt-12 grid grid-cols-2 md:grid-cols-4 gap-6">
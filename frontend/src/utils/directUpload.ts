@@ -0,0 +1,91 @@
+import api from '../api';
+
+// Direct-to-S3 uploads: the browser PUTs the file in parts to presigned URLs,
+// so the bytes never pass through the Django server.
+const PART_SIZE = 8 * 1024 * 1024;
+const CONCURRENCY = 4;
+
+interface PartUrl {
+    part_number: number;
+    size: number;
+    url: string;
+    headers: Record<string, string>;
+}
+
+// Thrown when the backend can't do direct uploads (e.g. local storage)
+export class DirectUploadUnavailable extends Error {}
+
+const toHex = (buffer: ArrayBuffer) =>
+    Array.from(new Uint8Array(buffer)).map((b) => b.toString(16).padStart(2, '0')).join('');
+
+const partChecksums = async (file: File) => {
+    const checksums: string[] = [];
+    for (let start = 0; start < file.size; start += PART_SIZE) {
+        const chunk = await file.slice(start, start + PART_SIZE).arrayBuffer();
+        checksums.push(toHex(await crypto.subtle.digest('SHA-256', chunk)));
+    }
+    return checksums;
+};
+
+const uploadParts = async (file: File, urls: PartUrl[], onProgress?: (done: number, total: number) => void) => {
+    const etags: { part_number: number; etag: string }[] = [];
+    const queue = [...urls];
+    let done = 0;
+
+    const worker = async () => {
+        for (let part = queue.shift(); part; part = queue.shift()) {
+            const start = (part.part_number - 1) * PART_SIZE;
+            const response = await fetch(part.url, {
+                method: 'PUT',
+                headers: part.headers,
+                body: file.slice(start, start + part.size),
+            });
+            if (!response.ok) {
+                // Left for the resume pass below
+                console.warn(`Part ${part.part_number} failed: HTTP ${response.status}`);
+                continue;
+            }
+            // The bucket's CORS rules must expose ETag for this to be readable
+            etags.push({ part_number: part.part_number, etag: response.headers.get('ETag') || '' });
+            done += 1;
+            onProgress?.(done, urls.length);
+        }
+    };
+
+    await Promise.all(Array.from({ length: Math.min(CONCURRENCY, urls.length) }, worker));
+    return etags;
+};
+
+export const directUpload = async (
+    file: File,
+    metadata: Record<string, string>,
+    onProgress?: (done: number, total: number) => void,
+) => {
+    let session;
+    try {
+        const response = await api.post('/admin/direct-uploads/', {
+            ...metadata,
+            filename: file.name,
+            size: file.size,
+            part_size: PART_SIZE,
+            part_checksums: await partChecksums(file),
+        });
+        session = response.data;
+    } catch (err: any) {
+        if (err.response?.status === 400) {
+            throw new DirectUploadUnavailable(err.response.data?.error);
+        }
+        throw err;
+    }
+
+    let parts = await uploadParts(file, session.urls, onProgress);
+
+    // Retry any parts that didn't make it once, with fresh URLs
+    const resumed = await api.get(`/admin/direct-uploads/${session.id}/`);
+    if (resumed.data.urls?.length) {
+        parts = parts.concat(await uploadParts(file, resumed.data.urls, onProgress));
+    }
+
+    const response = await api.post(`/admin/direct-uploads/${session.id}/complete/`, { parts });
+    return response.data;
+};
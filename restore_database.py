@@ -6,6 +6,7 @@ import os
 import sys
 import django
 import re
+import struct
 
 # Setup Django
 sys.path.insert(0, '/app')
@@ -15,6 +16,7 @@ django.setup()
 import boto3
 from django.conf import settings
 from music.models import Artist, Album, Track
+from music.probe import ProbeError, probe_storage_file
 from datetime import datetime
 
 def parse_filename(filename):
@@ -147,24 +149,28 @@ def restore_tracks(dry_run=False):
                 track_basename = os.path.basename(track_file)
                 preview_file = preview_map.get(track_basename, None)
 
-                # Estimate duration (default 180 seconds)
-                duration = 180
-
                 # Create track - store relative path from media/
                 # S3 storage expects path relative to STORAGES location
                 file_path = track_file.replace('media/', '')
                 preview_path = preview_file.replace('media/', '') if preview_file else None
 
-                track = Track.objects.create(
+                track = Track(
                     title=title,
                     artist=artist,
                     album=album,
                     file=file_path,
                     preview_file=preview_path,
-                    duration=duration,
-                    genre='Unknown'
+                    duration=0
                 )
 
+                # Read the real duration from the file headers (ranged GETs).
+                # Tracks that fail here can be retried with `manage.py probe_tracks`.
+                try:
+                    track.apply_audio_info(probe_storage_file(file_path, track.file.storage))
+                except (ProbeError, struct.error, OSError) as e:
+                    print(f"   ⚠️  Could not probe duration: {e}")
+                track.save()
+
                 print(f"   ✅ Created track: {track.title}")
                 created_count += 1
             else: